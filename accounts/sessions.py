@@ -0,0 +1,30 @@
+# This file defines the session store used when Redis is configured (SESSION_ENGINE = 'accounts.sessions').
+# Logged-in sessions are read from the cache and also kept in the database, so a Redis eviction or restart
+# does not log anyone out. Anonymous sessions (and their session carts) live in the cache only, so
+# browsing and building a cart never write to the database.
+
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+class SessionStore(CachedDBStore):
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        if SESSION_KEY not in data:
+            # Anonymous: store it the way the cache-only backend does
+            if must_create:
+                if not self._cache.add(self.cache_key, data, self.get_expiry_age()):
+                    raise CreateError
+            else:
+                self._cache.set(self.cache_key, data, self.get_expiry_age())
+            return
+        try:
+            super().save(must_create)
+        except UpdateError:
+            # The session was anonymous until this login, so it has no database row yet. A session
+            # deleted in the meantime (a logout elsewhere) is gone from the cache too and stays deleted.
+            if self.cache_key not in self._cache:
+                raise
+            super().save(must_create=True)
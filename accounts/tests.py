@@ -1,3 +1,40 @@
-from django.test import TestCase
+# This file contains tests for the session store.
 
-# Create your tests here.
+from decimal import Decimal
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from catalog.models import MainCategory, Product, SubCategory
+from .models import User
+
+@override_settings(
+    SESSION_ENGINE='accounts.sessions',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'accounts-tests'}},
+)
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_only_logged_in_sessions_are_written_to_the_database(self):
+        category = MainCategory.objects.create(name='Furniture', slug='furniture', image='categories/furniture.jpg')
+        product = Product.objects.create(
+            name='Oak chair', slug='oak-chair', description='A solid oak chair.', price=Decimal('25.00'), stock=5,
+            subcategory=SubCategory.objects.create(main_category=category, name='Chairs', slug='chairs'),
+            image='products/oak-chair.jpg',
+        )
+        self.client.post(reverse('cart:add_to_cart', args=[product.id]))
+        self.client.post(reverse('cart:update_quantity', args=[product.id]), {'quantity': 3})
+        self.assertFalse(Session.objects.exists())
+
+        User.objects.create_user('shopper', 'shopper@example.com', 'correct-horse-battery')
+        response = self.client.post(
+            reverse('accounts:login'), {'username': 'shopper', 'password': 'correct-horse-battery'},
+        )
+        self.assertRedirects(response, reverse('accounts:dashboard'), fetch_redirect_response=False)
+        self.assertEqual(Session.objects.count(), 1)
+
+        # The database copy keeps the customer logged in when the cache loses the session
+        cache.clear()
+        response = self.client.get(reverse('accounts:dashboard'))
+        self.assertEqual(response.status_code, 200)
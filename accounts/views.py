@@ -49,7 +49,7 @@ def account_dashboard(request):
         return redirect('admin:index')
     
     # Get recent orders for the user
-    recent_orders = Order.objects.filter(user=request.user).order_by('-created_at')[:5]
+    recent_orders = Order.objects.history(request.user)[:5]
     
     # Get address information for the user
     addresses = Address.objects.filter(user=request.user)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
+
+    def ready(self):
+        # Import signals module to register the session cart merge on login
+        import cart.signals
@@ -1,66 +1,106 @@
-# This file manages the shopping cart functionality, including adding, removing, and iterating over products in the cart.
+# This file manages the session cart used by anonymous visitors, including adding, removing, and iterating over products in the cart.
+# The session stores only {product_id: quantity}; prices always come from the product so they are never stale.
+# It is merged into the database cart when the visitor logs in (see cart/signals.py).
 
+from decimal import Decimal
 from django.conf import settings
 from catalog.models import Product
 
+class SessionCartItem:
+    # Mirrors the parts of CartItem the cart templates use; the product id doubles as the item id
+    def __init__(self, product, quantity):
+        self.id = product.id
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def line_total(self):
+        return self.product.price * self.quantity
+
+    def get_cost(self):
+        return self.line_total
+
 class Cart:
     def __init__(self, request):
         self.session = request.session
-        # Initialize the cart in the session if it doesn't exist
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
-    
+        # Work on a copy so the session is only changed (and saved) through save()
+        self.cart = dict(self.session.get(settings.CART_SESSION_ID) or {})
+        self._items = None
+
     def add(self, product, quantity=1, override_quantity=False):
+        # Returns False (and changes nothing) if the new quantity would exceed the product's stock,
+        # like services.add_item does for the database cart
         product_id = str(product.id)
-        
-        # Add a new product to the cart if it doesn't exist
-        if product_id not in self.cart:
-            self.cart[product_id] = {'quantity': 0, 'price': str(product.price)}
-        
         # Set quantity based on whether we are overriding or adding to the existing quantity
-        if override_quantity:
-            self.cart[product_id]['quantity'] = quantity
-        else:
-            self.cart[product_id]['quantity'] += quantity
-        
+        if not override_quantity:
+            quantity += self.cart.get(product_id, 0)
+        if quantity > product.stock:
+            return False
+        self.cart[product_id] = quantity
         self.save()
-    
+        return True
+
     def save(self):
-        # Mark the session as modified to ensure changes are saved
-        self.session.modified = True
-    
-    def remove(self, product):
-        product_id = str(product.id)
+        # Store the updated copy, which also marks the session as modified
+        self.session[settings.CART_SESSION_ID] = self.cart
+        self._items = None
+
+    def remove(self, product_id):
         # Remove the product from the cart if it exists
-        if product_id in self.cart:
-            del self.cart[product_id]
+        if self.cart.pop(str(product_id), None) is not None:
             self.save()
-    
+
+    def quantity(self, product_id):
+        return self.cart.get(str(product_id), 0)
+
+    def apply_quantity_changes(self, changes):
+        # Session counterpart of services.apply_quantity_changes, keyed by product id (one stock query)
+        stock = dict(
+            Product.objects.filter(id__in=[product_id for product_id in changes if self.quantity(product_id)])
+            .values_list('id', 'stock')
+        )
+        rejected = {}
+        for product_id, quantity in changes.items():
+            if product_id not in stock:
+                rejected[product_id] = None
+            elif quantity <= 0:
+                self.cart.pop(str(product_id))
+            elif quantity > stock[product_id]:
+                rejected[product_id] = stock[product_id]
+            else:
+                self.cart[str(product_id)] = quantity
+        self.save()
+        return rejected
+
+    def quantities(self):
+        # {product id: quantity} for every product in the cart
+        return {int(product_id): quantity for product_id, quantity in self.cart.items()}
+
+    def items(self):
+        # Load every product in the cart with a single query; products deleted since are skipped
+        if self._items is None:
+            products = Product.objects.in_bulk([int(product_id) for product_id in self.cart])
+            self._items = [
+                SessionCartItem(products[int(product_id)], quantity)
+                for product_id, quantity in self.cart.items()
+                if int(product_id) in products
+            ]
+        return self._items
+
     def __iter__(self):
-        product_ids = self.cart.keys()
-        # Fetch products from the database that are in the cart
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-        
-        for product in products:
-            cart[str(product.id)]['product'] = product
-            
-        for item in cart.values():
-            item['price'] = float(item['price'])  # Convert price to float for calculations
-            item['total_price'] = item['price'] * item['quantity']  # Calculate total price for each item
-            yield item
-    
+        return iter(self.items())
+
     def __len__(self):
-        # Return the total number of items in the cart
-        return sum(item['quantity'] for item in self.cart.values())
-    
+        # Return the total number of items in the cart (no database access)
+        return sum(self.cart.values())
+
     def get_total_price(self):
         # Calculate the total price of all items in the cart
-        return sum(float(item['price']) * item['quantity'] for item in self.cart.values())
-    
+        return sum((item.get_cost() for item in self.items()), Decimal('0'))
+
     def clear(self):
         # Clear the cart from the session
-        del self.session[settings.CART_SESSION_ID]
-        self.save() 
\ No newline at end of file
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+        self.cart = {}
+        self._items = None
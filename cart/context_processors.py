@@ -1,14 +1,23 @@
 # This file contains context processors for the cart functionality.
 
+from functools import cache
 from .models import Cart
+from .cart import Cart as SessionCart
 
 def cart_counter(request):
     # Check if the user is authenticated and not an admin
     if request.user.is_authenticated and not request.user.is_staff:
-        # Retrieve or create a cart for the authenticated user
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        # Calculate the total item count in the cart
-        item_count = sum(item.quantity for item in cart.items.all())
+        # The counter is only read when a template actually renders cart_item_count
+        # (templates call callables), and at most once per request
+        @cache
+        def item_count():
+            if hasattr(request, '_cart_summary'):  # The cart page and checkout already loaded the cart
+                return request._cart_summary.item_count
+            count = Cart.objects.filter(user=request.user).values_list('item_count', flat=True).first()
+            return count or 0
         return {'cart_item_count': item_count}
-    # Return zero if the user is not authenticated or is an admin
-    return {'cart_item_count': 0} 
\ No newline at end of file
+    if not request.user.is_authenticated:
+        # Anonymous visitors' carts live in the session, so counting needs no query
+        return {'cart_item_count': len(SessionCart(request))}
+    # Return zero for admins
+    return {'cart_item_count': 0}
@@ -0,0 +1,90 @@
+import threading
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from cart import services
+from cart.models import Cart, CartItem
+from catalog.models import MainCategory, Product
+from catalog.management.seed import seed_products
+
+class Command(BaseCommand):
+    help = 'Add one product to one cart from many threads at once and check that no update is lost or oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Number of concurrent threads')
+        parser.add_argument('--adds', type=int, default=50, help='Add-to-cart calls per thread')
+        parser.add_argument('--stock', type=int, default=None,
+                            help='Product stock (default: enough for every add; lower it to test the stock bound)')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Use the old get_or_create + quantity += 1 + save() path for comparison')
+
+    def handle(self, *args, **options):
+        attempts = options['threads'] * options['adds']
+        stock = options['stock'] if options['stock'] is not None else attempts
+
+        # The threads need committed data, so the fixtures are created for real and deleted afterwards
+        user = get_user_model().objects.create_user(username='cart-stress', password=None)
+        main_category = None
+        try:
+            main_category, _ = seed_products(1, prefix='cart-stress')
+            product = Product.objects.get(subcategory__main_category=main_category)
+            product.stock = stock
+            product.save()
+            cart = services.get_cart(user)
+
+            add = self._legacy_add if options['legacy'] else services.add_item
+            results = {'added': 0, 'rejected': 0, 'errors': []}
+            lock = threading.Lock()
+            barrier = threading.Barrier(options['threads'])
+
+            def worker():
+                try:
+                    barrier.wait()  # Start every thread at the same moment to maximise contention
+                    for _ in range(options['adds']):
+                        try:
+                            added = add(cart, product.id)
+                        except Exception as e:
+                            with lock:
+                                results['errors'].append(str(e))
+                            continue
+                        with lock:
+                            results['added' if added else 'rejected'] += 1
+                finally:
+                    connection.close()  # Each thread has its own connection
+
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            quantity = CartItem.objects.filter(cart=cart, product=product).values_list('quantity', flat=True).first() or 0
+            item_count = Cart.objects.values_list('item_count', flat=True).get(pk=cart.pk)
+            expected = min(attempts, stock)
+            self.stdout.write(
+                f"{attempts} adds: {results['added']} accepted, {results['rejected']} rejected for stock, "
+                f"{len(results['errors'])} errors"
+            )
+            for error in sorted(set(results['errors']))[:5]:
+                self.stdout.write(f'  error: {error}')
+            self.stdout.write(f'Final quantity {quantity} (expected {expected}, stock {stock}), item_count {item_count}')
+
+            if quantity != results['added'] or quantity > stock or item_count != quantity:
+                raise CommandError(f"Lost or oversold updates: {results['added']} accepted but quantity is {quantity}")
+            if results['errors']:
+                raise CommandError(f"{len(results['errors'])} add-to-cart calls failed")
+            self.stdout.write(self.style.SUCCESS('No lost updates'))
+        finally:
+            user.delete()
+            if main_category is not None:
+                MainCategory.objects.filter(pk=main_category.pk).delete()
+
+    def _legacy_add(self, cart, product_id):
+        # The read-modify-write add_to_cart used before the cart services (kept only for comparison)
+        with transaction.atomic():
+            cart_item, created = CartItem.objects.get_or_create(cart=cart, product_id=product_id)
+            if not created:
+                cart_item.quantity += 1
+                cart_item.save()
+            cart.refresh_item_count()
+        return True
@@ -0,0 +1,59 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, Max, Min, OuterRef, Q
+from django.utils import timezone
+from cart.models import Cart, CartItem
+
+class Command(BaseCommand):
+    help = 'Delete empty and abandoned carts in small primary-key chunks, one short transaction per chunk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empty-hours', type=int, default=24,
+                            help='Delete carts without items that have not changed for this many hours')
+        parser.add_argument('--stale-days', type=int, default=90,
+                            help='Delete carts (with their items) that have not changed for this many days')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Primary-key range handled per transaction')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between chunks (throttling)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        has_items = Exists(CartItem.objects.filter(cart=OuterRef('pk')))
+        expired = (
+            Q(updated_at__lt=now - timedelta(days=options['stale_days']))
+            | Q(~has_items, updated_at__lt=now - timedelta(hours=options['empty_hours']))
+        )
+
+        bounds = Cart.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stdout.write('No carts')
+            return
+
+        chunk_size = options['chunk_size']
+        carts = items = chunks = 0
+        start = time.monotonic()
+        for low in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            with transaction.atomic():
+                # Carts being changed right now are locked by that request and simply skipped
+                chunk = Cart.objects.filter(expired, id__gte=low, id__lt=low + chunk_size)
+                if not options['dry_run']:
+                    chunk = chunk.select_for_update(skip_locked=True)
+                ids = list(chunk.values_list('id', flat=True))
+                if ids:
+                    if options['dry_run']:
+                        items += CartItem.objects.filter(cart_id__in=ids).count()
+                    else:
+                        items += CartItem.objects.filter(cart_id__in=ids).delete()[0]
+                        Cart.objects.filter(id__in=ids).delete()
+                    carts += len(ids)
+            chunks += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        action = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {carts} carts and {items} cart items '
+            f'({chunks} chunks of {chunk_size} ids in {time.monotonic() - start:.1f}s)'
+        ))
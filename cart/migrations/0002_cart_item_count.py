@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:21
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_item_counts(apps, schema_editor):
+    # Count the items of every existing cart in one UPDATE
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    total = (
+        CartItem.objects.filter(cart=OuterRef('pk'))
+        .order_by()
+        .values('cart')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    Cart.objects.update(item_count=Coalesce(Subquery(total), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_item_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:24
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    # Concurrent get_or_create calls could leave several lines for the same product;
+    # fold each group into its oldest line so the unique constraint can be added
+    CartItem = apps.get_model('cart', 'CartItem')
+    duplicates = (
+        CartItem.objects.order_by()
+        .values('cart_id', 'product_id')
+        .annotate(lines=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for group in duplicates:
+        CartItem.objects.filter(id=group['keep_id']).update(quantity=group['total'])
+        CartItem.objects.filter(cart_id=group['cart_id'], product_id=group['product_id']).exclude(
+            id=group['keep_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_cart_item_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='cart_item_unique_product'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_cartitem_unique_product'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated_at'], name='cart_cart_updated_idx'),
+        ),
+    ]
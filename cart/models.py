@@ -1,7 +1,11 @@
 # This file defines the Cart and CartItem models for managing user shopping carts and their contents.
 
+from decimal import Decimal
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from catalog.models import Product
 
 User = get_user_model()
@@ -10,13 +14,26 @@ class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)  # One cart per user
     created_at = models.DateTimeField(auto_now_add=True)  
     updated_at = models.DateTimeField(auto_now=True)
+    item_count = models.PositiveIntegerField(default=0, editable=False)  # Total quantity of all items, read by the cart badge
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='cart_cart_updated_idx'),  # Used by the sweep_carts command
+        ]
 
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    def refresh_item_count(self):
+        # Recount the item quantities in a single UPDATE; call after every change to the cart's items
+        Cart.objects.filter(pk=self.pk).update(item_count=item_count_subquery(), updated_at=timezone.now())
+
     def get_total_price(self):
-        # Calculate the total price of all items in the cart
-        return sum(item.get_cost() for item in self.items.all())
+        # Calculate the total price of all items in the cart with one aggregate query (exact Decimal)
+        total = self.items.aggregate(
+            total=Sum(F('quantity') * F('product__price'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        )['total']
+        return total or Decimal('0.00')
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -26,10 +43,26 @@ class CartItem(models.Model):
 
     class Meta:
         ordering = ['-added_at']  # Order items by the most recently added
+        constraints = [
+            # One line per product; the cart services upsert against this
+            models.UniqueConstraint(fields=['cart', 'product'], name='cart_item_unique_product'),
+        ]
 
     def __str__(self):
         return f"{self.quantity} of {self.product.name}"
 
     def get_cost(self):
         # Calculate the cost for this cart item based on product price and quantity
-        return self.product.price * self.quantity
\ No newline at end of file
+        return self.product.price * self.quantity
+
+
+def item_count_subquery():
+    # Sum of item quantities for the cart in the outer query (0 when it has no items)
+    total = (
+        CartItem.objects.filter(cart=OuterRef('pk'))
+        .order_by()
+        .values('cart')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return Coalesce(Subquery(total), 0)
@@ -0,0 +1,132 @@
+# This file contains the database cart mutations. Each one is a single conditional statement
+# (an upsert or a filtered UPDATE/DELETE) followed by the item counter refresh, all in one short
+# transaction, so double clicks and concurrent tabs can neither lose updates nor exceed stock.
+
+from django.db import connection, transaction
+from django.utils import timezone
+from catalog.models import Product
+from .models import Cart, CartItem
+
+# Adds `quantity` of a product, or increases the existing line, but only while the result stays
+# within the product's stock. Matches no row (and changes nothing) when the bound would be exceeded.
+# SQLite needs the WHERE clause on the SELECT to parse the ON CONFLICT clause.
+ADD_ITEM_SQL = """
+    INSERT INTO {item} (cart_id, product_id, quantity, added_at)
+    SELECT %s, {product}.id, %s, %s FROM {product} WHERE {product}.id = %s AND {product}.stock >= %s
+    ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {item}.quantity + EXCLUDED.quantity
+    WHERE {item}.quantity + EXCLUDED.quantity <= (
+        SELECT {product}.stock FROM {product} WHERE {product}.id = EXCLUDED.product_id
+    )
+"""
+
+# Adds several lines at once, summing quantities with any existing lines (used when merging carts).
+# Like ADD_ITEM_SQL the result never exceeds stock, but lines are capped at the stock instead of skipped.
+MERGE_ITEMS_SQL = """
+    INSERT INTO {item} (cart_id, product_id, quantity, added_at) VALUES {values}
+    ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {least}(
+        {item}.quantity + EXCLUDED.quantity,
+        (SELECT {product}.stock FROM {product} WHERE {product}.id = EXCLUDED.product_id)
+    )
+"""
+
+
+def _sql(template, **kwargs):
+    return template.format(item=CartItem._meta.db_table, product=Product._meta.db_table, **kwargs)
+
+
+def get_cart(user):
+    # The user's cart, created on first use
+    cart, created = Cart.objects.get_or_create(user=user)
+    return cart
+
+
+def add_item(cart, product_id, quantity=1):
+    # Add to the cart in one upsert; returns False if that would exceed the product's stock
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(_sql(ADD_ITEM_SQL), [cart.pk, quantity, timezone.now(), product_id, quantity])
+            added = cursor.rowcount > 0
+        if added:
+            cart.refresh_item_count()
+    return added
+
+
+def merge_items(cart, quantities):
+    # Add {product id: quantity} to the cart in one multi-row upsert, capping every line at the
+    # product's stock; unknown and sold-out products are skipped
+    stock = dict(Product.objects.filter(id__in=quantities, stock__gt=0).values_list('id', 'stock'))
+    if not stock:
+        return
+    now = timezone.now()
+    params = []
+    for product_id, available in stock.items():
+        params += [cart.pk, product_id, min(quantities[product_id], available), now]
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(stock))
+    least = 'LEAST' if connection.vendor == 'postgresql' else 'MIN'  # SQLite's two-argument MIN is LEAST
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(_sql(MERGE_ITEMS_SQL, values=values, least=least), params)
+        cart.refresh_item_count()
+
+
+def set_quantity(cart, item_id, quantity):
+    # Set a line's quantity if the stock allows it (checked in the UPDATE itself); 0 removes the line.
+    # Returns False if the line does not exist or has too little stock.
+    if quantity <= 0:
+        return remove_item(cart, item_id)
+    with transaction.atomic():
+        updated = (
+            CartItem.objects.filter(id=item_id, cart=cart, product__stock__gte=quantity)
+            .update(quantity=quantity)
+        )
+        if updated:
+            cart.refresh_item_count()
+    return updated > 0
+
+
+def apply_quantity_changes(cart, changes):
+    # Apply {item id: quantity} in one transaction: one locking query validates every change against
+    # stock, then a single bulk_update and a single delete. Returns {item id: available stock} for the
+    # rejected changes (None when the item is not in the cart).
+    rejected = {}
+    with transaction.atomic():
+        items = {
+            item.id: item
+            for item in CartItem.objects.select_for_update(of=('self',))
+            .filter(cart=cart, id__in=changes)
+            .select_related('product')
+            .only('quantity', 'product__stock')
+        }
+        updated, removed = [], []
+        for item_id, quantity in changes.items():
+            item = items.get(item_id)
+            if item is None:
+                rejected[item_id] = None
+            elif quantity <= 0:
+                removed.append(item_id)
+            elif quantity > item.product.stock:
+                rejected[item_id] = item.product.stock
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                updated.append(item)
+        if updated:
+            CartItem.objects.bulk_update(updated, ['quantity'])
+        if removed:
+            CartItem.objects.filter(cart=cart, id__in=removed).delete()
+        if updated or removed:
+            cart.refresh_item_count()
+    return rejected
+
+
+def remove_item(cart, item_id):
+    with transaction.atomic():
+        deleted, _ = CartItem.objects.filter(id=item_id, cart=cart).delete()
+        if deleted:
+            cart.refresh_item_count()
+    return deleted > 0
+
+
+def clear_cart(cart):
+    with transaction.atomic():
+        cart.items.all().delete()
+        cart.refresh_item_count()
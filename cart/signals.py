@@ -0,0 +1,17 @@
+# This file merges an anonymous visitor's session cart into their database cart when they log in.
+
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from .cart import Cart as SessionCart
+from . import services
+
+@receiver(user_logged_in)
+def merge_session_cart(sender, request, user, **kwargs):
+    if request is None or not hasattr(request, 'session'):
+        return
+    session_cart = SessionCart(request)
+    if not len(session_cart):
+        return
+    if not user.is_staff:  # Administrators cannot have carts, so their session cart is just dropped
+        services.merge_items(services.get_cart(user), session_cart.quantities())
+    session_cart.clear()
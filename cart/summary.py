@@ -0,0 +1,38 @@
+# This file builds the cart summary (lines, line totals, grand total and item count) shared by the
+# cart page, checkout and the cart badge. The database cart is loaded with one annotated query and
+# all money is summed in Decimal; the result is memoized on the request.
+
+from decimal import Decimal
+from django.db.models import DecimalField, ExpressionWrapper, F
+from .cart import Cart as SessionCart
+from .models import CartItem
+
+class CartSummary:
+    def __init__(self, lines):
+        self.lines = lines  # CartItem (or SessionCartItem) objects with product and line_total loaded
+        self.total_price = sum((line.line_total for line in lines), Decimal('0.00'))
+        self.item_count = sum(line.quantity for line in lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+def line_total_expression():
+    # quantity x unit price, computed by the database as an exact decimal
+    return ExpressionWrapper(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+def get_cart_summary(request):
+    # The current visitor's cart summary, computed at most once per request
+    if not hasattr(request, '_cart_summary'):
+        if request.user.is_authenticated:
+            lines = list(
+                CartItem.objects.filter(cart__user=request.user)
+                .select_related('product')
+                .annotate(line_total=line_total_expression())
+            )
+        else:
+            lines = SessionCart(request).items()
+        request._cart_summary = CartSummary(lines)
+    return request._cart_summary
@@ -1,3 +1,175 @@
-from django.test import TestCase
+# This file contains tests for the session and database carts.
 
-# Create your tests here.
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from catalog.models import MainCategory, Product, SubCategory
+from . import services
+from .models import Cart, CartItem
+
+def create_product(name, stock, price='10.00'):
+    subcategory = SubCategory.objects.first() or SubCategory.objects.create(
+        main_category=MainCategory.objects.create(name='Furniture', slug='furniture', image='categories/furniture.jpg'),
+        name='Chairs', slug='chairs',
+    )
+    slug = name.lower().replace(' ', '-')
+    return Product.objects.create(
+        name=name, slug=slug, subcategory=subcategory, description=name, price=Decimal(price), stock=stock,
+        image=f'products/{slug}.jpg',
+    )
+
+class SessionCartTests(TestCase):
+    def test_anonymous_adds_stop_at_the_stock(self):
+        product = create_product('Oak chair', stock=2)
+        url = reverse('cart:add_to_cart', args=[product.id])
+        for _ in range(3):
+            self.client.post(url)
+        self.assertEqual(self.client.session[settings.CART_SESSION_ID], {str(product.id): 2})
+
+    def test_anonymous_quantity_updates(self):
+        product = create_product('Oak chair', stock=5)
+        self.client.post(reverse('cart:add_to_cart', args=[product.id]))
+        url = reverse('cart:update_quantity', args=[product.id])
+
+        self.assertEqual(self.client.post(url, {'quantity': 5}).json()['status'], 'success')
+        self.assertEqual(self.client.session[settings.CART_SESSION_ID], {str(product.id): 5})
+
+        response = self.client.post(url, {'quantity': 6}).json()
+        self.assertEqual((response['status'], response['available_stock']), ('error', 5))
+        self.assertEqual(self.client.session[settings.CART_SESSION_ID], {str(product.id): 5})
+
+        self.assertEqual(self.client.post(url, {'quantity': 0}).json()['status'], 'success')
+        self.assertEqual(self.client.session[settings.CART_SESSION_ID], {})
+
+class BatchUpdateTests(TestCase):
+    def post_changes(self, changes):
+        return self.client.post(reverse('cart:update_quantities'), {'changes': changes}, content_type='application/json')
+
+    def test_batch_over_the_limit_is_rejected_whole(self):
+        product = create_product('Oak chair', stock=5)
+        self.client.post(reverse('cart:add_to_cart', args=[product.id]))
+        changes = [{'item_id': product.id, 'quantity': 3}] + [{'item_id': 10_000 + n, 'quantity': 1} for n in range(100)]
+
+        response = self.post_changes(changes)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.session[settings.CART_SESSION_ID], {str(product.id): 1})
+
+        response = self.post_changes(changes[:1])
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertEqual(self.client.session[settings.CART_SESSION_ID], {str(product.id): 3})
+
+class MergeItemsTests(TestCase):
+    def test_merged_lines_are_capped_at_the_stock(self):
+        chair, table, sold_out = create_product('Oak chair', 3), create_product('Oak table', 5), create_product('Oak bed', 0)
+        user = User.objects.create_user('shopper', 'shopper@example.com', 'password')
+        cart = services.get_cart(user)
+        services.add_item(cart, chair.id, 2)
+
+        services.merge_items(cart, {chair.id: 2, table.id: 9, sold_out.id: 1})
+        quantities = dict(cart.items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {chair.id: 3, table.id: 5})
+        cart.refresh_from_db()
+        self.assertEqual(cart.item_count, 8)
+
+class SweepCartsTests(TestCase):
+    def setUp(self):
+        product = create_product('Oak chair', stock=10)
+        now = timezone.now()
+        self.carts = {}
+        # name: (age, has items)
+        for name, age, has_items in [
+            ('recent_empty', timedelta(hours=1), False),
+            ('old_empty', timedelta(hours=30), False),
+            ('recent_full', timedelta(days=10), True),
+            ('stale_full', timedelta(days=100), True),
+        ]:
+            cart = services.get_cart(User.objects.create_user(name, f'{name}@example.com', 'password'))
+            if has_items:
+                services.add_item(cart, product.id, 2)
+            Cart.objects.filter(pk=cart.pk).update(updated_at=now - age)
+            self.carts[name] = cart.pk
+
+    def sweep(self, *args):
+        out = StringIO()
+        call_command('sweep_carts', '--chunk-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_empty_and_stale_carts_are_deleted(self):
+        self.assertIn('Deleted 2 carts and 1 cart items', self.sweep())
+        remaining = set(Cart.objects.values_list('pk', flat=True))
+        self.assertEqual(remaining, {self.carts['recent_empty'], self.carts['recent_full']})
+        self.assertEqual(list(CartItem.objects.values_list('cart_id', flat=True)), [self.carts['recent_full']])
+
+    def test_thresholds_and_dry_run(self):
+        self.assertIn('Would delete 3 carts and 2 cart items', self.sweep('--stale-days', '7', '--dry-run'))
+        self.assertEqual(Cart.objects.count(), 4)
+        self.sweep('--empty-hours', '48')
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {
+            self.carts['recent_empty'], self.carts['old_empty'], self.carts['recent_full'],
+        })
+
+class ConcurrentAddTests(TransactionTestCase):
+    # Many threads adding the same product to one cart, each on its own connection
+    THREADS = 8
+    ADDS = 10
+
+    def run_adds(self, stock):
+        product = create_product('Oak chair', stock)
+        cart = services.get_cart(User.objects.create_user('shopper', 'shopper@example.com', 'password'))
+        results = {'added': 0, 'rejected': 0}
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            try:
+                barrier.wait()  # Start every thread at the same moment to maximise contention
+                for _ in range(self.ADDS):
+                    added = self.add(cart, product.id)
+                    with lock:
+                        results['added' if added else 'rejected'] += 1
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        lines = list(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+        self.assertEqual(len(lines), 1, 'duplicate cart lines')
+        quantity = lines[0][1]
+        self.assertEqual(quantity, results['added'], 'lost updates')
+        self.assertEqual(quantity, min(stock, self.THREADS * self.ADDS))
+        self.assertEqual(Cart.objects.values_list('item_count', flat=True).get(pk=cart.pk), quantity)
+
+    def add(self, cart, product_id):
+        # SQLite has no row locks and fails a writer that finds the database locked, so retry there
+        # (PostgreSQL serializes the upserts itself)
+        for attempt in range(100):
+            try:
+                return services.add_item(cart, product_id)
+            except OperationalError as e:
+                if connection.vendor != 'sqlite' or 'locked' not in str(e):
+                    raise
+                time.sleep(0.01)
+        raise AssertionError('database stayed locked')
+
+    def test_no_lost_updates(self):
+        self.run_adds(stock=self.THREADS * self.ADDS)
+
+    def test_never_above_stock(self):
+        self.run_adds(stock=25)
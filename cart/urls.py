@@ -10,5 +10,6 @@ urlpatterns = [
     path('add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),  # Adds a specified product to the cart.
     path('remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),  # Removes an item from the cart by its ID.
     path('update/<int:item_id>/', views.update_quantity, name='update_quantity'),  # Updates the quantity of a specific item in the cart.
+    path('update/', views.update_quantities, name='update_quantities'),  # Applies a batch of quantity changes (JSON).
     path('clear/', views.clear_cart, name='clear_cart'),  # Empties the entire shopping cart.
 ]
\ No newline at end of file
@@ -1,84 +1,161 @@
 # This file handles the views related to the shopping cart functionality, including adding, removing, and updating items.
+# Logged-in customers use the database cart; anonymous visitors use the session cart, which never writes to the database.
 
+import json
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from .models import Cart, CartItem
+from .cart import Cart as SessionCart
+from . import services
+from .summary import get_cart_summary
 from catalog.models import Product
 
-@login_required
 def cart_detail(request):
-    # Retrieve or create a cart for the logged-in user
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    # Fetch all items in the cart with related product information
-    cart_items = cart.items.select_related('product').all()
-    return render(request, 'cart/cart_detail.html', {'cart': cart, 'cart_items': cart_items})
+    # Lines, line totals and the grand total come from one query (session carts: one product query).
+    # The database cart is only created once something is added.
+    summary = get_cart_summary(request)
+    return render(request, 'cart/cart_detail.html', {'cart_summary': summary, 'cart_items': summary.lines})
 
-@login_required
 def add_to_cart(request, product_id):
+    product = get_object_or_404(Product.objects.only('id', 'name', 'slug', 'stock'), id=product_id)
     if request.method != 'POST':
-        return redirect('catalog:product_detail', pk=product_id)
-    
-    if not request.user.is_authenticated:
-        messages.warning(request, 'Please login to add items to cart.')
-        return redirect('accounts:login')
-        
+        return redirect('catalog:product_detail', product_slug=product.slug)
+
     if request.user.is_staff:  # Prevent admin users from adding items to the cart
         messages.error(request, 'Administrators cannot add items to cart.')
-        return redirect('catalog:product_detail', pk=product_id)
-            
-    product = get_object_or_404(Product, id=product_id)
+        return redirect('catalog:product_detail', product_slug=product.slug)
+
     if product.stock <= 0:  # Check if the product is in stock
         messages.error(request, 'Sorry, this product is out of stock.')
-        return redirect('catalog:product_detail', pk=product_id)
-        
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-    )
-    if not created:  # If the item already exists, increase its quantity
-        cart_item.quantity += 1
-        cart_item.save()
+        return redirect('catalog:product_detail', product_slug=product.slug)
+
+    if not request.user.is_authenticated:
+        # Anonymous visitors build their cart in the session
+        added = SessionCart(request).add(product)
+    else:
+        # Insert the line or increase its quantity in one statement that also enforces the stock limit
+        added = services.add_item(services.get_cart(request.user), product.id)
+    if not added:
+        messages.error(request, f'Sorry, only {product.stock} units of {product.name} are available.')
+        return redirect('cart:cart_detail')
     messages.success(request, f'{product.name} added to cart.')
     return redirect('cart:cart_detail')
 
-@login_required
+def get_user_cart(request):
+    # The logged-in user's cart, or 404 if they have never added anything
+    return get_object_or_404(Cart.objects.only('id'), user=request.user)
+
 def remove_from_cart(request, item_id):
+    if not request.user.is_authenticated:
+        # Session cart items are identified by their product id
+        SessionCart(request).remove(item_id)
+        messages.success(request, 'Item removed from cart.')
+        return redirect('cart:cart_detail')
+
     # Remove the specified item from the user's cart
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    cart_item.delete()
+    if not services.remove_item(get_user_cart(request), item_id):
+        raise Http404('Item not in cart')
     messages.success(request, 'Item removed from cart.')
     return redirect('cart:cart_detail')
 
-@login_required
 def update_quantity(request, item_id):
     if request.method == 'POST':
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
         quantity = int(request.POST.get('quantity', 1))
-        
-        # Validate the requested quantity against available stock
-        if quantity > cart_item.product.stock:
+        if not request.user.is_authenticated:
+            return update_session_quantity(request, item_id, quantity)
+
+        cart = get_user_cart(request)
+        # Update quantity (only if the stock allows it) or delete the item if quantity is zero
+        if services.set_quantity(cart, item_id, quantity):
+            return JsonResponse({'status': 'success'})
+
+        # Nothing changed: either the item is not in this cart or there is not enough stock
+        stock = CartItem.objects.filter(id=item_id, cart=cart).values_list('product__stock', flat=True).first()
+        if stock is None:
+            raise Http404('Item not in cart')
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Only {stock} items available in stock',
+            'available_stock': stock
+        })
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+
+def update_session_quantity(request, product_id, quantity):
+    # Same rules as the database cart, applied to the session cart
+    cart = SessionCart(request)
+    if not cart.quantity(product_id):
+        raise Http404('Item not in cart')
+    if quantity <= 0:
+        cart.remove(product_id)
+        return JsonResponse({'status': 'success'})
+    product = Product.objects.only('id', 'stock').filter(id=product_id).first()
+    # Cart.add checks the quantity against the loaded stock and changes nothing if it is too high
+    if product is None or not cart.add(product, quantity, override_quantity=True):
+        stock = product.stock if product else 0
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Only {stock} items available in stock',
+            'available_stock': stock
+        })
+    return JsonResponse({'status': 'success'})
+
+MAX_BATCH_CHANGES = 100
+
+@require_POST
+def update_quantities(request):
+    # Apply several quantity changes at once. Body: {"changes": [{"item_id": 1, "quantity": 2}, ...]}
+    # (session cart items use the product id as item_id). Quantity 0 removes the line.
+    try:
+        changes = json.loads(request.body)['changes']
+        if len(changes) > MAX_BATCH_CHANGES:
             return JsonResponse({
                 'status': 'error',
-                'message': f'Only {cart_item.product.stock} items available in stock',
-                'available_stock': cart_item.product.stock
-            })
-            
-        if quantity > 0:  # Update quantity or delete item if quantity is zero
-            cart_item.quantity = quantity
-            cart_item.save()
-        else:
-            cart_item.delete()
-        return JsonResponse({'status': 'success'})
-    return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+                'message': f'At most {MAX_BATCH_CHANGES} changes can be applied at once; nothing was changed',
+            }, status=400)
+        changes = {int(change['item_id']): int(change['quantity']) for change in changes}
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid request body'}, status=400)
+
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).only('id').first()
+        rejected = services.apply_quantity_changes(cart, changes) if cart else dict.fromkeys(changes)
+    else:
+        rejected = SessionCart(request).apply_quantity_changes(changes)
+
+    # Respond with the updated cart so the page can refresh every line without reloading
+    summary = get_cart_summary(request)
+    return JsonResponse({
+        'status': 'error' if rejected else 'success',
+        'lines': [
+            {
+                'item_id': line.id,
+                'quantity': line.quantity,
+                'line_total': f'{line.line_total:.2f}',
+                'available_stock': line.product.stock,
+            }
+            for line in summary
+        ],
+        'rejected': [
+            {
+                'item_id': item_id,
+                'available_stock': stock,
+                'message': 'Item not in cart' if stock is None else f'Only {stock} items available in stock',
+            }
+            for item_id, stock in rejected.items()
+        ],
+        'summary': {'total_price': f'{summary.total_price:.2f}', 'item_count': summary.item_count},
+    })
 
-@login_required
 def clear_cart(request):
     if request.method == 'POST':
         # Clear all items from the user's cart
-        cart = Cart.objects.get(user=request.user)
-        cart.items.all().delete()
+        if not request.user.is_authenticated:
+            SessionCart(request).clear()
+        else:
+            cart = Cart.objects.filter(user=request.user).only('id').first()
+            if cart:
+                services.clear_cart(cart)
         messages.success(request, 'Cart cleared successfully.')
     return redirect('cart:cart_detail')
@@ -2,10 +2,18 @@
 
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import MainCategory, SubCategory, Product
+from django.contrib.admin.views.main import ChangeList
+from .models import MainCategory, SubCategory, Product, LIST_DEFERRED_FIELDS
+from .images import THUMBNAIL_WIDTH, has_variants, variant_url
 from accounts.models import User
 from django.db import models
 
+def admin_thumbnail_url(image):
+    # Serve the smallest generated variant for changelist previews instead of the full upload
+    if has_variants(image):
+        return variant_url(image.name, THUMBNAIL_WIDTH)
+    return image.url
+
 class SubCategoryInline(admin.TabularInline):
     model = SubCategory
     prepopulated_fields = {'slug': ('name',)}  # Automatically generate slug from name
@@ -68,7 +76,7 @@ class MainCategoryAdmin(admin.ModelAdmin):
     def display_image(self, obj):
         # Display the category image in the admin interface
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" />', obj.image.url)
+            return format_html('<img src="{}" width="50" height="50" />', admin_thumbnail_url(obj.image))
         return "No Image"
     display_image.short_description = 'Category Image'
     
@@ -102,6 +110,11 @@ class MainCategoryAdmin(admin.ModelAdmin):
             return False
         return request.user.is_superuser or request.user.role == User.ADMIN
 
+class ProductChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        # The changelist columns never show the long text fields, so don't fetch them
+        return super().get_queryset(request, exclude_parameters).defer(*LIST_DEFERRED_FIELDS)
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'subcategory', 'price', 'stock', 'is_low_stock', 'featured', 'display_image')  # Columns to display
@@ -112,6 +125,7 @@ class ProductAdmin(admin.ModelAdmin):
         'featured',  # Filter by featured status
         LowStockFilter,  # Custom low stock filter
     )
+    list_select_related = ('subcategory__main_category',)  # Subcategory column shows the main category name
     list_editable = ('featured',)  # Fields that can be edited directly in the list view
     search_fields = ('name', 'description')  # Fields to search in the admin
     prepopulated_fields = {'slug': ('name',)}  # Automatically generate slug from name
@@ -130,7 +144,7 @@ class ProductAdmin(admin.ModelAdmin):
     def display_image(self, obj):
         # Display the product image in the admin interface
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" />', obj.image.url)
+            return format_html('<img src="{}" width="50" height="50" />', admin_thumbnail_url(obj.image))
         return "No Image"
     display_image.short_description = 'Product Image'
     
@@ -170,6 +184,10 @@ class ProductAdmin(admin.ModelAdmin):
             return False
         return request.user.is_superuser or request.user.role == User.ADMIN
 
+    def get_changelist(self, request, **kwargs):
+        # Use a changelist that defers large text columns
+        return ProductChangeList
+
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         # Customize the queryset for the subcategory foreign key field
         if db_field.name == "subcategory":
@@ -0,0 +1,61 @@
+# This file renders product cards for listing pages through a versioned fragment cache.
+# A card's key contains the product id and updated_at, so saving a product (which bumps
+# updated_at) makes its old card unreachable without any explicit invalidation.
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = 'catalog/includes/product_card.html'
+CARD_TEMPLATE_VERSION = 3  # Bump whenever product_card.html changes so stale fragments are ignored
+CARD_KEY = 'catalog:card:v{template_version}:{image_class}:{id}:{updated}'
+CARD_TIMEOUT = 60 * 60 * 24
+HITS_KEY = 'catalog:card:hits'
+MISSES_KEY = 'catalog:card:misses'
+
+
+def _card_key(product, image_class):
+    return CARD_KEY.format(
+        template_version=CARD_TEMPLATE_VERSION,
+        image_class=image_class,
+        id=product.pk,
+        updated=product.updated_at.timestamp(),
+    )
+
+
+def _count(key, amount):
+    # Shared counters so hits/misses can be scraped across all workers
+    if amount:
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, None)  # The counter was evicted between add() and incr()
+
+
+def render_product_cards(products, image_class='product-image'):
+    # Return the rendered card HTML for each product, fetching every cached card with one get_many
+    products = list(products)
+    keys = [_card_key(product, image_class) for product in products]
+    cached = cache.get_many(keys)
+
+    cards = []
+    rendered = {}
+    for product, key in zip(products, keys):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string(CARD_TEMPLATE, {'product': product, 'image_class': image_class})
+            rendered[key] = html
+        cards.append(mark_safe(html))
+
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+    _count(HITS_KEY, len(products) - len(rendered))
+    _count(MISSES_KEY, len(rendered))
+    return cards
+
+
+def get_card_cache_stats():
+    # Current hit/miss totals for the product card cache
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': stats.get(HITS_KEY, 0), 'misses': stats.get(MISSES_KEY, 0)}
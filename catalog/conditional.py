@@ -0,0 +1,42 @@
+# This file adds conditional GET support (ETag) to catalog pages, so repeat visitors and crawlers
+# get a 304 without the page being rendered again. No Last-Modified is sent: no single timestamp
+# covers deleted products or category renames, which the ETags include.
+# Pages are only validated for anonymous visitors with an empty session cart: other pages show
+# per-visitor content (cart badge, account menu) that the validators below do not cover.
+
+import hashlib
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+
+PAGE_VERSION = 1  # Bump when catalog page templates change so old validators stop matching
+
+
+def can_validate(request):
+    # Only anonymous GET/HEAD requests without a cart or pending flash messages can be answered with a 304
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    if request.session.get(settings.CART_SESSION_ID):
+        return False
+    return len(messages.get_messages(request)) == 0
+
+
+def make_etag(request, *parts):
+    # Build a strong ETag from the page identity and the given content version parts
+    key = ':'.join(str(part) for part in (PAGE_VERSION, request.get_full_path(), *parts))
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+
+def not_modified_response(request, etag):
+    # Return a 304 response if the client's copy is current, otherwise None
+    return get_conditional_response(request, etag=etag)
+
+
+def set_etag(response, etag):
+    # Attach the ETag and ask caches to revalidate before reusing the page
+    if response.status_code == 200:
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+    return response
@@ -0,0 +1,103 @@
+# This file computes faceted navigation counts (per subcategory, per main category and per price band)
+# for a filtered product queryset using a single grouped aggregate query. The same query also
+# yields the newest updated_at of the result set, which listing pages use as their validator.
+
+import hashlib
+import json
+from decimal import Decimal
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Max, Value, When
+from .taxonomy import get_category_tree, get_taxonomy_version
+
+# Price bands shown to shoppers as (min, max); the last band has no upper bound
+PRICE_BUCKETS = [
+    (Decimal('0'), Decimal('50')),
+    (Decimal('50'), Decimal('100')),
+    (Decimal('100'), Decimal('250')),
+    (Decimal('250'), Decimal('500')),
+    (Decimal('500'), Decimal('1000')),
+    (Decimal('1000'), None),
+]
+PRICE_STEP = Decimal('0.01')  # Smallest price difference (prices have two decimal places)
+FACETS_KEY = 'catalog:facets:{version}:{digest}'
+FACETS_TIMEOUT = 60 * 10
+
+
+def _price_bucket_expression():
+    # CASE expression mapping each product price to the index of its price band
+    whens = [
+        When(price__gte=low, price__lt=high, then=Value(index))
+        for index, (low, high) in enumerate(PRICE_BUCKETS) if high is not None
+    ]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1), output_field=IntegerField())
+
+
+def price_bucket_filters(bucket):
+    # (min_price, max_price) listing filters selecting exactly the products counted in a price band.
+    # Bands exclude their upper bound while the listing's max_price is inclusive, so stop one penny short.
+    high = bucket['max']
+    return bucket['min'], str(Decimal(high) - PRICE_STEP) if high is not None else None
+
+
+def compute_facets(queryset):
+    # One GROUP BY (subcategory, price band) query; every other count is derived from its rows
+    rows = (
+        queryset.order_by()
+        .values('subcategory_id', price_bucket=_price_bucket_expression())
+        .annotate(count=Count('id'), last_modified=Max('updated_at'))
+    )
+
+    subcategory_counts = {}
+    bucket_counts = [0] * len(PRICE_BUCKETS)
+    last_modified = None
+    for row in rows:
+        if last_modified is None or row['last_modified'] > last_modified:
+            last_modified = row['last_modified']
+        subcategory_counts[row['subcategory_id']] = subcategory_counts.get(row['subcategory_id'], 0) + row['count']
+        bucket_counts[row['price_bucket']] += row['count']
+
+    categories = []
+    for category in get_category_tree():
+        subcategories = [
+            {'slug': subcategory.slug, 'name': subcategory.name, 'count': subcategory_counts.get(subcategory.id, 0)}
+            for subcategory in category.subcategory_list
+        ]
+        categories.append({
+            'slug': category.slug,
+            'name': category.name,
+            'count': sum(subcategory['count'] for subcategory in subcategories),
+            'subcategories': subcategories,
+        })
+
+    return {
+        'total': sum(bucket_counts),
+        'last_modified': last_modified,  # Newest updated_at in the result set (part of the listing ETag)
+        'categories': categories,
+        'price_buckets': [
+            {'min': str(low), 'max': str(high) if high is not None else None, 'count': count}
+            for (low, high), count in zip(PRICE_BUCKETS, bucket_counts)
+        ],
+    }
+
+
+def normalize_filters(filters):
+    # Canonical form of the listing filters so equivalent requests share a cache entry
+    normalized = {}
+    for name, value in filters.items():
+        if value in (None, ''):
+            continue
+        value = ' '.join(str(value).lower().split())
+        normalized[name] = value
+    return normalized
+
+
+def get_facets(queryset, filters):
+    # Facet counts for the filtered queryset, cached per normalized filter set and catalog version.
+    # The taxonomy version changes on every product/category change, which also invalidates facets.
+    digest = hashlib.sha1(json.dumps(normalize_filters(filters), sort_keys=True).encode()).hexdigest()
+    key = FACETS_KEY.format(version=get_taxonomy_version(), digest=digest)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, FACETS_TIMEOUT)
+    return facets
@@ -0,0 +1,112 @@
+# This file generates resized image variants (AVIF/WebP/JPEG at fixed widths) for product and
+# category images, so listing pages can serve an appropriately sized file through srcset.
+# Variants live next to the original under a `variants/` folder, e.g.
+# products/sofa.jpg -> products/variants/sofa-320w.webp
+#
+# Encoding takes seconds per image, so it never runs inside a request: a record whose image differs
+# from its image_variants field is pending, and the generate_image_variants --pending worker encodes
+# those and marks them ready. Until then pages serve the original file.
+
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+from .models import MainCategory, Product
+from .taxonomy import invalidate_category_tree
+
+VARIANT_WIDTHS = (160, 320, 640, 960, 1280)
+DEFAULT_WIDTH = 640  # Used for the plain src fallback
+THUMBNAIL_WIDTH = 160  # Used for admin changelist previews
+VARIANT_DIR = 'variants'
+
+# (extension, Pillow format, MIME type, save options), best compression first
+_FORMATS = [
+    ('avif', 'AVIF', 'image/avif', {'quality': 60}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+]
+# Only produce formats this Pillow build can encode (JPEG is always available)
+VARIANT_FORMATS = [fmt for fmt in _FORMATS if fmt[0] == 'jpg' or features.check(fmt[0])]
+
+
+def variant_name(name, width, extension):
+    # Storage path of one variant of the image stored at `name`
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return f'{directory}/{VARIANT_DIR}/{stem}-{width}w.{extension}'
+
+
+def variant_url(name, width, extension='jpg'):
+    return default_storage.url(variant_name(name, width, extension))
+
+
+def srcset(name, extension):
+    # srcset attribute value listing every width of one format
+    return ', '.join(f'{variant_url(name, width, extension)} {width}w' for width in VARIANT_WIDTHS)
+
+
+def has_variants(image):
+    # Read from the record itself (no storage round trip); image is a model's ImageField value
+    return bool(image) and getattr(image.instance, 'image_variants', '') == image.name
+
+
+def pending_images():
+    # Names of product and category images whose variants have not been generated yet
+    names = set()
+    for model in (Product, MainCategory):
+        names.update(model.objects.exclude(image='').exclude(image_variants=F('image')).values_list('image', flat=True))
+    return sorted(names)
+
+
+def mark_variants_ready(name):
+    # Point every record using this image at its variants. Products get a new updated_at so cached
+    # cards and page validators change; the taxonomy version covers facets and category pages.
+    updated = Product.objects.filter(image=name).exclude(image_variants=name).update(
+        image_variants=name, updated_at=timezone.now()
+    )
+    updated += MainCategory.objects.filter(image=name).exclude(image_variants=name).update(image_variants=name)
+    if updated:
+        invalidate_category_tree()
+    return updated
+
+
+def _is_up_to_date(storage, name, source_modified):
+    return storage.exists(name) and storage.get_modified_time(name) >= source_modified
+
+
+def generate_variants(name, storage=default_storage, force=False):
+    # Create any missing or outdated variants of one image; returns the number of files written
+    source_modified = storage.get_modified_time(name)
+    pending = [
+        (width, fmt)
+        for width in VARIANT_WIDTHS
+        for fmt in VARIANT_FORMATS
+        if force or not _is_up_to_date(storage, variant_name(name, width, fmt[0]), source_modified)
+    ]
+    if not pending:
+        return 0
+
+    with storage.open(name) as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+
+    written = 0
+    for width, (extension, image_format, _, options) in pending:
+        # Never upscale: small originals are stored at their own width under every variant name
+        image = original.copy()
+        if image.width > width:
+            image.thumbnail((width, image.height * width // image.width), Image.Resampling.LANCZOS)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        buffer = BytesIO()
+        image.save(buffer, image_format, **options)
+        target = variant_name(name, width, extension)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(buffer.getvalue()))
+        written += 1
+    return written
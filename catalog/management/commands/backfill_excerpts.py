@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from catalog.models import Product, build_excerpt
+
+class Command(BaseCommand):
+    help = 'Generate the stored excerpt for existing products in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products updated per transaction')
+        parser.add_argument('--all', action='store_true', help='Regenerate every excerpt, not only missing ones')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Product.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(excerpt='')  # Only products still missing an excerpt, so reruns resume
+
+        updated = 0
+        last_pk = 0
+        while True:
+            # Walk the table by primary key so every batch is a short, index-driven query
+            batch = list(queryset.filter(pk__gt=last_pk).only('pk', 'description')[:batch_size])
+            if not batch:
+                break
+            for product in batch:
+                product.excerpt = build_excerpt(product.description)
+            # Only the excerpt is written, so updated_at (and with it every product ETag) is left alone.
+            # After changing the excerpt rule, bump CARD_TEMPLATE_VERSION to retire the cached cards.
+            with transaction.atomic():
+                Product.objects.bulk_update(batch, ['excerpt'])
+            last_pk = batch[-1].pk
+            updated += len(batch)
+            self.stdout.write(f'Updated {updated} products (last id {last_pk})')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully backfilled {updated} product excerpts'))
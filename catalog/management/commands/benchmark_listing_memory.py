@@ -0,0 +1,63 @@
+import io
+import tracemalloc
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import engines
+from django.template.loader import render_to_string
+from catalog.models import Product, LIST_DEFERRED_FIELDS
+from catalog.management.seed import seed_products
+
+# The card markup as it was rendered before the stored excerpt existed
+LEGACY_CARD = '{{ product.name }} {{ product.description|truncatewords:20 }} £{{ product.price }}'
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Measure memory allocated per listing request with full rows versus deferred text columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Number of products to seed')
+        parser.add_argument('--description-words', type=int, default=800,
+                            help='Approximate description length given to seeded products')
+        parser.add_argument('--page-sizes', nargs='+', type=int, default=[12, 100], help='Products per page')
+
+    def handle(self, *args, **options):
+        legacy_template = engines['django'].from_string(LEGACY_CARD)
+        try:
+            with transaction.atomic():
+                seed_products(options['products'], prefix='memory')
+                # Give seeded products realistic long descriptions, then generate their excerpts
+                filler = ' '.join(['solid oak frame with hand finished detailing'] * (options['description_words'] // 7))
+                Product.objects.update(description=filler, weight_and_measurements=filler)
+                call_command('backfill_excerpts', stdout=io.StringIO())
+
+                self.stdout.write(f"{'page size':>10} {'full rows KiB':>14} {'deferred KiB':>13} {'saving':>8}")
+                for page_size in options['page_sizes']:
+                    def legacy():
+                        for product in Product.objects.all()[:page_size]:
+                            legacy_template.render({'product': product})
+
+                    def deferred():
+                        for product in Product.objects.defer(*LIST_DEFERRED_FIELDS)[:page_size]:
+                            render_to_string('catalog/includes/product_card.html', {'product': product})
+
+                    full_peak = self._peak(legacy)
+                    deferred_peak = self._peak(deferred)
+                    self.stdout.write(
+                        f'{page_size:>10} {full_peak / 1024:>14.1f} {deferred_peak / 1024:>13.1f} '
+                        f'{(1 - deferred_peak / full_peak) * 100:>7.0f}%'
+                    )
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _peak(self, func):
+        # Peak traced allocation while loading and rendering one page
+        func()  # Warm template and query caches first
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
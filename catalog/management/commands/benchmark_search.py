@@ -0,0 +1,60 @@
+from statistics import median
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from catalog.models import Product
+from catalog.search import index_products, search_products
+from catalog.management.seed import seed_products
+
+QUERIES = ['oak', 'dining table', 'velvet armchair', 'comfortable storage', 'nonexistentterm']
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Compare the icontains product filter with the full-text search index over seeded catalogs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000],
+                            help='Catalog sizes to benchmark')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'products':>10} {'query':<22} {'icontains ms':>13} {'full-text ms':>13} {'speed-up':>9}")
+        for size in options['sizes']:
+            try:
+                # Seed inside a transaction that is always rolled back so no benchmark data is left behind
+                with transaction.atomic():
+                    self.stdout.write(f'Seeding {size} products...')
+                    seed_products(size, prefix=f'bench{size}')
+                    index_products()
+                    for query in QUERIES:
+                        legacy = self._time(options['repeat'], lambda: self._legacy(query))
+                        indexed = self._time(options['repeat'], lambda: self._indexed(query))
+                        self.stdout.write(
+                            f'{size:>10} {query:<22} {legacy:>13.2f} {indexed:>13.2f} {legacy / indexed:>8.1f}x'
+                        )
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _time(self, repeat, func):
+        # Median wall-clock time in milliseconds
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            func()
+            timings.append((perf_counter() - start) * 1000)
+        return median(timings)
+
+    def _legacy(self, query):
+        # The filter ProductListView used before the search index: count plus the first page
+        queryset = Product.objects.filter(Q(name__icontains=query) | Q(description__icontains=query))
+        queryset.count()
+        list(queryset[:12])
+
+    def _indexed(self, query):
+        queryset = search_products(Product.objects.all(), query).order_by('-search_rank', '-created_at')
+        queryset.count()
+        list(queryset[:12])
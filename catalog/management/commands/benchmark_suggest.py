@@ -0,0 +1,85 @@
+import random
+from time import perf_counter
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from catalog import suggest
+from catalog.suggest import DEFAULT_LIMIT, build_index, normalize, publish_index, record_product_change, SuggestIndex
+from catalog.management.seed import seed_products
+from catalog.views import product_suggest
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = (
+        'Measure autocomplete index build time, snapshot size and the latency of the suggest endpoint '
+        '(shared cache reads, delta overlay, category and index scans) over a seeded catalog'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500_000, help='Number of products to seed')
+        parser.add_argument('--lookups', type=int, default=20_000, help='Number of timed prefix lookups')
+        parser.add_argument('--changes', type=int, default=200, help='Product changes in the delta log (overlay size)')
+
+    def handle(self, *args, **options):
+        # The benchmark publishes its own snapshot and deltas, so put the shared entries back afterwards
+        shared_keys = [suggest.SNAPSHOT_KEY, suggest.SNAPSHOT_ID_KEY, suggest.SEQ_KEY]
+        saved = cache.get_many(shared_keys)
+        try:
+            # Seed inside a transaction that is always rolled back so no benchmark data is left behind
+            with transaction.atomic():
+                self.stdout.write(f"Seeding {options['products']} products...")
+                seed_products(options['products'], prefix='suggest')
+
+                start = perf_counter()
+                index = build_index()
+                self.stdout.write(
+                    f'Built index: {len(index.keys)} keys, {len(index.hot)} precomputed prefixes '
+                    f'in {perf_counter() - start:.1f}s'
+                )
+                start = perf_counter()
+                snapshot = index.dumps()
+                SuggestIndex.loads(snapshot)
+                self.stdout.write(
+                    f'Snapshot: {len(snapshot) / 1024 / 1024:.1f} MB, dump + load in {perf_counter() - start:.2f}s'
+                )
+                self._benchmark(index, options['lookups'], options['changes'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            cache.delete_many(shared_keys)
+            cache.set_many(saved, None)
+            suggest._state.update(snapshot_id=None, index=None, seq=0, overlay={})
+
+    def _benchmark(self, index, lookups, changes):
+        # Prefixes of 1-10 characters typed from the start of a random word of a random product name
+        rng = random.Random(42)
+        prefixes = []
+        for _ in range(lookups):
+            words = normalize(index.labels[rng.randrange(len(index.labels))]).split()
+            text = ' '.join(words[rng.randrange(len(words)):])
+            prefixes.append(text[:rng.randint(1, 10)])
+
+        self._report('Index lookups', [lambda prefix=prefix: index.search(prefix, DEFAULT_LIMIT) for prefix in prefixes])
+
+        # The endpoint as a worker serves it: the published snapshot plus `changes` overlaid products
+        publish_index(index)
+        for position in rng.sample(range(len(index.product_ids)), min(changes, len(index.product_ids))):
+            record_product_change(index.product_ids[position])
+        factory = RequestFactory()
+        requests = [factory.get('/catalog/suggest/', {'q': prefix}) for prefix in prefixes]
+        product_suggest(requests[0])  # Load the snapshot and apply the deltas once, like a warm worker
+        self._report('Suggest endpoint', [lambda request=request: product_suggest(request) for request in requests])
+
+    def _report(self, label, calls):
+        timings = []
+        for call in calls:
+            start = perf_counter()
+            call()
+            timings.append((perf_counter() - start) * 1000)
+        timings.sort()
+        p50, p99 = timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+        self.stdout.write(f'{label}: p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {timings[-1]:.3f} ms')
@@ -0,0 +1,102 @@
+import itertools
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from catalog.models import Product
+from catalog.search import index_products
+from catalog.views import ProductListView
+from catalog.pagination import KeysetPaginator, get_cursor_ordering
+from catalog.management.seed import seed_products
+
+SCOPES = ['all', 'category', 'subcategory']
+PRICE_FILTERS = {
+    'none': {},
+    'min': {'min_price': '100'},
+    'max': {'max_price': '500'},
+    'range': {'min_price': '100', 'max_price': '500'},
+}
+SORTS = ['', 'price_asc', 'price_desc']
+SEARCHES = {
+    'none': {},
+    'text': {'q': 'walnut desk'},  # The full-text path (tsvector GIN index / FTS5 table)
+}
+
+# Full scans of the product table (an index-ordered "SCAN ... USING INDEX" is fine)
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on catalog_product\b'),
+    'sqlite': re.compile(r'SCAN catalog_product\b(?! USING)'),
+}
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'EXPLAIN every ProductListView filter/sort/search combination over seeded data and fail on sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000, help='Number of products to seed')
+        parser.add_argument('--show-plans', action='store_true', help='Print the full plan for every query')
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'Query plan checks are not supported on {connection.vendor}')
+
+        failures = []
+        try:
+            # Seed inside a transaction that is always rolled back
+            with transaction.atomic():
+                main_category, subcategories = seed_products(options['products'], prefix='explain')
+                # bulk_create skips the indexing signals, so index the seeded products for the search queries
+                index_products(Product.objects.filter(subcategory__main_category=main_category).values_list('id', flat=True))
+                self._analyze()
+                factory = RequestFactory()
+
+                for scope, price, sort, search in itertools.product(SCOPES, PRICE_FILTERS, SORTS, SEARCHES):
+                    params = {**PRICE_FILTERS[price], **SEARCHES[search]}
+                    if sort:
+                        params['sort'] = sort
+                    kwargs = {}
+                    if scope in ('category', 'subcategory'):
+                        kwargs['category_slug'] = main_category.slug
+                    if scope == 'subcategory':
+                        kwargs['subcategory_slug'] = subcategories[0].slug
+
+                    view = ProductListView()
+                    view.setup(factory.get('/catalog/products/', params), **kwargs)
+                    queryset = view.get_queryset()
+
+                    # Offset mode fetches the first page; cursor mode also seeks past a boundary row
+                    paginator = KeysetPaginator(queryset, get_cursor_ordering(sort), view.paginate_by)
+                    first_page = paginator.page()
+                    queries = {'offset': queryset[:view.paginate_by], 'cursor': paginator.get_page_queryset()[0]}
+                    if first_page.next_cursor:
+                        queries['cursor-seek'] = paginator.get_page_queryset(first_page.next_cursor)[0]
+
+                    for mode, page_queryset in queries.items():
+                        label = f'scope={scope} price={price} sort={sort or "newest"} search={search} mode={mode}'
+                        plan = page_queryset.explain()
+                        if pattern.search(plan):
+                            failures.append(label)
+                            self.stdout.write(self.style.ERROR(f'SEQ SCAN  {label}'))
+                        else:
+                            self.stdout.write(f'ok        {label}')
+                        if options['show_plans'] or pattern.search(plan):
+                            self.stdout.write(plan)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f'{len(failures)} catalog queries fall back to a sequential scan')
+        self.stdout.write(self.style.SUCCESS('All catalog listing queries use an index'))
+
+    def _analyze(self):
+        # Refresh planner statistics so the plans reflect the seeded data
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE catalog_product')
+                cursor.execute('ANALYZE catalog_subcategory')
+            else:
+                cursor.execute('ANALYZE')
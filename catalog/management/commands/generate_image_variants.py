@@ -0,0 +1,88 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from catalog.images import VARIANT_DIR, generate_variants, mark_variants_ready, pending_images
+
+IMAGE_DIRS = ('products', 'categories')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+
+def _generate(name, force):
+    # Runs in a worker process; returns (name, files written, error message)
+    try:
+        if not default_storage.exists(name):
+            return name, 0, 'not in storage'  # Seeded or fixture records pointing at no file
+        return name, generate_variants(name, force=force), None
+    except Exception as e:
+        return name, 0, str(e)
+
+class Command(BaseCommand):
+    help = (
+        'Generate responsive image variants in parallel: for every image under MEDIA_ROOT, or with --pending '
+        'for newly uploaded images (run it continuously with --watch, or from cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--force', action='store_true', help='Regenerate variants even if they are up to date')
+        parser.add_argument('--pending', action='store_true', help='Only images whose variants are not marked ready')
+        parser.add_argument('--watch', type=float, metavar='SECONDS',
+                            help='With --pending, keep running and check for new uploads this often')
+
+    def handle(self, *args, **options):
+        if not options['pending']:
+            self._run(list(self._find_images()), options)
+            return
+        attempted = set()
+        while True:
+            # Images that failed are only retried on the next start, so a bad file is not re-read every poll
+            names = [name for name in pending_images() if name not in attempted]
+            if names:
+                attempted.update(self._run(names, options))
+            if not options['watch']:
+                if not names:
+                    self.stdout.write('No pending images')
+                return
+            time.sleep(options['watch'])
+
+    def _run(self, names, options):
+        # Generate variants for names and mark the finished ones ready; returns the names that failed
+        self.stdout.write(f'Found {len(names)} images')
+
+        written = skipped = 0
+        failed = []
+        # Variants that are already newer than their source are skipped, so an interrupted run can simply be restarted
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            futures = [executor.submit(_generate, name, options['force']) for name in names]
+            for done, future in enumerate(as_completed(futures), start=1):
+                name, count, error = future.result()
+                if error:
+                    failed.append(name)
+                    self.stderr.write(f'{name}: {error}')
+                else:
+                    mark_variants_ready(name)
+                    if count:
+                        written += count
+                    else:
+                        skipped += 1
+                if done % 100 == 0:
+                    self.stdout.write(f'Processed {done}/{len(names)} images')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} variants ({skipped} images already up to date, {len(failed)} failed)'
+        ))
+        return failed
+
+    def _find_images(self):
+        # Walk the media folders, ignoring previously generated variants
+        for directory in IMAGE_DIRS:
+            root = os.path.join(settings.MEDIA_ROOT, directory)
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [name for name in dirnames if name != VARIANT_DIR]
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(IMAGE_EXTENSIONS):
+                        path = os.path.join(dirpath, filename)
+                        yield os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from catalog.search import index_products
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index (e.g. after a bulk import that bypassed signals)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            index_products()
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the product search index'))
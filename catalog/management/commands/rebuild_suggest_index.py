@@ -0,0 +1,30 @@
+import time
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from catalog.suggest import rebuild_if_needed, rebuild_index
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the autocomplete prefix index and publish it to every worker (run periodically, e.g. nightly). '
+        'With --watch, keep running and rebuild whenever a worker finds no snapshot or a gap in the delta log.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', type=float, metavar='SECONDS', help='Check for rebuild requests this often')
+
+    def handle(self, *args, **options):
+        if not options['watch']:
+            self._report(perf_counter(), rebuild_index())
+            return
+        while True:
+            start = perf_counter()
+            index = rebuild_if_needed()
+            if index is not None:
+                self._report(start, index)
+            time.sleep(options['watch'])
+
+    def _report(self, start, index):
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index.product_ids)} products ({len(index.keys)} keys, '
+            f'{len(index.hot)} precomputed prefixes) in {perf_counter() - start:.1f}s'
+        ))
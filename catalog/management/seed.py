@@ -0,0 +1,43 @@
+# This file generates synthetic catalog data for the catalog benchmark and diagnostic commands.
+
+import random
+from catalog.models import MainCategory, SubCategory, Product
+
+ADJECTIVES = ['oak', 'walnut', 'velvet', 'leather', 'rustic', 'modern', 'compact', 'folding',
+              'vintage', 'industrial', 'scandinavian', 'upholstered', 'glass', 'marble', 'rattan']
+NOUNS = ['chair', 'table', 'sofa', 'bed', 'wardrobe', 'desk', 'bookcase', 'armchair',
+         'cabinet', 'stool', 'bench', 'dresser', 'sideboard', 'ottoman', 'shelf']
+FILLER = ['crafted', 'finish', 'durable', 'comfortable', 'storage', 'living', 'room', 'bedroom',
+          'solid', 'frame', 'cushions', 'assembly', 'elegant', 'design', 'space', 'home', 'natural']
+SUBCATEGORY_NAMES = ['Chairs', 'Tables', 'Sofas', 'Beds', 'Storage', 'Desks', 'Outdoor', 'Lighting']
+
+
+def seed_products(count, batch_size=5000, seed=42, prefix='seed'):
+    # Create a benchmark category tree and `count` products with pseudo-random names and prices
+    rng = random.Random(seed)
+    main_category = MainCategory.objects.create(
+        name=f'{prefix.title()} Category', slug=f'{prefix}-category', image='categories/placeholder.jpg'
+    )
+    subcategories = [
+        SubCategory.objects.create(main_category=main_category, name=name, slug=f'{prefix}-{name.lower()}')
+        for name in SUBCATEGORY_NAMES
+    ]
+
+    for start in range(0, count, batch_size):
+        products = []
+        for i in range(start, min(start + batch_size, count)):
+            name = f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {i}'
+            description = ' '.join(rng.choice(ADJECTIVES + NOUNS + FILLER) for _ in range(20))
+            products.append(Product(
+                name=name,
+                slug=f'{prefix}-product-{i}',
+                subcategory=rng.choice(subcategories),
+                description=description,
+                price=rng.randint(500, 250000) / 100,
+                image='products/placeholder.jpg',
+                stock=rng.randint(0, 50),
+                featured=rng.random() < 0.01,
+            ))
+        Product.objects.bulk_create(products)
+
+    return main_category, subcategories
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:06
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # Build the vendor-specific search index and populate it from existing products
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX catalog_product_search_idx ON catalog_product USING gin (search_vector)'
+        )
+        schema_editor.execute("""
+            UPDATE catalog_product AS p
+            SET search_vector =
+                setweight(to_tsvector('english', coalesce(p.name, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(s.name, '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(p.description, '')), 'C')
+            FROM catalog_subcategory AS s
+            WHERE s.id = p.subcategory_id
+        """)
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE catalog_product_fts USING fts5("
+            "name, subcategory, description, tokenize = 'porter unicode61')"
+        )
+        schema_editor.execute("""
+            INSERT INTO catalog_product_fts (rowid, name, subcategory, description)
+            SELECT p.id, p.name, s.name, p.description
+            FROM catalog_product AS p
+            JOIN catalog_subcategory AS s ON s.id = p.subcategory_id
+        """)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS catalog_product_search_idx')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS catalog_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
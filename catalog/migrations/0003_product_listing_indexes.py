@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcategory', '-created_at', '-id'], name='catalog_prod_subcat_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcategory', 'price', 'id'], name='catalog_prod_subcat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='catalog_prod_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='catalog_prod_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('featured', True)), fields=['-created_at'], name='catalog_prod_featured_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:12
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def backfill_excerpts(apps, schema_editor):
+    # Fill the new column for existing products, so cards are not blank until backfill_excerpts is run.
+    # The excerpt rule is copied from catalog.models.build_excerpt as it was when this migration was written.
+    # Only the excerpt is written: updated_at stays, so product ETags and cached cards are not all invalidated
+    # (cards from before the column existed are retired by the CARD_TEMPLATE_VERSION bump instead).
+    Product = apps.get_model('catalog', 'Product')
+    last_pk = 0
+    while True:
+        batch = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'description')[:1000])
+        if not batch:
+            break
+        for product in batch:
+            product.excerpt = Truncator(Truncator(product.description or '').words(20)).chars(500)
+        Product.objects.bulk_update(batch, ['excerpt'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.RunPython(backfill_excerpts, migrations.RunPython.noop),
+    ]
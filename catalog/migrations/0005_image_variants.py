@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:54
+
+import os
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def largest_jpeg_variant(name):
+    # Storage path of the 1280px JPEG variant, as catalog.images named it when this migration was written
+    directory, filename = os.path.split(name)
+    return f'{directory}/variants/{os.path.splitext(filename)[0]}-1280w.jpg'
+
+
+def mark_existing_variants(apps, schema_editor):
+    # Images whose variants were generated before the field existed; the largest JPEG is written
+    # last, so its presence means the full set is there. Everything else is left pending.
+    for model_name in ('MainCategory', 'Product'):
+        model = apps.get_model('catalog', model_name)
+        names = set(model.objects.exclude(image='').values_list('image', flat=True))
+        for name in names:
+            if default_storage.exists(largest_jpeg_variant(name)):
+                model.objects.filter(image=name).update(image_variants=name)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_product_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maincategory',
+            name='image_variants',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(mark_existing_variants, migrations.RunPython.noop),
+    ]
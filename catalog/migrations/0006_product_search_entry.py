@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='catalog.product')),
+                ('document', models.TextField(db_column='catalog_product_fts')),
+            ],
+            options={
+                'db_table': 'catalog_product_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -4,11 +4,25 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from django.urls import reverse
+from django.utils.text import Truncator
+from django.contrib.postgres.search import SearchVectorField
+
+EXCERPT_WORDS = 20  # Number of description words shown on product cards
+EXCERPT_MAX_LENGTH = 500
+
+# Fields that list pages never display; defer them so large text columns are not fetched
+LIST_DEFERRED_FIELDS = ('description', 'weight_and_measurements', 'search_vector')
+
+def build_excerpt(description):
+    # Short plain-text summary of a product description for listing cards
+    excerpt = Truncator(description or '').words(EXCERPT_WORDS)
+    return Truncator(excerpt).chars(EXCERPT_MAX_LENGTH)
 
 class MainCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
     image = models.ImageField(upload_to='categories/')
+    image_variants = models.CharField(max_length=100, blank=True, editable=False)  # Image whose resized variants exist (see catalog.images)
     
     class Meta:
         verbose_name_plural = "Categories"  # Plural name for the admin interface
@@ -39,6 +53,7 @@ class Product(models.Model):
     slug = models.SlugField(max_length=200, unique=True)
     subcategory = models.ForeignKey(SubCategory, related_name='products', on_delete=models.CASCADE)
     description = models.TextField()
+    excerpt = models.CharField(max_length=EXCERPT_MAX_LENGTH, blank=True, editable=False)  # First words of the description, generated on save
     weight_and_measurements = models.TextField(
         help_text="Enter product dimensions and weight (e.g., Width: 80cm, Height: 120cm, Depth: 60cm, Weight: 25kg)",
         null=True,
@@ -47,15 +62,27 @@ class Product(models.Model):
     )
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])  # Price must be non-negative
     image = models.ImageField(upload_to='products/')
+    image_variants = models.CharField(max_length=100, blank=True, editable=False)  # Image whose resized variants exist (see catalog.images)
     stock = models.PositiveIntegerField(default=0)
     low_stock_threshold = models.PositiveIntegerField(default=5)  # Threshold for low stock warning
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     featured = models.BooleanField(default=False, help_text="Check to display this product on the homepage")  # Flag for featured products
+    search_vector = SearchVectorField(null=True, editable=False)  # Weighted full-text vector, maintained by catalog.search on PostgreSQL
     
     def __str__(self):
         return self.name  # String representation of the product
     
+    def save(self, *args, **kwargs):
+        # Regenerate the excerpt whenever the description is loaded (and therefore may have changed)
+        update_fields = kwargs.get('update_fields')
+        if 'description' not in self.get_deferred_fields():
+            if update_fields is None or 'description' in update_fields:
+                self.excerpt = build_excerpt(self.description)
+                if update_fields is not None:
+                    kwargs['update_fields'] = set(update_fields) | {'excerpt'}
+        super().save(*args, **kwargs)
+    
     def is_low_stock(self):
         return self.stock <= self.low_stock_threshold  # Check if stock is below the threshold
         
@@ -64,3 +91,25 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']  # Order products by creation date, newest first
+        indexes = [
+            # Listing access paths: category/subcategory filters combined with each sort option
+            models.Index(fields=['subcategory', '-created_at', '-id'], name='catalog_prod_subcat_new_idx'),
+            models.Index(fields=['subcategory', 'price', 'id'], name='catalog_prod_subcat_price_idx'),
+            # Unfiltered listings and price range filters
+            models.Index(fields=['-created_at', '-id'], name='catalog_prod_created_idx'),
+            models.Index(fields=['price', 'id'], name='catalog_prod_price_idx'),
+            # Home page featured products (partial index, only featured rows are stored)
+            models.Index(fields=['-created_at'], condition=models.Q(featured=True), name='catalog_prod_featured_idx'),
+        ]
+
+class ProductSearchEntry(models.Model):
+    # A row of the SQLite FTS5 table kept by catalog.search; read-only, it only lets searches join products to the index
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column='rowid', db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name='search_entry',
+    )
+    document = models.TextField(db_column='catalog_product_fts')  # FTS5's hidden column named after the table (MATCH and bm25 target)
+
+    class Meta:
+        managed = False  # Created by migration 0002 on SQLite only
+        db_table = 'catalog_product_fts'
@@ -0,0 +1,124 @@
+# This file implements keyset (cursor) pagination for catalog listings.
+# Instead of OFFSET/COUNT, each page continues from the sort key of the last row seen,
+# so deep pages cost the same as the first one.
+
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Orderings supported by cursor mode, keyed by the listing's `sort` parameter.
+# Every ordering ends with the primary key so that rows with equal sort values have a stable order.
+CURSOR_ORDERINGS = {
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+}
+DEFAULT_CURSOR_ORDERING = ('-created_at', '-id')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def get_cursor_ordering(sort):
+    # Return the keyset ordering for a listing sort option
+    return CURSOR_ORDERINGS.get(sort, DEFAULT_CURSOR_ORDERING)
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+
+    def encode_cursor(self, direction, obj):
+        # Opaque cursor: the direction and the sort key values of the boundary row
+        values = [field.value_to_string(obj) for field in self.fields]
+        payload = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if direction not in ('n', 'p') or len(values) != len(self.fields):
+                raise InvalidCursor
+            values = [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (ValueError, TypeError, ValidationError, binascii.Error) as e:
+            raise InvalidCursor from e
+        return direction, values
+
+    def _seek_filter(self, values, reverse):
+        # Build (a > x) OR (a = x AND b > y) ... for the ordering, flipping comparisons for descending keys
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            descending = name.startswith('-')
+            if reverse:
+                descending = not descending
+            lookup = 'lt' if descending else 'gt'
+            term = Q(**{f'{name.lstrip("-")}__{lookup}': values[i]})
+            for prev_name, prev_value in zip(self.ordering[:i], values[:i]):
+                term &= Q(**{prev_name.lstrip('-'): prev_value})
+            condition |= term
+        # Redundant bound on the leading key lets the database start an index range scan at the cursor
+        leading = self.ordering[0]
+        descending = leading.startswith('-') != reverse
+        bound = Q(**{f'{leading.lstrip("-")}__{"lte" if descending else "gte"}': values[0]})
+        return bound & condition
+
+    def get_page_queryset(self, cursor=None):
+        # Queryset for one page after (or before) the cursor, plus the decoded cursor state.
+        # One extra row is requested so the caller can tell whether more pages exist.
+        direction, values = self.decode_cursor(cursor) if cursor else ('n', None)
+        reverse = direction == 'p'
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(values, reverse))
+        if reverse:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+        else:
+            ordering = list(self.ordering)
+        return queryset.order_by(*ordering)[:self.per_page + 1], reverse, values
+
+    def page(self, cursor=None):
+        queryset, reverse, values = self.get_page_queryset(cursor)
+        rows = list(queryset)
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows, None, None)
+        has_next = has_more if not reverse else True
+        has_previous = has_more if reverse else values is not None
+        return KeysetPage(
+            rows,
+            self.encode_cursor('n', rows[-1]) if has_next else None,
+            self.encode_cursor('p', rows[0]) if has_previous else None,
+        )
@@ -0,0 +1,120 @@
+# This file implements full-text product search for the catalog.
+# PostgreSQL keeps a weighted tsvector column on each product, while SQLite
+# (used for local development) keeps an FTS5 virtual table alongside the products.
+
+import re
+from django.db import connection
+from django.db.models import F, FloatField, Func, Lookup, Q, Value
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from .models import ProductSearchEntry
+
+SEARCH_CONFIG = 'english'  # Text search configuration used for stemming on PostgreSQL
+FTS_TABLE = 'catalog_product_fts'  # FTS5 virtual table used on SQLite
+FTS_WEIGHTS = (10.0, 4.0, 1.0)  # bm25 weights for name, subcategory name and description
+INDEX_BATCH_SIZE = 500  # Number of products refreshed per statement
+
+# Weighted search vector: product name (A), subcategory name (B), description (C)
+POSTGRES_UPDATE_SQL = f"""
+    UPDATE catalog_product AS p
+    SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(p.name, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(s.name, '')), 'B') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(p.description, '')), 'C')
+    FROM catalog_subcategory AS s
+    WHERE s.id = p.subcategory_id
+"""
+
+SQLITE_INSERT_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, subcategory, description)
+    SELECT p.id, p.name, s.name, p.description
+    FROM catalog_product AS p
+    JOIN catalog_subcategory AS s ON s.id = p.subcategory_id
+"""
+
+
+def _batches(ids):
+    # Split a list of ids into chunks small enough for a single statement
+    ids = list(ids)
+    for start in range(0, len(ids), INDEX_BATCH_SIZE):
+        yield ids[start:start + INDEX_BATCH_SIZE]
+
+
+def index_products(product_ids=None):
+    # Refresh the search index for the given products, or for every product if no ids are given
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            if product_ids is None:
+                cursor.execute(POSTGRES_UPDATE_SQL)
+                return
+            for batch in _batches(product_ids):
+                cursor.execute(POSTGRES_UPDATE_SQL + ' AND p.id = ANY(%s)', [batch])
+        elif connection.vendor == 'sqlite':
+            if product_ids is None:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+                cursor.execute(SQLITE_INSERT_SQL)
+                return
+            for batch in _batches(product_ids):
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', batch)
+                cursor.execute(SQLITE_INSERT_SQL + f' WHERE p.id IN ({placeholders})', batch)
+
+
+def remove_products(product_ids):
+    # Drop deleted products from the FTS5 table (PostgreSQL vectors are removed with the row)
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for batch in _batches(product_ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', batch)
+
+
+class FTSMatch(Lookup):
+    # search_entry__document__match=<FTS5 query>; as a lookup it makes the ORM join the FTS5 table with
+    # an INNER JOIN, which SQLite needs to drive the query from the MATCH
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+ProductSearchEntry._meta.get_field('document').register_lookup(FTSMatch)
+
+
+class BM25(Func):
+    # FTS5 relevance of the matched row: lower is better, so callers negate it
+    function = 'bm25'
+    output_field = FloatField()
+
+
+def _fts_match_expression(query):
+    # Quote every word so user input can never be parsed as FTS5 query syntax
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def search_products(queryset, query):
+    # Filter the queryset to products matching the query and annotate a search_rank (higher is better)
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        )
+
+    if connection.vendor == 'sqlite':
+        match = _fts_match_expression(query)
+        if not match:
+            # Nothing searchable (e.g. only punctuation); keep search_rank so callers can still order by it
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        # Join the FTS5 table (ProductSearchEntry) so MATCH and bm25() are evaluated once per matching row
+        weights = [Value(weight) for weight in FTS_WEIGHTS]
+        return queryset.filter(search_entry__document__match=match).annotate(
+            search_rank=-BM25(F('search_entry__document'), *weights)
+        )
+
+    # Other backends have no search index, so fall back to a plain substring match
+    return queryset.filter(Q(name__icontains=query) | Q(description__icontains=query)).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
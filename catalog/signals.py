@@ -0,0 +1,41 @@
+# This file keeps catalog derived data (such as the search index) in sync when products and categories change.
+
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import MainCategory, Product, SubCategory
+from . import search, suggest
+from .taxonomy import invalidate_category_tree
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    # Refresh the search index entry for the saved product
+    search.index_products([instance.pk])
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    # Remove the deleted product from the search index
+    search.remove_products([instance.pk])
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_suggestions(sender, instance, **kwargs):
+    # Publish the product's new suggestion entry to every worker once the change is committed
+    transaction.on_commit(partial(suggest.record_product_change, instance.pk))
+
+@receiver(post_save, sender=SubCategory)
+def reindex_subcategory_products(sender, instance, created, **kwargs):
+    # Subcategory names are part of the search vector, so re-index its products on rename
+    if not created:
+        search.index_products(instance.products.values_list('id', flat=True))
+
+@receiver(post_save, sender=MainCategory)
+@receiver(post_delete, sender=MainCategory)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_taxonomy(sender, **kwargs):
+    # The cached category tree holds names, slugs and product counts, so rebuild it on any change
+    invalidate_category_tree()
@@ -0,0 +1,335 @@
+# This file serves search-as-you-type suggestions from an in-process prefix index, so autocomplete
+# never touches the database on a keystroke.
+#
+# Products are indexed by every word-suffix of their name ("oak dining table" is found by "oak",
+# "din" and "tab") in a sorted array searched with bisect. Keys and labels are packed into UTF-8
+# blobs with offset arrays to keep 500k products at a few tens of MB per worker. Prefixes that match
+# many keys get their top results precomputed, so every lookup scans at most SCAN_LIMIT keys.
+#
+# Workers share one compressed snapshot through the cache. Product saves and deletes append small
+# deltas to a shared log which every worker applies on top of its snapshot (the "overlay"), and
+# `manage.py rebuild_suggest_index` publishes a fresh snapshot that folds the overlay back in.
+# Requests never build the index: with no snapshot (or a gap in the delta log) they keep serving
+# what they have and flag a rebuild, which `rebuild_suggest_index --watch` picks up.
+# Category suggestions come straight from the cached category tree.
+
+import bisect
+import heapq
+import pickle
+import re
+import unicodedata
+import uuid
+import zlib
+from array import array
+from django.core.cache import cache
+from django.db.models import Sum
+from django.urls import reverse
+from orders.models import OrderItem
+from .models import Product
+from .taxonomy import get_category_tree, get_taxonomy_version
+
+KEY_LENGTH = 32  # Keys (and queries) are truncated to this many characters
+MAX_WORDS = 8  # Only the first words of long names are indexed
+SCAN_LIMIT = 256  # Prefixes matching more keys than this get precomputed results
+HOT_SIZE = 50  # Results kept per precomputed prefix (covers MAX_LIMIT plus overlaid products)
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+CATEGORY_LIMIT = 3
+FEATURED_BOOST = 50.0  # Featured products rank like products that sold 50 units
+
+SNAPSHOT_KEY = 'catalog:suggest:snapshot'
+SNAPSHOT_ID_KEY = 'catalog:suggest:snapshot-id'
+SEQ_KEY = 'catalog:suggest:seq'
+DELTA_KEY = 'catalog:suggest:delta:{seq}'
+REBUILD_KEY = 'catalog:suggest:rebuild-requested'
+DELTA_TIMEOUT = 60 * 60 * 24 * 2  # Rebuild the snapshot at least this often
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+# Process-level state: the loaded snapshot, products changed since it was built (product id ->
+# (name, slug, score, keys), or None once deleted) and the category index
+_state = {'snapshot_id': None, 'index': None, 'seq': 0, 'overlay': {}, 'taxonomy_version': None, 'categories': []}
+
+
+def normalize(text):
+    # Lowercase, strip accents and collapse punctuation so "Café-Table" matches "cafe table"
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def index_keys(name):
+    # Every word-suffix of the normalized name, truncated to KEY_LENGTH
+    words = normalize(name).split()[:MAX_WORDS]
+    return {' '.join(words[i:])[:KEY_LENGTH] for i in range(len(words))}
+
+
+class StringTable:
+    # Read-only list of strings packed into one UTF-8 blob plus an offsets array
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        offsets = array('I', [0])
+        parts = []
+        for string in strings:
+            encoded = string.encode()
+            parts.append(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+        return cls(b''.join(parts), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode()
+
+
+class SuggestIndex:
+    # Immutable product prefix index: sorted keys pointing at entries (product id, label, slug, score)
+
+    def __init__(self, keys, key_entries, product_ids, labels, slugs, scores, hot, seq=0):
+        self.keys = keys
+        self.key_entries = key_entries
+        self.product_ids = product_ids
+        self.labels = labels
+        self.slugs = slugs
+        self.scores = scores
+        self.hot = hot
+        self.seq = seq  # Delta log position the index was built from
+
+    @classmethod
+    def build(cls, rows, seq=0):
+        # Build from (product id, name, slug, score) rows
+        product_ids, labels, slugs, scores, pairs = array('I'), [], [], array('d'), []
+        for entry, (product_id, name, slug, score) in enumerate(rows):
+            product_ids.append(product_id)
+            labels.append(name)
+            slugs.append(slug)
+            scores.append(score)
+            pairs.extend((key, entry) for key in index_keys(name))
+        pairs.sort()
+
+        keys = StringTable.from_strings(key for key, _ in pairs)
+        key_entries = array('I', (entry for _, entry in pairs))
+        index = cls(keys, key_entries, product_ids, StringTable.from_strings(labels),
+                    StringTable.from_strings(slugs), scores, {}, seq)
+        index.hot = index._precompute_hot_prefixes([key for key, _ in pairs])
+        return index
+
+    def _precompute_hot_prefixes(self, keys):
+        # Store the top entries of every prefix whose key range is larger than SCAN_LIMIT.
+        # Ranges are split one character at a time, so only large ranges are ever rescanned.
+        hot = {}
+        stack = [(0, len(keys), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if depth > 0:
+                hot[keys[lo][:depth]] = self._top_entries(range(lo, hi), HOT_SIZE)
+            if depth == KEY_LENGTH:
+                continue
+            start = lo
+            for i in range(lo, hi + 1):
+                if i == hi or keys[i][depth:depth + 1] != keys[start][depth:depth + 1]:
+                    if i - start > SCAN_LIMIT and len(keys[start]) > depth:
+                        stack.append((start, i, depth + 1))
+                    start = i
+        return hot
+
+    def _top_entries(self, positions, limit):
+        entries = {self.key_entries[i] for i in positions}
+        return array('I', heapq.nlargest(limit, entries, key=self.scores.__getitem__))
+
+    def search(self, prefix, limit, exclude=()):
+        # Top entries for a normalized prefix, skipping products whose entry is overlaid
+        entries = self.hot.get(prefix)
+        if entries is None:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix + '\uffff', lo)
+            entries = self._top_entries(range(lo, hi), limit + len(exclude))
+        results = []
+        for entry in entries:
+            product_id = self.product_ids[entry]
+            if product_id not in exclude:
+                results.append((self.scores[entry], product_id, self.labels[entry], self.slugs[entry]))
+                if len(results) == limit:
+                    break
+        return results
+
+    def dumps(self):
+        # Compact serialized form shared between workers through the cache
+        parts = (
+            self.keys.blob, self.keys.offsets.tobytes(), self.key_entries.tobytes(),
+            self.product_ids.tobytes(), self.labels.blob, self.labels.offsets.tobytes(),
+            self.slugs.blob, self.slugs.offsets.tobytes(), self.scores.tobytes(),
+            {prefix: entries.tobytes() for prefix, entries in self.hot.items()}, self.seq,
+        )
+        return zlib.compress(pickle.dumps(parts, pickle.HIGHEST_PROTOCOL), 1)
+
+    @classmethod
+    def loads(cls, data):
+        (keys, key_offsets, key_entries, product_ids, labels, label_offsets,
+         slugs, slug_offsets, scores, hot, seq) = pickle.loads(zlib.decompress(data))
+        return cls(
+            StringTable(keys, _array('I', key_offsets)), _array('I', key_entries), _array('I', product_ids),
+            StringTable(labels, _array('I', label_offsets)), StringTable(slugs, _array('I', slug_offsets)),
+            _array('d', scores), {prefix: _array('I', entries) for prefix, entries in hot.items()}, seq,
+        )
+
+
+def _array(typecode, data):
+    result = array(typecode)
+    result.frombytes(data)
+    return result
+
+
+def _popularity(product_ids=None):
+    # Units sold per product (canceled orders excluded)
+    items = OrderItem.objects.filter(product__isnull=False).exclude(order__status='canceled')
+    if product_ids is not None:
+        items = items.filter(product_id__in=product_ids)
+    return dict(items.values('product_id').annotate(sold=Sum('quantity')).values_list('product_id', 'sold'))
+
+
+def _score(sold, featured):
+    return float(sold or 0) + (FEATURED_BOOST if featured else 0.0)
+
+
+def build_index():
+    # Build the product index from the database; the delta position is read first so no change is missed
+    seq = cache.get(SEQ_KEY) or 0
+    sold = _popularity()
+    rows = (
+        (product_id, name, slug, _score(sold.get(product_id), featured))
+        for product_id, name, slug, featured in
+        Product.objects.order_by().values_list('id', 'name', 'slug', 'featured').iterator(chunk_size=5000)
+    )
+    return SuggestIndex.build(rows, seq)
+
+
+def publish_index(index):
+    # Share a freshly built index with every worker
+    cache.set(SNAPSHOT_KEY, index.dumps(), None)
+    cache.set(SNAPSHOT_ID_KEY, uuid.uuid4().hex, None)
+
+
+def rebuild_index():
+    index = build_index()
+    publish_index(index)
+    return index
+
+
+def request_rebuild():
+    # Ask the rebuild_suggest_index worker for a fresh snapshot
+    cache.set(REBUILD_KEY, 1, None)
+
+
+def rebuild_if_needed():
+    # Rebuild when a worker asked for it or nothing is published yet; returns the new index or None.
+    # The request flag is cleared first, so a request made during the build triggers another one.
+    if not cache.get(REBUILD_KEY) and cache.get(SNAPSHOT_ID_KEY) is not None:
+        return None
+    cache.delete(REBUILD_KEY)
+    return rebuild_index()
+
+
+def record_product_change(product_id):
+    # Append the product's current suggestion entry (or its removal) to the shared delta log
+    product = Product.objects.filter(pk=product_id).values_list('name', 'slug', 'featured').first()
+    entry = None
+    if product is not None:
+        name, slug, featured = product
+        entry = (name, slug, _score(_popularity([product_id]).get(product_id), featured))
+    cache.add(SEQ_KEY, 0, None)
+    seq = cache.incr(SEQ_KEY)
+    cache.set(DELTA_KEY.format(seq=seq), (product_id, entry), DELTA_TIMEOUT)
+
+
+def _load_snapshot(snapshot_id):
+    data = cache.get(SNAPSHOT_KEY)
+    if data is None:
+        # Nothing published (first deploy or cache flush): keep serving the current index, if any
+        request_rebuild()
+        return False
+    index = SuggestIndex.loads(data)
+    _state.update(snapshot_id=snapshot_id, index=index, seq=index.seq, overlay={})
+    return True
+
+
+def _refresh():
+    # Bring this worker's index up to date: reload a new snapshot, then apply pending deltas
+    shared = cache.get_many([SNAPSHOT_ID_KEY, SEQ_KEY])
+    snapshot_id, seq = shared.get(SNAPSHOT_ID_KEY), shared.get(SEQ_KEY) or 0
+    if _state['index'] is None or snapshot_id != _state['snapshot_id']:
+        if not _load_snapshot(snapshot_id):
+            return
+    if seq <= _state['seq']:
+        return
+
+    pending = range(_state['seq'] + 1, seq + 1)
+    deltas = cache.get_many([DELTA_KEY.format(seq=i) for i in pending])
+    if len(deltas) < len(pending):
+        # Part of the log expired or was evicted: apply what is left and serve slightly stale
+        # results until the fresh snapshot is published
+        request_rebuild()
+    for i in pending:
+        delta = deltas.get(DELTA_KEY.format(seq=i))
+        if delta is not None:
+            product_id, entry = delta
+            _state['overlay'][product_id] = entry and (*entry, index_keys(entry[0]))
+    _state['seq'] = seq
+
+
+def _search_overlay(prefix, limit):
+    results = []
+    for product_id, entry in _state['overlay'].items():
+        if entry is not None and any(key.startswith(prefix) for key in entry[3]):
+            name, slug, score, _ = entry
+            results.append((score, product_id, name, slug))
+    return heapq.nlargest(limit, results)
+
+
+def _category_entries():
+    # (keys, label, url, score) for every main category and subcategory, rebuilt when the tree changes
+    version = get_taxonomy_version()
+    if _state['taxonomy_version'] != version:
+        entries = []
+        for category in get_category_tree():
+            url = reverse('catalog:category_products', args=[category.slug])
+            entries.append((index_keys(category.name), category.name, url, category.product_count))
+            for subcategory in category.subcategory_list:
+                url = reverse('catalog:subcategory_products', args=[category.slug, subcategory.slug])
+                label = f'{subcategory.name} in {category.name}'
+                entries.append((index_keys(subcategory.name), label, url, subcategory.product_count))
+        _state.update(taxonomy_version=version, categories=entries)
+    return _state['categories']
+
+
+def get_suggestions(query, limit=DEFAULT_LIMIT):
+    # Category and product suggestions for a partially typed search query
+    prefix = normalize(query)[:KEY_LENGTH]
+    if not prefix:
+        return {'categories': [], 'products': []}
+
+    categories = heapq.nlargest(
+        CATEGORY_LIMIT,
+        (entry for entry in _category_entries() if any(key.startswith(prefix) for key in entry[0])),
+        key=lambda entry: entry[3],
+    )
+
+    _refresh()
+    products = []
+    if _state['index'] is not None:
+        overlay = _state['overlay']
+        products = heapq.nlargest(limit, _state['index'].search(prefix, limit, overlay) + _search_overlay(prefix, limit))
+
+    return {
+        'categories': [{'label': label, 'url': url} for _, label, url, _ in categories],
+        'products': [
+            {'label': name, 'url': reverse('catalog:product_detail', args=[slug])}
+            for _, _, name, slug in products
+        ],
+    }
@@ -0,0 +1,101 @@
+# This file provides the cached MainCategory -> SubCategory tree used by the catalog and home pages.
+# The tree is built with a single grouped query and kept both in the shared cache and in process memory.
+# A version key in the shared cache lets every worker notice invalidations with one cache read.
+
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from .models import MainCategory, SubCategory
+
+VERSION_KEY = 'catalog:taxonomy:version'
+TREE_KEY = 'catalog:taxonomy:tree:{version}'
+TREE_TIMEOUT = 60 * 60 * 24  # Trees are replaced on invalidation, this only bounds stale entries
+
+_local = {'version': None, 'tree': None}  # Process-level copy of the current tree
+
+
+def build_category_tree():
+    # Load every main category with its subcategories and product counts in one query
+    rows = (
+        MainCategory.objects
+        .values('id', 'name', 'slug', 'image', 'image_variants',
+                'subcategories__id', 'subcategories__name', 'subcategories__slug')
+        .annotate(product_count=Count('subcategories__products'))
+        .order_by('id', 'subcategories__id')
+    )
+
+    tree = []
+    for row in rows:
+        if not tree or tree[-1].id != row['id']:
+            category = MainCategory(
+                id=row['id'], name=row['name'], slug=row['slug'], image=row['image'], image_variants=row['image_variants'],
+            )
+            category.subcategory_list = []
+            category.product_count = 0
+            tree.append(category)
+        category = tree[-1]
+        if row['subcategories__id'] is not None:
+            subcategory = SubCategory(
+                id=row['subcategories__id'],
+                name=row['subcategories__name'],
+                slug=row['subcategories__slug'],
+                main_category=category,
+            )
+            subcategory.product_count = row['product_count']
+            category.subcategory_list.append(subcategory)
+            category.product_count += row['product_count']
+    return tree
+
+
+def get_taxonomy_version():
+    # Current catalog version; changes whenever a category, subcategory or product changes
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_category_tree():
+    # Return the list of main categories, each with `subcategory_list` and `product_count`
+    version = get_taxonomy_version()
+    if version is not None and _local['version'] == version:
+        return _local['tree']
+
+    key = TREE_KEY.format(version=version)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(key, tree, TREE_TIMEOUT)
+    _local['version'], _local['tree'] = version, tree
+    return tree
+
+
+def get_category(category_slug):
+    # Look up a main category in the cached tree, or None if it does not exist
+    for category in get_category_tree():
+        if category.slug == category_slug:
+            return category
+    return None
+
+
+def get_subcategory(category_slug, subcategory_slug):
+    # Look up a subcategory of a main category in the cached tree, or None if it does not exist
+    category = get_category(category_slug)
+    if category is None:
+        return None
+    for subcategory in category.subcategory_list:
+        if subcategory.slug == subcategory_slug:
+            return subcategory
+    return None
+
+
+def _bump_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+    _local['version'], _local['tree'] = None, None
+
+
+def invalidate_category_tree():
+    # Publish a new version once the surrounding transaction commits, so no worker caches uncommitted data
+    transaction.on_commit(_bump_version)
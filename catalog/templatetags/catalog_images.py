@@ -0,0 +1,25 @@
+# This file provides a template tag that renders product and category images with responsive srcset variants.
+
+from django import template
+from django.utils.html import format_html, format_html_join
+from catalog.images import VARIANT_FORMATS, DEFAULT_WIDTH, has_variants, srcset, variant_url
+
+register = template.Library()
+
+@register.simple_tag
+def responsive_image(image, alt, css_class='', sizes='(min-width: 768px) 33vw, 100vw'):
+    # Render a <picture> with AVIF/WebP sources and a JPEG srcset, or the original file if no variants exist yet
+    if not image:
+        return ''
+    if not has_variants(image):
+        return format_html('<img src="{}" class="{}" alt="{}">', image.url, css_class, alt)
+
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((mime_type, srcset(image.name, extension), sizes)
+         for extension, _, mime_type, _ in VARIANT_FORMATS if extension != 'jpg'),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy"></picture>',
+        sources, variant_url(image.name, DEFAULT_WIDTH), srcset(image.name, 'jpg'), sizes, css_class, alt,
+    )
@@ -1,3 +1,188 @@
-from django.test import TestCase
+# This file contains tests for the catalog listing, search and pagination views.
 
-# Create your tests here.
+import base64
+import json
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from . import suggest
+from .images import VARIANT_WIDTHS, has_variants, variant_name
+from .models import MainCategory, Product, SubCategory
+from .taxonomy import get_category_tree
+
+# A private cache, so clearing it between tests never touches a shared Redis
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalog-tests'}})
+class CatalogTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = MainCategory.objects.create(name='Furniture', slug='furniture', image='categories/furniture.jpg')
+        cls.subcategory = SubCategory.objects.create(main_category=cls.category, name='Chairs', slug='chairs')
+        cls.products = [
+            Product.objects.create(
+                name=f'Oak chair {number}', slug=f'oak-chair-{number}', subcategory=cls.subcategory,
+                description=f'A solid oak chair, model {number}.', price=Decimal(price), stock=5,
+                image=f'products/chair-{number}.jpg',
+            )
+            for number, price in enumerate(['10.00', '20.00', '30.00', '40.00'], start=1)
+        ]
+
+    def setUp(self):
+        cache.clear()  # Cached cards, facets and taxonomy must not leak between tests
+
+class ProductSearchTests(CatalogTestCase):
+    def test_search_finds_products(self):
+        response = self.client.get(reverse('catalog:product_list'), {'q': 'oak'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Oak chair 1')
+
+    def test_query_without_words_returns_no_products(self):
+        # Queries with nothing searchable used to break the ordering by search_rank
+        for query in ['""', '!!!']:
+            response = self.client.get(reverse('catalog:product_list'), {'q': query})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotContains(response, 'Oak chair')
+
+class CursorPaginationTests(CatalogTestCase):
+    def test_pages_follow_the_cursor(self):
+        url = reverse('catalog:product_list')
+        response = self.client.get(url, {'paginate': 'cursor', 'sort': 'price_asc', 'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('next_cursor', response.json())
+
+    def test_unreadable_cursor_restarts_from_the_first_page(self):
+        # A well-formed cursor whose values do not fit the sort fields (a price of "abc")
+        cursor = base64.urlsafe_b64encode(json.dumps(['n', ['abc', '1']]).encode()).decode().rstrip('=')
+        for bad_cursor in [cursor, 'not-base64!']:
+            response = self.client.get(reverse('catalog:product_list'), {'cursor': bad_cursor, 'sort': 'price_asc'})
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Oak chair 1')
+
+class FacetTests(CatalogTestCase):
+    def test_price_band_links_match_their_counts(self):
+        # A product priced exactly on a band boundary is counted in the upper band only
+        Product.objects.create(
+            name='Oak bench', slug='oak-bench', subcategory=self.subcategory, description='A bench.',
+            price=Decimal('50.00'), stock=5, image='products/bench.jpg',
+        )
+        response = self.client.get(reverse('catalog:product_list'))
+        for bucket in response.context['facet_price_buckets']:
+            linked = self.client.get(bucket['url'])
+            self.assertEqual(len(linked.context['products']), bucket['count'], bucket['url'])
+
+    def test_facets_for_unknown_categories_are_not_found(self):
+        self.assertEqual(self.client.get(reverse('catalog:category_facets', args=['furniture'])).status_code, 200)
+        for url in [
+            reverse('catalog:category_facets', args=['garden']),
+            reverse('catalog:subcategory_facets', args=['furniture', 'tables']),
+        ]:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+class BackfillExcerptTests(CatalogTestCase):
+    def test_backfill_leaves_updated_at_alone(self):
+        Product.objects.update(excerpt='')
+        before = dict(Product.objects.values_list('pk', 'updated_at'))
+        call_command('backfill_excerpts', stdout=StringIO())
+        self.assertEqual(dict(Product.objects.values_list('pk', 'updated_at')), before)
+        self.assertFalse(Product.objects.filter(excerpt='').exists())
+
+class ImageVariantTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = self.settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), 'brown').save(buffer, 'JPEG')
+        product = self.products[0]
+        product.image = SimpleUploadedFile('chair.jpg', buffer.getvalue(), content_type='image/jpeg')
+        product.save()
+        return product
+
+    def test_upload_leaves_variants_to_the_worker(self):
+        product = self.upload()
+        self.assertFalse(has_variants(product.image))
+        self.assertFalse(default_storage.exists(variant_name(product.image.name, VARIANT_WIDTHS[-1], 'jpg')))
+        response = self.client.get(product.get_absolute_url())
+        self.assertNotContains(response, '<picture>')
+
+        call_command('generate_image_variants', '--pending', '--workers', '1', stdout=StringIO(), stderr=StringIO())
+        product.refresh_from_db()
+        self.assertTrue(has_variants(product.image))
+        self.assertTrue(default_storage.exists(variant_name(product.image.name, VARIANT_WIDTHS[-1], 'jpg')))
+        response = self.client.get(product.get_absolute_url())
+        self.assertContains(response, '<picture>')
+
+    def test_rendering_cards_does_not_touch_storage(self):
+        self.upload()
+        with mock.patch.object(default_storage, 'exists', side_effect=AssertionError('storage round trip')):
+            response = self.client.get(reverse('catalog:product_list'))
+        self.assertEqual(response.status_code, 200)
+
+class ConditionalGetTests(CatalogTestCase):
+    def assertRevalidates(self, url, template, queries):
+        # A repeat visit with the ETag gets a 304 without rendering, within the given query budget
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        with self.assertNumQueries(queries), self.assertTemplateNotUsed(template):
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        return response['ETag']
+
+    def test_listing(self):
+        self.assertRevalidates(reverse('catalog:product_list'), 'catalog/product_list.html', 0)
+
+    def test_product_detail(self):
+        self.assertRevalidates(self.products[0].get_absolute_url(), 'catalog/product_detail.html', 1)
+
+    def test_category_page(self):
+        self.assertRevalidates(reverse('catalog:category_list'), 'catalog/category_list.html', 0)
+
+    def test_listing_changes_when_a_product_is_deleted(self):
+        url = reverse('catalog:product_list')
+        etag = self.assertRevalidates(url, 'catalog/product_list.html', 0)
+        with self.captureOnCommitCallbacks(execute=True):  # The catalog version is bumped on commit
+            self.products[-1].delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Oak chair 4')
+
+class SuggestTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        suggest._state.update(snapshot_id=None, index=None, seq=0, overlay={}, taxonomy_version=None, categories=[])
+
+    def test_cold_start_does_not_build_in_the_request(self):
+        get_category_tree()  # Category suggestions come from the cached tree
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('catalog:product_suggest'), {'q': 'oak'})
+        self.assertEqual(response.json()['products'], [])
+
+        # The rebuild worker publishes the snapshot that was asked for
+        self.assertIsNotNone(suggest.rebuild_if_needed())
+        self.assertIsNone(suggest.rebuild_if_needed())
+        response = self.client.get(reverse('catalog:product_suggest'), {'q': 'oak'})
+        self.assertEqual(len(response.json()['products']), len(self.products))
+
+    def test_gap_in_the_delta_log_serves_the_snapshot_and_requests_a_rebuild(self):
+        suggest.rebuild_index()
+        self.client.get(reverse('catalog:product_suggest'), {'q': 'oak'})
+        suggest.record_product_change(self.products[0].pk)
+        cache.delete(suggest.DELTA_KEY.format(seq=cache.get(suggest.SEQ_KEY)))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('catalog:product_suggest'), {'q': 'oak'})
+        self.assertEqual(len(response.json()['products']), len(self.products))
+        self.assertTrue(cache.get(suggest.REBUILD_KEY))
@@ -11,5 +11,11 @@ urlpatterns = [
     path('category/<slug:category_slug>/', views.ProductListView.as_view(), name='category_products'),  # Products filtered by category
     path('category/<slug:category_slug>/<slug:subcategory_slug>/', 
          views.ProductListView.as_view(), name='subcategory_products'),  # Products filtered by subcategory
+    path('facets/', views.ProductFacetsView.as_view(), name='product_facets'),  # Facet counts for all products (JSON)
+    path('facets/<slug:category_slug>/', views.ProductFacetsView.as_view(), name='category_facets'),  # Facet counts within a category (JSON)
+    path('facets/<slug:category_slug>/<slug:subcategory_slug>/', 
+         views.ProductFacetsView.as_view(), name='subcategory_facets'),  # Facet counts within a subcategory (JSON)
+    path('suggest/', views.product_suggest, name='product_suggest'),  # Search-as-you-type suggestions (JSON)
+    path('cards/metrics/', views.card_cache_metrics, name='card_cache_metrics'),  # Product card cache hit/miss counters
     path('product/<slug:product_slug>/', views.ProductDetailView.as_view(), name='product_detail'),  # Detailed view of a single product
 ] 
\ No newline at end of file
@@ -1,9 +1,20 @@
 # This file contains views for displaying products and categories in the catalog.
 
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
 from django.views.generic import ListView, DetailView
-from django.db.models import Q
-from .models import Product, MainCategory, SubCategory
+from django.http import JsonResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.urls import reverse
+from .models import Product, LIST_DEFERRED_FIELDS
+from .search import search_products
+from .pagination import KeysetPaginator, InvalidCursor, get_cursor_ordering
+from .taxonomy import get_category_tree, get_category, get_subcategory, get_taxonomy_version
+from .facets import get_facets, price_bucket_filters
+from .cards import render_product_cards, get_card_cache_stats
+from .suggest import get_suggestions, DEFAULT_LIMIT, MAX_LIMIT
+from .conditional import can_validate, make_etag, not_modified_response, set_etag
 
 class ProductListView(ListView):
     model = Product
@@ -11,8 +22,36 @@ class ProductListView(ListView):
     context_object_name = 'products'
     paginate_by = 12
 
+    def is_cursor_mode(self):
+        # Cursor pagination is opt-in via ?paginate=cursor (or any request that carries a cursor)
+        return self.request.GET.get('paginate') == 'cursor' or 'cursor' in self.request.GET
+
+    def get(self, request, *args, **kwargs):
+        # Answer revalidation requests with a 304 before any page rendering happens
+        etag = self.get_etag() if can_validate(request) else None
+        if etag:
+            response = not_modified_response(request, etag)
+            if response is not None:
+                return response
+        response = super().get(request, *args, **kwargs)
+        if etag:
+            set_etag(response, etag)
+        return response
+
+    def get_etag(self):
+        # The listing changes when a product in the filtered set (or the category tree) changes.
+        # Count and newest updated_at come from the cached facet query, so this is usually free.
+        facets = get_facets(self.get_queryset(), self.get_facet_filters())
+        return make_etag(self.request, get_taxonomy_version(), facets['total'], facets['last_modified'])
+
+    def get_paginate_by(self, queryset):
+        # Keyset pages are built in get_context_data, so disable offset pagination in cursor mode
+        if self.is_cursor_mode():
+            return None
+        return super().get_paginate_by(queryset)
+
     def get_queryset(self):
-        queryset = Product.objects.all()
+        queryset = Product.objects.defer(*LIST_DEFERRED_FIELDS)  # Cards only need the stored excerpt
         
         # Category filtering
         category_slug = self.kwargs.get('category_slug')
@@ -32,13 +71,10 @@ class ProductListView(ListView):
         if max_price:
             queryset = queryset.filter(price__lte=max_price)
             
-        # Search functionality
+        # Search functionality (full-text index, best matches first unless a sort is chosen)
         search_query = self.request.GET.get('q')
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
+            queryset = search_products(queryset, search_query).order_by('-search_rank', '-created_at')
             
         # Sorting
         sort = self.request.GET.get('sort')
@@ -49,9 +85,72 @@ class ProductListView(ListView):
             
         return queryset
 
+    def get_facet_filters(self):
+        # Every input that narrows the listing, used as the facet cache key
+        return {
+            'category': self.kwargs.get('category_slug'),
+            'subcategory': self.kwargs.get('subcategory_slug'),
+            'min_price': self.request.GET.get('min_price'),
+            'max_price': self.request.GET.get('max_price'),
+            'q': self.request.GET.get('q'),
+        }
+
+    def get_facet_links(self, facets):
+        # Attach listing URLs to the facet counts, keeping the search and sort but resetting pagination
+        params = self.request.GET.copy()
+        for name in ('page', 'cursor', 'format'):
+            params.pop(name, None)
+
+        def with_params(url, **overrides):
+            query = params.copy()
+            for name, value in overrides.items():
+                query[name] = value or ''
+            return f'{url}?{query.urlencode()}' if query else url
+
+        categories = []
+        for category in facets['categories']:
+            category_url = reverse('catalog:category_products', args=[category['slug']])
+            categories.append({
+                **category,
+                'url': with_params(category_url),
+                'subcategories': [{
+                    **subcategory,
+                    'url': with_params(reverse('catalog:subcategory_products', args=[category['slug'], subcategory['slug']])),
+                } for subcategory in category['subcategories']],
+            })
+        price_buckets = []
+        for bucket in facets['price_buckets']:
+            min_price, max_price = price_bucket_filters(bucket)
+            price_buckets.append({**bucket, 'url': with_params(self.request.path, min_price=min_price, max_price=max_price)})
+        return categories, price_buckets
+
+    def get_cursor_url(self, cursor):
+        # Keep the current filters and replace only the cursor
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params['paginate'] = 'cursor'
+        params['cursor'] = cursor
+        return f'?{params.urlencode()}'
+
     def get_context_data(self, **kwargs):
+        if self.is_cursor_mode():
+            # Seek from the cursor on the active sort key instead of counting and offsetting
+            paginator = KeysetPaginator(
+                self.object_list, get_cursor_ordering(self.request.GET.get('sort')), self.paginate_by
+            )
+            try:
+                cursor_page = paginator.page(self.request.GET.get('cursor'))
+            except InvalidCursor:
+                cursor_page = paginator.page()  # Unreadable cursors restart from the first page
+            kwargs['object_list'] = cursor_page.object_list
+            kwargs['cursor_page'] = cursor_page
+            if cursor_page.has_next:
+                kwargs['next_page_url'] = self.get_cursor_url(cursor_page.next_cursor)
+            if cursor_page.has_previous:
+                kwargs['previous_page_url'] = self.get_cursor_url(cursor_page.previous_cursor)
+
         context = super().get_context_data(**kwargs)
-        context['categories'] = MainCategory.objects.all()
+        context['categories'] = get_category_tree()
         
         # Add category and subcategory information
         category_slug = self.kwargs.get('category_slug')
@@ -59,26 +158,145 @@ class ProductListView(ListView):
         
         context['current_category'] = category_slug
         context['current_subcategory'] = subcategory_slug
+
+        # Product cards come from the fragment cache (the JSON variant does not need them)
+        if self.request.GET.get('format') != 'json':
+            context['product_cards'] = render_product_cards(context['products'])
+
+        # Facet counts over the whole filtered result set, not just the current page
+        context['facets'] = get_facets(self.object_list, self.get_facet_filters())
+        context['facet_categories'], context['facet_price_buckets'] = self.get_facet_links(context['facets'])
         
         # Retrieve and store names of the current category and subcategory if they exist
-        if subcategory_slug and category_slug:
-            subcategory = get_object_or_404(SubCategory, 
-                                          slug=subcategory_slug, 
-                                          main_category__slug=category_slug)
+        category, subcategory = self.get_current_category()
+        if subcategory is not None:
             context['current_subcategory_name'] = subcategory.name
-        elif category_slug:
-            category = get_object_or_404(MainCategory, slug=category_slug)
+        elif category is not None:
             context['current_category_name'] = category.name
             
         return context
 
+    def get_current_category(self):
+        # (category, subcategory) named in the URL, from the cached tree; raises Http404 for unknown slugs
+        category_slug = self.kwargs.get('category_slug')
+        subcategory_slug = self.kwargs.get('subcategory_slug')
+        if subcategory_slug and category_slug:
+            subcategory = get_subcategory(category_slug, subcategory_slug)
+            if subcategory is None:
+                raise Http404('No subcategory found matching the query')
+            return None, subcategory
+        if category_slug:
+            category = get_category(category_slug)
+            if category is None:
+                raise Http404('No category found matching the query')
+            return category, None
+        return None, None
+
+    def render_to_response(self, context, **response_kwargs):
+        # JSON variant of the listing for ?format=json
+        if self.request.GET.get('format') == 'json':
+            return JsonResponse(self.get_json_data(context))
+        return super().render_to_response(context, **response_kwargs)
+
+    def get_json_data(self, context):
+        data = {
+            'results': [{
+                'id': product.id,
+                'name': product.name,
+                'slug': product.slug,
+                'price': str(product.price),
+                'url': product.get_absolute_url(),
+                'image': product.image.url if product.image else None,
+            } for product in context['products']],
+        }
+        data['facets'] = context['facets']
+        cursor_page = context.get('cursor_page')
+        if cursor_page is not None:
+            data['next_cursor'] = cursor_page.next_cursor
+            data['previous_cursor'] = cursor_page.previous_cursor
+        elif context['is_paginated']:
+            page_obj = context['page_obj']
+            data['page'] = page_obj.number
+            data['num_pages'] = page_obj.paginator.num_pages
+            data['count'] = page_obj.paginator.count
+        return data
+
+class ProductFacetsView(ProductListView):
+    # JSON facet counts for the same filters as the matching product listing
+    def get(self, request, *args, **kwargs):
+        self.get_current_category()  # Unknown categories are a 404, as on the listing
+        queryset = self.get_queryset()
+        return JsonResponse(get_facets(queryset, self.get_facet_filters()))
+
 class ProductDetailView(DetailView):
     model = Product
     template_name = 'catalog/product_detail.html'
     context_object_name = 'product'
     slug_url_kwarg = 'product_slug'
 
+    def get(self, request, *args, **kwargs):
+        # Answer revalidation requests with a 304 before loading and rendering the product
+        etag = self.get_etag() if can_validate(request) else None
+        if etag:
+            response = not_modified_response(request, etag)
+            if response is not None:
+                return response
+        response = super().get(request, *args, **kwargs)
+        if etag:
+            set_etag(response, etag)
+        return response
+
+    def get_etag(self):
+        # The page depends on the product row (stock drives the add-to-cart button) and on category names
+        row = (
+            Product.objects.filter(slug=self.kwargs[self.slug_url_kwarg])
+            .values_list('pk', 'updated_at', 'stock')
+            .first()
+        )
+        if row is None:
+            return None  # Let the normal lookup raise the 404
+        pk, updated_at, stock = row
+        return make_etag(self.request, pk, updated_at.isoformat(), stock, get_taxonomy_version())
+
 def category_list(request):
+    # The category page only depends on the cached tree, so its version is the validator
+    etag = make_etag(request, get_taxonomy_version()) if can_validate(request) else None
+    if etag:
+        response = not_modified_response(request, etag)
+        if response is not None:
+            return response
+
     # Render the list of main categories
-    categories = MainCategory.objects.all()
-    return render(request, 'catalog/category_list.html', {'categories': categories})
\ No newline at end of file
+    categories = get_category_tree()
+    response = render(request, 'catalog/category_list.html', {'categories': categories})
+    if etag:
+        set_etag(response, etag)
+    return response
+
+def product_suggest(request):
+    # Search-as-you-type suggestions served from the in-memory prefix index (no database queries)
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    query = request.GET.get('q', '')
+    response = JsonResponse({'query': query, **get_suggestions(query, limit)})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+def card_cache_metrics(request):
+    # Product card cache counters in Prometheus text format, for staff or scrapers holding METRICS_TOKEN
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (request.user.is_staff or (token and constant_time_compare(authorization, f'Bearer {token}'))):
+        return HttpResponseForbidden()
+    stats = get_card_cache_stats()
+    lines = [
+        '# HELP securecart_product_card_cache_hits_total Product cards served from the fragment cache.',
+        '# TYPE securecart_product_card_cache_hits_total counter',
+        f"securecart_product_card_cache_hits_total {stats['hits']}",
+        '# HELP securecart_product_card_cache_misses_total Product cards rendered because they were not cached.',
+        '# TYPE securecart_product_card_cache_misses_total counter',
+        f"securecart_product_card_cache_misses_total {stats['misses']}",
+    ]
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
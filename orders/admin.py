@@ -1,9 +1,20 @@
 # This file defines the admin interface for managing orders and their items.
 
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
 from django.template.loader import render_to_string
-from .models import Order, OrderItem
-from .notifications import send_order_status_email
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from .models import CheckoutSession, EmailTask, Order, OrderItem, StockReservation
+from .notifications import queue_order_status_email
+from .rollups import add_orders, dashboard, remove_orders
+from .services import transition_orders
+
+# Range of the sales dashboard, in days
+DASHBOARD_DAYS = 30
+DASHBOARD_MAX_DAYS = 366
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -22,9 +33,32 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['id', 'user__email', 'user__username', 'shipping_address__full_name', 
                     'shipping_address__city', 'shipping_address__postal_code']
     readonly_fields = ['user', 'created_at', 'updated_at', 'total_amount', 'stripe_payment_intent', 
-                      'shipping_address_details']
+                      'stripe_session_id', 'shipping_address_details']
     inlines = [OrderItemInline]
+    change_list_template = 'secret/orders/order_change_list.html'  # Adds a link to the sales dashboard
     
+    def get_urls(self):
+        return [
+            path('sales-dashboard/', self.admin_site.admin_view(self.sales_dashboard), name='orders_order_sales_dashboard'),
+        ] + super().get_urls()
+
+    def sales_dashboard(self, request):
+        # Reads the daily rollups only, so it costs the same however long the order history is
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = min(max(int(request.GET.get('days', DASHBOARD_DAYS)), 1), DASHBOARD_MAX_DAYS)
+        except ValueError:
+            days = DASHBOARD_DAYS
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Sales dashboard',
+            'opts': self.model._meta,
+            'ranges': [7, 30, 90, 365],
+            **dashboard(days),
+        }
+        return TemplateResponse(request, 'secret/orders/sales_dashboard.html', context)
+
     def get_shipping_address(self, obj):
         if obj.shipping_address:
             return f"{obj.shipping_address.full_name} - {obj.shipping_address.city}"
@@ -39,35 +73,33 @@ class OrderAdmin(admin.ModelAdmin):
     
     # Define actions for changing order status
     actions = ['mark_as_pending', 'mark_as_shipped', 'mark_as_delivered', 'mark_as_canceled']
-    
+
+    def _transition(self, request, queryset, status):
+        # Chunked bulk update that queues the notifications (sent by the process_email_queue worker)
+        chunks = []
+        updated = transition_orders(queryset, status, progress=lambda done, total: chunks.append(done))
+        if updated:
+            self.message_user(
+                request,
+                f'{updated} orders marked as {status} in {len(chunks)} batches and notifications queued',
+            )
+        else:
+            self.message_user(request, f'All selected orders were already {status}')
+
     def mark_as_pending(self, request, queryset):
-        queryset.update(status='pending')
-        for order in queryset:
-            send_order_status_email(order, 'pending')  # Notify user of status change
+        self._transition(request, queryset, 'pending')
     mark_as_pending.short_description = "Mark selected orders as pending"
     
     def mark_as_shipped(self, request, queryset):
-        updated = queryset.update(status='shipped')
-        if updated:
-            for order in queryset:
-                send_order_status_email(order, 'shipped')  # Notify user of status change
-            self.message_user(request, f'{updated} orders marked as shipped and notifications sent')
+        self._transition(request, queryset, 'shipped')
     mark_as_shipped.short_description = "Mark selected orders as shipped"
     
     def mark_as_delivered(self, request, queryset):
-        updated = queryset.update(status='delivered')
-        if updated:
-            for order in queryset:
-                send_order_status_email(order, 'delivered')  # Notify user of status change
-            self.message_user(request, f'{updated} orders marked as delivered and notifications sent')
+        self._transition(request, queryset, 'delivered')
     mark_as_delivered.short_description = "Mark selected orders as delivered"
     
     def mark_as_canceled(self, request, queryset):
-        updated = queryset.update(status='canceled')
-        if updated:
-            for order in queryset:
-                send_order_status_email(order, 'canceled')  # Notify user of status change
-            self.message_user(request, f'{updated} orders marked as canceled and notifications sent')
+        self._transition(request, queryset, 'canceled')
     mark_as_canceled.short_description = "Mark selected orders as canceled"
     
     # Customize the change form
@@ -80,7 +112,7 @@ class OrderAdmin(admin.ModelAdmin):
             'classes': ('collapse',)  # Collapsible section for date fields
         }),
         ('Payment Information', {
-            'fields': ('stripe_payment_intent',),
+            'fields': ('stripe_payment_intent', 'stripe_session_id'),
             'classes': ('collapse',)  # Collapsible section for payment details
         }),
     )
@@ -107,10 +139,57 @@ class OrderAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         if change:
-            old_status = Order.objects.get(pk=obj.pk).status
-            super().save_model(request, obj, form, change)
-            # Notify user if the order status has changed
-            if old_status != obj.status:
-                send_order_status_email(obj, obj.status)
+            with transaction.atomic():
+                old_status = Order.objects.select_for_update().get(pk=obj.pk).status
+                super().save_model(request, obj, form, change)
+                # Notify user if the order status has changed
+                if old_status != obj.status:
+                    queue_order_status_email(obj, obj.status)
+                # Canceled orders are left out of the sales rollups
+                if obj.status == 'canceled' and old_status != 'canceled':
+                    remove_orders([obj.pk])
+                elif old_status == 'canceled' and obj.status != 'canceled':
+                    add_orders([obj.pk])
         else:
             super().save_model(request, obj, form, change)
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    # Read-only view of the stock currently held by checkouts in progress
+    list_display = ['product', 'user', 'quantity', 'created_at', 'expires_at']
+    list_select_related = ['product', 'user']
+    raw_id_fields = ['product', 'user']
+    readonly_fields = ['product', 'user', 'quantity', 'token', 'created_at', 'expires_at']
+
+    def has_add_permission(self, request):
+        return False  # Reservations are only created by checkout
+
+@admin.register(CheckoutSession)
+class CheckoutSessionAdmin(admin.ModelAdmin):
+    # Read-only record of Stripe Checkout Sessions; failed ones were paid but could not become orders
+    list_display = ['stripe_session_id', 'user', 'total_amount', 'status', 'failure_reason', 'created_at']
+    list_filter = ['status', 'created_at']
+    list_select_related = ['user']
+    search_fields = ['stripe_session_id', 'user__email', 'user__username']
+    readonly_fields = ['stripe_session_id', 'user', 'shipping_address', 'items', 'total_amount', 'reservation_token',
+                       'status', 'failure_reason', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False  # Created by checkout only
+
+@admin.register(EmailTask)
+class EmailTaskAdmin(admin.ModelAdmin):
+    # The order email outbox; failed tasks can be queued again once the mail problem is fixed
+    list_display = ['id', 'order', 'status', 'state', 'attempts', 'run_at', 'sent_at']
+    list_filter = ['state', 'status']
+    raw_id_fields = ['order']
+    readonly_fields = ['order', 'status', 'state', 'attempts', 'run_at', 'last_error', 'created_at', 'sent_at']
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(state='sent').update(state='queued', attempts=0, run_at=timezone.now())
+        self.message_user(request, f'{updated} emails queued again')
+    retry_now.short_description = "Queue selected emails again"
+
+    def has_add_permission(self, request):
+        return False  # Queued by order changes only
@@ -0,0 +1,48 @@
+# This file renders the order status emails, as HTML and as the plain-text alternative. Each body is
+# the per-order content wrapped in the shared shell (styling, heading and footer). Templates come from
+# Django's cached template loader; the cost per email is the rendering itself, which the worker keeps
+# low by prefetching the items of a whole batch.
+#
+# Templates: orders/emails/layout.html and layout.txt (the shell), and <status>_order.html and
+# <status>_order.txt (the per-order content).
+
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+# Subject, heading and footer of each status email; statuses not listed here send no email
+EMAILS = {
+    'pending': {
+        'subject': 'Order Confirmation - Your SecureCart Order',
+        'heading': 'Thank You for Your Order!',
+        'footer': 'Thank you for shopping with SecureCart!',
+    },
+    'shipped': {
+        'subject': 'Your order has been shipped!',
+        'heading': 'Your Order Has Been Shipped!',
+        'footer': 'Thank you for shopping with SecureCart!',
+    },
+    'delivered': {
+        'subject': 'Your order has been delivered!',
+        'heading': 'Your Order Has Been Delivered!',
+        'footer': 'Thank you for choosing SecureCart!',
+    },
+    'canceled': {
+        'subject': 'Your order has been canceled',
+        'heading': 'Your Order Has Been Canceled',
+        'footer': 'Thank you for choosing SecureCart!',
+    },
+}
+
+def render_order_email(order, status):
+    # (subject, text body, html body) of the status email for an order. order.user should be loaded,
+    # and order.items prefetched with their products when rendering many emails.
+    context = {'order': order, 'user': order.user}
+    bodies = {}
+    for extension in ('txt', 'html'):
+        content = render_to_string(f'orders/emails/{status}_order.{extension}', context)
+        if extension == 'txt':
+            content = content.strip()
+        bodies[extension] = render_to_string(
+            f'orders/emails/layout.{extension}', {**EMAILS[status], 'content': mark_safe(content)}
+        )
+    return EMAILS[status]['subject'], bodies['txt'], bodies['html']
@@ -0,0 +1,55 @@
+# This file is a minimal SMTP sink for development and benchmarks: it accepts every message and
+# discards it, counting connections and messages. connect_latency mimics the TCP/TLS handshake and
+# login of a real provider, which is what reusing one connection per batch saves.
+
+import socketserver
+import threading
+import time
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        if server.connect_latency:
+            time.sleep(server.connect_latency)
+        self._reply('220 fake-smtp ready')
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line in (b'.\r\n', b'.\n'):
+                    in_data = False
+                    with server.lock:
+                        server.messages += 1
+                    self._reply('250 OK: queued')
+                continue
+            command = line.strip().split(b' ', 1)[0].upper()
+            if command == b'EHLO':
+                self._reply('250-fake-smtp', '250 8BITMIME')
+            elif command == b'DATA':
+                in_data = True
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self._reply('221 Bye')
+                return
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self._reply('250 OK')
+
+    def _reply(self, *lines):
+        self.wfile.write(''.join(f'{line}\r\n' for line in lines).encode())
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), connect_latency=0):
+        super().__init__(address, FakeSMTPHandler)
+        self.connect_latency = connect_latency
+        self.connections = 0
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        # Serve from a background thread and return the port
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[1]
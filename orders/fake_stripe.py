@@ -0,0 +1,196 @@
+# This file is a small stand-in for the parts of Stripe that checkout uses, so the whole payment flow
+# (create a Checkout Session, pay, receive the signed webhook) runs offline. It is only for development
+# and tests: point STRIPE_API_BASE at it (see the run_fake_stripe command). Events are signed exactly
+# like Stripe signs them, so stripe.Webhook.construct_event accepts them with STRIPE_WEBHOOK_SECRET.
+
+import hashlib
+import hmac
+import html
+import json
+import re
+import threading
+import time
+import uuid
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+def sign_payload(payload, secret, timestamp=None):
+    # The Stripe-Signature header for a payload (bytes), as sent by Stripe
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f'{timestamp}.'.encode() + payload, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+def signed_event(event_type, session, secret):
+    # (payload, Stripe-Signature header) of an event about a Checkout Session, ready to POST to the webhook
+    payload = json.dumps({
+        'id': f'evt_{uuid.uuid4().hex[:24]}',
+        'object': 'event',
+        'type': event_type,
+        'created': int(time.time()),
+        'data': {'object': session},
+    }).encode()
+    return payload, sign_payload(payload, secret)
+
+def deliver(webhook_url, event_type, session, secret):
+    # POST a signed event to the webhook and return the response status
+    payload, signature = signed_event(event_type, session, secret)
+    request = urllib.request.Request(webhook_url, data=payload, method='POST', headers={
+        'Content-Type': 'application/json',
+        'Stripe-Signature': signature,
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+class FakeStripeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, webhook_url=None, webhook_secret='', webhook_delay=0, api_latency=0):
+        super().__init__(address, FakeStripeHandler)
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret or ''
+        self.webhook_delay = webhook_delay  # Seconds between payment and webhook (to see the processing page)
+        self.api_latency = api_latency  # Seconds added to every API call, to mimic the real round trip
+        self.sessions = {}
+        self.api_calls = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        # Serve from a background thread (for use inside a test or a script) and return the base URL
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def create_session(self, params):
+        # params: the form-encoded body Stripe's client sends, as returned by parse_qs
+        value = lambda key, default=None: params.get(key, [default])[0]
+        amount_total = 0
+        for key, amounts in params.items():
+            match = re.fullmatch(r'line_items\[(\d+)\]\[price_data\]\[unit_amount\]', key)
+            if match:
+                amount_total += int(amounts[0]) * int(value(f'line_items[{match.group(1)}][quantity]', 1))
+        session_id = f'cs_test_{uuid.uuid4().hex}'
+        session = {
+            'id': session_id,
+            'object': 'checkout.session',
+            'mode': value('mode', 'payment'),
+            'status': 'open',
+            'payment_status': 'unpaid',
+            'payment_intent': None,
+            'amount_total': amount_total,
+            'currency': value('line_items[0][price_data][currency]', 'gbp'),
+            'customer_email': value('customer_email'),
+            'success_url': value('success_url'),
+            'cancel_url': value('cancel_url'),
+            'expires_at': int(value('expires_at', int(time.time()) + 86400)),
+            'url': f'{self.base_url}/pay/{session_id}',
+        }
+        with self.lock:
+            self.sessions[session_id] = session
+        return session
+
+    def pay(self, session_id):
+        # Complete the payment and send checkout.session.completed; returns the session (None if not payable)
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None or session['status'] != 'open':
+                return None
+            session.update(status='complete', payment_status='paid', payment_intent=f'pi_{uuid.uuid4().hex[:24]}')
+            session = dict(session)
+        self._send('checkout.session.completed', session, self.webhook_delay)
+        return session
+
+    def expire(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None or session['status'] != 'open':
+                return None
+            session['status'] = 'expired'
+            session = dict(session)
+        self._send('checkout.session.expired', session)
+        return session
+
+    def _send(self, event_type, session, delay=0):
+        if not self.webhook_url:
+            return
+        if delay:
+            threading.Timer(delay, deliver, [self.webhook_url, event_type, session, self.webhook_secret]).start()
+        else:
+            deliver(self.webhook_url, event_type, session, self.webhook_secret)
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self._api_path()
+        if match := re.fullmatch(r'/v1/checkout/sessions/([\w-]+)', path):
+            return self._session_response(self.server.sessions.get(match.group(1)))
+        if match := re.fullmatch(r'/pay/([\w-]+)', path):
+            session = self.server.sessions.get(match.group(1))
+            if session is None:
+                return self._send(404, 'text/plain', b'Unknown checkout session')
+            return self._send(200, 'text/html', self._payment_page(session).encode())
+        self._error(404, 'Unrecognized request URL')
+
+    def do_POST(self):
+        path = self._api_path()
+        length = int(self.headers.get('Content-Length') or 0)
+        params = parse_qs(self.rfile.read(length).decode())
+        if path == '/v1/checkout/sessions':
+            return self._session_response(self.server.create_session(params))
+        if match := re.fullmatch(r'/v1/checkout/sessions/([\w-]+)/expire', path):
+            return self._session_response(self.server.expire(match.group(1)), 'Only open sessions can be expired')
+        if match := re.fullmatch(r'/pay/([\w-]+)', path):
+            session = self.server.pay(match.group(1))
+            if session is None:
+                return self._send(400, 'text/plain', b'This checkout session cannot be paid')
+            # Back to the shop, like Stripe does after a successful payment
+            self.send_response(303)
+            self.send_header('Location', session['success_url'].replace('{CHECKOUT_SESSION_ID}', session['id']))
+            self.end_headers()
+            return
+        self._error(404, 'Unrecognized request URL')
+
+    def _api_path(self):
+        path = urlparse(self.path).path
+        if path.startswith('/v1/'):
+            with self.server.lock:
+                self.server.api_calls += 1
+            if self.server.api_latency:
+                time.sleep(self.server.api_latency)
+        return path
+
+    def _payment_page(self, session):
+        amount = f"{session['amount_total'] / 100:.2f} {session['currency'].upper()}"
+        return (
+            '<!DOCTYPE html><html><head><title>Fake Stripe Checkout</title></head><body>'
+            f'<h1>Pay {html.escape(amount)}</h1>'
+            f"<p>{html.escape(session['customer_email'] or '')}</p>"
+            f"<form method=\"post\"><button type=\"submit\">Pay</button></form>"
+            f"<p><a href=\"{html.escape(session['cancel_url'] or '/')}\">Cancel</a></p>"
+            '</body></html>'
+        )
+
+    def _session_response(self, session, message='No such checkout.session'):
+        if session is None:
+            return self._error(400, message)
+        self._send(200, 'application/json', json.dumps(session).encode())
+
+    def _error(self, status, message):
+        body = json.dumps({'error': {'type': 'invalid_request_error', 'message': message}}).encode()
+        self._send(status, 'application/json', body)
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep test and runserver output readable
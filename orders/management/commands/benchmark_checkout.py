@@ -0,0 +1,83 @@
+import statistics
+from time import perf_counter
+import stripe
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from accounts.models import Address
+from cart import services as cart_services
+from cart.models import Cart, CartItem
+from cart.summary import CartSummary, line_total_expression
+from catalog.models import MainCategory, Product
+from catalog.management.seed import seed_products
+from orders.fake_stripe import FakeStripeServer
+from orders.models import CheckoutSession
+from orders.services import open_checkout_session
+
+class Command(BaseCommand):
+    help = 'Measure checkout latency against a local Stripe stand-in, for changed and unchanged carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Checkouts per scenario')
+        parser.add_argument('--lines', type=int, default=5, help='Lines in the cart')
+        parser.add_argument('--stripe-latency', type=float, default=0.3, help='Seconds added to every Stripe API call')
+
+    def handle(self, *args, **options):
+        server = FakeStripeServer(('127.0.0.1', 0), api_latency=options['stripe_latency'])
+        saved = stripe.api_base, stripe.api_key
+        stripe.api_base, stripe.api_key = server.start(), 'sk_test_fake'
+
+        # reserve() commits its holds, so the fixtures are created for real and deleted afterwards
+        user = get_user_model().objects.create_user(username='checkout-bench', email='bench@example.com', password=None)
+        main_category = None
+        try:
+            address = Address.objects.create(
+                user=user, full_name='Checkout Bench', street_address1='1 Bench St', city='London',
+                postal_code='E1 1AA', country='United Kingdom',
+            )
+            main_category, _ = seed_products(options['lines'], prefix='checkout-bench')
+            products = Product.objects.filter(subcategory__main_category=main_category)
+            products.update(stock=1_000_000)
+            cart = cart_services.get_cart(user)
+            for product in products:
+                cart_services.add_item(cart, product.id, 2)
+
+            def checkout():
+                # What the checkout view does per POST: summary, cart version, then the session
+                lines = list(CartItem.objects.filter(cart=cart).select_related('product').annotate(line_total=line_total_expression()))
+                summary = CartSummary(lines)
+                cart_version = Cart.objects.filter(user=user).values_list('updated_at', flat=True).first()
+                return open_checkout_session(
+                    user, address, summary.lines, summary.total_price, cart_version,
+                    success_url='http://testserver/orders/create-order/?session_id={CHECKOUT_SESSION_ID}',
+                    cancel_url='http://testserver/orders/cancel-checkout/',
+                )
+
+            self.stdout.write(f"{'scenario':<18} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'reused':>7} {'stripe calls':>13}")
+            # Every attempt follows a cart change, so each one needs a new Stripe session
+            self._measure('cart changed', checkout, server, options['iterations'], before=cart.refresh_item_count)
+            # Back and forth between the address page and Stripe with the same cart
+            self._measure('cart unchanged', checkout, server, options['iterations'])
+        finally:
+            stripe.api_base, stripe.api_key = saved
+            server.shutdown()
+            server.server_close()
+            CheckoutSession.objects.filter(user=user).delete()
+            user.delete()
+            if main_category is not None:
+                MainCategory.objects.filter(pk=main_category.pk).delete()
+
+    def _measure(self, name, checkout, server, iterations, before=None):
+        timings, reused_count = [], 0
+        calls = server.api_calls
+        for _ in range(iterations):
+            if before:
+                before()
+            start = perf_counter()
+            _, reused = checkout()
+            timings.append((perf_counter() - start) * 1000)
+            reused_count += reused
+        timings.sort()
+        self.stdout.write(
+            f'{name:<18} {statistics.mean(timings):>8.1f} {timings[len(timings) // 2]:>8.1f} '
+            f'{timings[int(len(timings) * 0.95)]:>8.1f} {reused_count:>7} {server.api_calls - calls:>13}'
+        )
@@ -0,0 +1,77 @@
+from decimal import Decimal
+from time import perf_counter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from catalog.models import Product
+from catalog.management.seed import seed_products
+from orders.emails import EMAILS, render_order_email
+from orders.models import Order, OrderItem
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Measure order status emails (html + text) rendered per second, with and without the batch prefetch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--items', type=int, default=5, help='Lines per order')
+        parser.add_argument('--status', default='shipped', choices=list(EMAILS))
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per renderer (the best is reported)')
+
+    def handle(self, *args, **options):
+        try:
+            # Seed inside a transaction that is always rolled back
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        user = get_user_model().objects.create_user(username='render-bench', email='bench@example.com', password=None)
+        main_category, _ = seed_products(options['items'], prefix='render-bench')
+        products = list(Product.objects.filter(subcategory__main_category=main_category))
+        orders = Order.objects.bulk_create([Order(user=user, total_amount=Decimal('50.00')) for _ in range(options['orders'])])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for order in orders for product in products
+        ])
+        status = options['status']
+        self.stdout.write(f"{'renderer':<28} {'emails/s':>9} {'queries':>8}")
+
+        def render_batch(prefetch, html_only=False):
+            # One batch load, then every message; without the prefetch each email lazily loads its
+            # items and their products
+            batch = list(Order.objects.filter(user=user).select_related('user'))
+            if prefetch:
+                prefetch_related_objects(batch, 'items__product')
+            for order in batch:
+                if not html_only:
+                    render_order_email(order, status)
+                    continue
+                # The old emails had no text alternative
+                content = render_to_string(f'orders/emails/{status}_order.html', {'order': order, 'user': order.user})
+                render_to_string('orders/emails/layout.html', {**EMAILS[status], 'content': mark_safe(content)})
+
+        render_order_email(orders[0], status)  # Load the templates once, as a worker would
+        renderers = [
+            ('html + text, prefetched', lambda: render_batch(True)),
+            ('html + text, lazy items', lambda: render_batch(False)),
+            ('old: html only, lazy items', lambda: render_batch(False, html_only=True)),
+        ]
+        for name, render in renderers:
+            elapsed = []
+            queries = []
+            # Counts the queries of one run (a counter, since the lazy runs exceed Django's query log)
+            with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+                render()
+            for _ in range(options['repeat']):
+                start = perf_counter()
+                render()
+                elapsed.append(perf_counter() - start)
+            self.stdout.write(f'{name:<28} {options["orders"] / min(elapsed):>9.0f} {len(queries):>8}')
@@ -0,0 +1,121 @@
+import random
+import threading
+from decimal import Decimal
+from time import perf_counter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from accounts.models import Address
+from catalog.models import MainCategory, Product
+from catalog.management.seed import seed_products
+from orders.models import Order, OrderItem
+from orders.rollups import add_orders
+from orders.services import commit_order
+
+INITIAL_STOCK = 1_000_000
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent order commits with 1 to 50 lines per order (batched commit vs the old per-line loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', nargs='+', type=int, default=[1, 5, 10, 25, 50], help='Lines per order')
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent checkouts')
+        parser.add_argument('--orders', type=int, default=20, help='Orders per thread')
+        parser.add_argument('--products', type=int, default=200, help='Size of the product pool orders draw from')
+        parser.add_argument('--legacy', action='store_true', help='Also run the old per-line create_order loop')
+
+    def handle(self, *args, **options):
+        # The threads need committed data, so the fixtures are created for real and deleted afterwards
+        # (deleting the orders also takes them out of the sales rollups)
+        user = get_user_model().objects.create_user(username='order-bench', password=None)
+        main_category = None
+        try:
+            address = Address.objects.create(
+                user=user, full_name='Order Bench', street_address1='1 Bench St', city='London',
+                postal_code='E1 1AA', country='United Kingdom',
+            )
+            main_category, _ = seed_products(options['products'], prefix='order-bench')
+            products = list(Product.objects.filter(subcategory__main_category=main_category).values_list('id', 'price'))
+            Product.objects.filter(subcategory__main_category=main_category).update(stock=INITIAL_STOCK)
+
+            modes = [('batched', self._batched)] + ([('legacy', self._legacy)] if options['legacy'] else [])
+            self.stdout.write(
+                f"{'mode':<8} {'lines':>5} {'orders/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'stock ok':>9}"
+            )
+            for lines in options['lines']:
+                for name, commit in modes:
+                    self._run(name, commit, lines, user, address, products, options)
+        finally:
+            Order.objects.filter(user=user).delete()
+            user.delete()
+            if main_category is not None:
+                MainCategory.objects.filter(pk=main_category.pk).delete()
+
+    def _run(self, name, commit, lines, user, address, products, options):
+        product_ids = [product_id for product_id, _ in products]
+        stock_before = Product.objects.filter(id__in=product_ids).aggregate(total=Sum('stock'))['total']
+        units_before = OrderItem.objects.filter(order__user=user).aggregate(total=Sum('quantity'))['total'] or 0
+        timings, errors = [], []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['threads'])
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                barrier.wait()
+                for _ in range(options['orders']):
+                    chosen = rng.sample(products, min(lines, len(products)))
+                    items = [{'product_id': product_id, 'quantity': 1, 'price': str(price)} for product_id, price in chosen]
+                    start = perf_counter()
+                    try:
+                        commit(user, address, items)
+                    except Exception as e:
+                        with lock:
+                            errors.append(str(e))
+                        continue
+                    with lock:
+                        timings.append((perf_counter() - start) * 1000)
+            finally:
+                connection.close()  # Each thread has its own connection
+
+        start = perf_counter()
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = perf_counter() - start
+
+        # Every unit ordered must have left stock exactly once (lost updates would break this)
+        stock_after = Product.objects.filter(id__in=product_ids).aggregate(total=Sum('stock'))['total']
+        units = (OrderItem.objects.filter(order__user=user).aggregate(total=Sum('quantity'))['total'] or 0) - units_before
+        timings.sort()
+        if errors:
+            self.stderr.write(f"{name} x{lines}: first error: {errors[0]}")
+        p50 = timings[len(timings) // 2] if timings else 0
+        p95 = timings[int(len(timings) * 0.95)] if timings else 0
+        self.stdout.write(
+            f'{name:<8} {lines:>5} {len(timings) / elapsed:>9.1f} {p50:>8.1f} {p95:>8.1f} {len(errors):>7} '
+            f'{"yes" if stock_before - stock_after == units else "NO":>9}'
+        )
+
+    def _batched(self, user, address, items):
+        total = sum(Decimal(item['price']) * item['quantity'] for item in items)
+        commit_order(user, address, items, total)
+
+    def _legacy(self, user, address, items):
+        # The per-line loop create_order used before orders.services.commit_order (kept only for comparison)
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user, shipping_address=address,
+                total_amount=sum(Decimal(item['price']) * item['quantity'] for item in items),
+            )
+            for item in items:
+                product = Product.objects.get(id=item['product_id'])
+                if item['quantity'] > product.stock:
+                    raise ValueError(f'Insufficient stock for {product.name}')
+                OrderItem.objects.create(order=order, product=product, quantity=item['quantity'], price=Decimal(item['price']))
+                product.stock -= item['quantity']
+                product.save()
+            add_orders([order.id])  # Counted in the sales rollups like every committed order
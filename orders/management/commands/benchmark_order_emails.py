@@ -0,0 +1,75 @@
+from decimal import Decimal
+from time import perf_counter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from orders.fake_smtp import FakeSMTPServer
+from orders.models import EmailTask, Order
+from orders.notifications import process_email_tasks, send_order_status_email
+from orders.rollups import add_orders
+from orders.services import transition_orders
+
+class Command(BaseCommand):
+    help = 'Measure bulk order status changes and order email throughput against a local SMTP sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--chunk-size', type=int, default=500, help='Orders changed per transaction')
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails claimed and sent per SMTP connection')
+        parser.add_argument('--smtp-latency', type=float, default=0.05, help='Seconds to set up each SMTP connection')
+        parser.add_argument('--legacy', type=int, default=200, metavar='N',
+                            help='Also send N emails the old way, one connection each (0 to skip)')
+
+    def handle(self, *args, **options):
+        smtp = FakeSMTPServer(connect_latency=options['smtp_latency'])
+        email_settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=smtp.start(), EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+        )
+        # The worker commits as it goes, so the fixtures are created for real and deleted afterwards
+        user = get_user_model().objects.create_user(username='email-bench', email='bench@example.com', password=None)
+        try:
+            Order.objects.bulk_create(
+                [Order(user=user, total_amount=Decimal('10.00')) for _ in range(options['orders'])], batch_size=1000
+            )
+            orders = Order.objects.filter(user=user)
+            add_orders(list(orders.values_list('id', flat=True)))  # Deleting them afterwards takes them out again
+
+            start = perf_counter()
+            changed = transition_orders(
+                orders, 'shipped', chunk_size=options['chunk_size'],
+                progress=lambda done, total: self.stdout.write(f'  marked {done}/{total} shipped'),
+            )
+            elapsed = perf_counter() - start
+            self.stdout.write(f'Status change: {changed} orders in {elapsed:.2f}s ({changed / elapsed:.0f} orders/s)')
+
+            with email_settings:
+                start = perf_counter()
+                sent = 0
+                while True:
+                    claimed, batch_sent, _ = process_email_tasks(options['batch_size'])
+                    if not claimed:
+                        break
+                    sent += batch_sent
+                elapsed = perf_counter() - start
+                self._report('Queue worker', sent, elapsed, smtp)
+
+                if options['legacy']:
+                    smtp.connections = 0
+                    start = perf_counter()
+                    # What the admin actions did before: lazy user load and one connection per email
+                    for order in orders[:options['legacy']]:
+                        send_order_status_email(order, 'shipped')
+                    elapsed = perf_counter() - start
+                    self._report('One per email', min(options['legacy'], changed), elapsed, smtp)
+        finally:
+            EmailTask.objects.filter(order__user=user).delete()
+            Order.objects.filter(user=user).delete()
+            user.delete()
+            smtp.shutdown()
+            smtp.server_close()
+
+    def _report(self, name, sent, elapsed, smtp):
+        self.stdout.write(
+            f'{name}: {sent} emails in {elapsed:.2f}s ({sent / elapsed:.0f} emails/s, {smtp.connections} SMTP connections)'
+        )
@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from orders.notifications import process_email_tasks, queue_stats
+
+class Command(BaseCommand):
+    help = 'Send queued order emails (run one or more workers continuously, or with --once from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Tasks claimed per transaction')
+        parser.add_argument('--sleep', type=float, default=2, help='Seconds to wait when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Exit when no task is due')
+        parser.add_argument('--stats', action='store_true', help='Print the queue depth and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = queue_stats()
+            age = (timezone.now() - stats['oldest_queued']).total_seconds() if stats['oldest_queued'] else 0
+            self.stdout.write(
+                f"queued={stats['queued']} due={stats['due']} retrying={stats['retrying']} "
+                f"failed={stats['failed']} sent={stats['sent']} oldest_queued_age={age:.0f}s"
+            )
+            return
+
+        totals = [0, 0, 0]
+        try:
+            while True:
+                claimed, sent, failed = process_email_tasks(options['batch_size'])
+                totals = [total + count for total, count in zip(totals, (claimed, sent, failed))]
+                if claimed and options['verbosity'] > 1:
+                    self.stdout.write(f'Claimed {claimed}, sent {sent}, gave up on {failed}')
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f'Claimed {totals[0]} tasks: {totals[1]} sent, {totals[2]} failed for good, the rest will be retried'
+        ))
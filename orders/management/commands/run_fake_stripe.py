@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from orders.fake_stripe import FakeStripeServer
+
+class Command(BaseCommand):
+    help = 'Run a local fake Stripe (Checkout Sessions and signed webhooks) so checkout works offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--webhook-url', default='http://127.0.0.1:8000/orders/stripe-webhook/',
+                            help='Where checkout.session events are delivered')
+        parser.add_argument('--webhook-delay', type=float, default=0,
+                            help='Seconds to wait before delivering the payment webhook')
+        parser.add_argument('--api-latency', type=float, default=0,
+                            help='Seconds added to every API call (real Stripe takes a few hundred ms)')
+
+    def handle(self, *args, **options):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            self.stderr.write('STRIPE_WEBHOOK_SECRET is not set; the shop will reject every event')
+        server = FakeStripeServer(
+            ('127.0.0.1', options['port']),
+            webhook_url=options['webhook_url'],
+            webhook_secret=settings.STRIPE_WEBHOOK_SECRET,
+            webhook_delay=options['webhook_delay'],
+            api_latency=options['api_latency'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Fake Stripe on {server.base_url}; run the shop with STRIPE_API_BASE={server.base_url}'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
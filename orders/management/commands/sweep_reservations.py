@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from orders.reservations import delete_expired
+
+class Command(BaseCommand):
+    help = 'Delete expired checkout stock reservations (run periodically, e.g. every few minutes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Reservations deleted per statement')
+
+    def handle(self, *args, **options):
+        deleted = delete_expired(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired reservations'))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('orders', '0002_stockreservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='stripe_session_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='CheckoutSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stripe_session_id', models.CharField(max_length=255, unique=True)),
+                ('items', models.JSONField()),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('reservation_token', models.CharField(blank=True, max_length=32)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('completed', 'Completed'), ('failed', 'Failed'), ('expired', 'Expired')], default='open', max_length=20)),
+                ('failure_reason', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('shipping_address', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.address')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkout_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_checkoutsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutsession',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='checkoutsession',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='checkoutsession',
+            name='url',
+            field=models.TextField(blank=True),
+        ),
+    ]
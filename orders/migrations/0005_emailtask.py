@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_checkoutsession_reuse'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20)),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='email_tasks', to='orders.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'run_at'], name='orders_emailtask_due_idx')],
+            },
+        ),
+    ]
@@ -2,10 +2,22 @@
 
 from django.db import models
 from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from catalog.models import Product
+from catalog.models import Product, SubCategory
 from accounts.models import Address
 
+class OrderQuerySet(models.QuerySet):
+    def history(self, user):
+        # A customer's orders, newest first, each annotated with item_count (units across its lines)
+        # so order lists need no query per order
+        return (
+            self.filter(user=user)
+            .annotate(item_count=Coalesce(Sum('items__quantity'), 0))
+            .order_by('-created_at', '-id')
+        )
+
 class Order(models.Model):
     # Possible statuses for an order to track its progress
     STATUS_CHOICES = [
@@ -22,8 +34,12 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     stripe_payment_intent = models.CharField(max_length=255, blank=True)
+    # The Checkout Session that paid for the order; unique so a redelivered webhook cannot create it twice
+    stripe_session_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
     confirmation_email_sent = models.BooleanField(default=False) # Flag to indicate if a confirmation email has been sent
 
+    objects = OrderQuerySet.as_manager()
+
     def __str__(self):
         # String representation of the order
         return f"Order {self.id} - {self.user.username}"
@@ -41,3 +57,120 @@ class OrderItem(models.Model):
     def __str__(self):
         # String representation of the order item
         return f"{self.quantity}x {self.product.name} in Order {self.order.id}"
+
+class StockReservation(models.Model):
+    # Units held for a shopper between starting checkout and committing (or abandoning) the order.
+    # Available stock is product.stock minus the unexpired reservations (see orders/reservations.py).
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    token = models.CharField(max_length=32, db_index=True)  # Identifies one checkout attempt (kept in the session)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Summing the active holds of a product reads only this index
+            models.Index(fields=['product', 'expires_at', 'quantity'], name='orders_resv_product_exp_idx'),
+            models.Index(fields=['expires_at'], name='orders_resv_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} held for {self.user_id} until {self.expires_at}"
+
+class CheckoutSession(models.Model):
+    # What the customer is paying for in a Stripe Checkout Session, stored when the session is created
+    # so the webhook can build the order without the customer's browser (see orders/services.py)
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    ]
+
+    stripe_session_id = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='checkout_sessions')
+    shipping_address = models.ForeignKey(Address, on_delete=models.SET_NULL, null=True, related_name='+')
+    items = models.JSONField()  # [{'product_id', 'quantity', 'price'}, ...] as charged
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    reservation_token = models.CharField(max_length=32, blank=True)
+    # Hash of the cart, prices and address; a checkout with the same fingerprint reuses this session
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True)
+    url = models.TextField(blank=True)  # Stripe's payment page for the session
+    expires_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    failure_reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Checkout {self.stripe_session_id} - {self.status}"
+
+class EmailTask(models.Model):
+    # Outbox of order emails. Requests only insert rows (in the same transaction as the change they
+    # announce); the process_email_queue worker sends them and retries failures with backoff.
+    STATE_CHOICES = [
+        ('queued', 'Queued'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='email_tasks')
+    status = models.CharField(max_length=20)  # Which status email to send (orders/emails/<status>_order.html)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)  # Not claimed before this (retry backoff, claim lease)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's claim query: queued tasks that are due, oldest first
+            models.Index(fields=['state', 'run_at'], name='orders_emailtask_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} email for order {self.order_id} ({self.state})"
+
+# Sales rollups, kept up to date by orders/rollups.py as orders are committed and canceled (canceled
+# orders are not counted) and rebuilt from scratch by the rebuild_sales_rollups command. Reports read
+# these small tables instead of aggregating the whole order history. Dates are in TIME_ZONE.
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.date}: {self.orders} orders, £{self.revenue}"
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    # No database constraint, so the sales history survives the product being deleted
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='orders_daily_product_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: product {self.product_id}, {self.units} units"
+
+class DailySubcategorySales(models.Model):
+    date = models.DateField()
+    subcategory = models.ForeignKey(SubCategory, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'subcategory'], name='orders_daily_subcategory_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: subcategory {self.subcategory_id}, {self.units} units"
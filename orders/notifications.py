@@ -1,36 +1,129 @@
 # This file handles sending order status update emails to users.
+# Requests never send mail themselves: they queue an EmailTask (queue_order_status_email), and the
+# process_email_queue worker claims due tasks with SELECT ... FOR UPDATE SKIP LOCKED, sends them and
+# retries failures with exponential backoff. Slow or failing SMTP therefore never affects a page.
+# Each claimed batch is rendered in one pass (see orders/emails.py) and sent over a single SMTP connection.
 
-from django.core.mail import send_mail
+from datetime import timedelta
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, prefetch_related_objects
+from django.utils import timezone
+from .emails import EMAILS, render_order_email
+from .models import EmailTask
 
-def send_order_status_email(order, status):
-    # Map order statuses to corresponding email subjects
-    subject_map = {
-        'pending': 'Order Confirmation - Your SecureCart Order',
-        'shipped': 'Your order has been shipped!',
-        'delivered': 'Your order has been delivered!',
-        'canceled': 'Your order has been canceled',
-    }
-    
-    # Exit if the status is not recognized
-    if status not in subject_map:
-        return
-    
-    # Prepare context for the email template
-    context = {
-        'order': order,
-        'user': order.user,
-    }
-    
-    # Render the HTML message using the appropriate template
-    html_message = render_to_string(f'orders/emails/{status}_order.html', context)
-    
-    # Send the email to the user with the specified subject and HTML content
-    send_mail(
-        subject=subject_map[status],
-        message='',
+MAX_ATTEMPTS = 6
+RETRY_DELAY = timedelta(minutes=1)  # Doubled after every failed attempt (1, 2, 4, 8, 16 minutes)
+CLAIM_LEASE = timedelta(minutes=5)  # A claimed task is retried after this if its worker died mid-send
+
+def build_order_status_email(order, status, connection=None):
+    # The status email for an order (order.user must be loaded), or None if the status has no email
+    if status not in EMAILS:
+        return None
+    subject, text_message, html_message = render_order_email(order, status)
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=text_message,
         from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[order.user.email],
-        html_message=html_message,
-    ) 
\ No newline at end of file
+        to=[order.user.email],
+        connection=connection,
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+def send_order_status_email(order, status):
+    # Send one email immediately (over its own connection); requests use queue_order_status_email instead
+    message = build_order_status_email(order, status)
+    if message is not None:
+        message.send()
+
+def queue_order_status_email(order, status):
+    # Called by views and the admin instead of sending; commits (or rolls back) with the caller's transaction
+    if status in EMAILS:
+        EmailTask.objects.create(order=order, status=status)
+
+def queue_order_status_emails(order_ids, status):
+    # Bulk version for many orders at once (one INSERT)
+    if status in EMAILS:
+        EmailTask.objects.bulk_create([EmailTask(order_id=order_id, status=status) for order_id in order_ids])
+
+def claim_email_tasks(batch_size):
+    # Lock up to batch_size due tasks, skipping those other workers hold, and push their run_at past
+    # the lease so no other worker claims them while they are being sent
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(
+            EmailTask.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(state='queued', run_at__lte=now)
+            .select_related('order__user')
+            .order_by('run_at', 'id')[:batch_size]
+        )
+        if tasks:
+            EmailTask.objects.filter(id__in=[task.id for task in tasks]).update(
+                run_at=now + CLAIM_LEASE, attempts=F('attempts') + 1
+            )
+    for task in tasks:
+        task.attempts += 1
+    # Every email lists the order's items: load them for the whole batch in two queries
+    prefetch_related_objects([task.order for task in tasks], 'items__product')
+    return tasks
+
+def process_email_tasks(batch_size=20):
+    # Claim one batch, render it in one pass and send it over one SMTP connection.
+    # Returns (claimed, sent, failed for good).
+    tasks = claim_email_tasks(batch_size)
+    if not tasks:
+        return 0, 0, 0
+    sent_ids, errors = [], {}
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        errors = {task.id: e for task in tasks}  # No connection, so the whole batch is retried
+    else:
+        try:
+            messages = []
+            for task in tasks:
+                try:
+                    messages.append((task, build_order_status_email(task.order, task.status, connection)))
+                except Exception as e:
+                    errors[task.id] = e
+            for task, message in messages:
+                # One message per call on the open connection, so a rejected recipient fails only its own task
+                try:
+                    if message is not None:
+                        connection.send_messages([message])
+                except Exception as e:
+                    errors[task.id] = e
+                else:
+                    sent_ids.append(task.id)
+        finally:
+            connection.close()
+
+    failed = 0
+    for task in tasks:
+        if task.id not in errors:
+            continue
+        # Retry later with backoff, or give up after MAX_ATTEMPTS
+        if task.attempts >= MAX_ATTEMPTS:
+            changes = {'state': 'failed'}
+            failed += 1
+        else:
+            changes = {'run_at': timezone.now() + RETRY_DELAY * 2 ** (task.attempts - 1)}
+        EmailTask.objects.filter(pk=task.pk).update(last_error=str(errors[task.id])[:1000], **changes)
+    if sent_ids:
+        EmailTask.objects.filter(id__in=sent_ids).update(state='sent', sent_at=timezone.now())
+    return len(tasks), len(sent_ids), failed
+
+def queue_stats():
+    # Queue depth for monitoring: tasks per state, queued tasks due now and the oldest queued task
+    now = timezone.now()
+    return EmailTask.objects.aggregate(
+        queued=Count('id', filter=Q(state='queued')),
+        due=Count('id', filter=Q(state='queued', run_at__lte=now)),
+        retrying=Count('id', filter=Q(state='queued', attempts__gt=0)),
+        failed=Count('id', filter=Q(state='failed')),
+        sent=Count('id', filter=Q(state='sent')),
+        oldest_queued=Min('created_at', filter=Q(state='queued')),
+    )
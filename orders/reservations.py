@@ -0,0 +1,99 @@
+# This file holds stock for shoppers while they pay, so a flash sale cannot sell the last unit twice.
+#
+# Each checkout attempt holds its units under its own token. Reserving takes no product row lock, so
+# shoppers reserving a hot product never queue behind each other: the holds are inserted and
+# committed first, and only then is the stock compared with every committed hold. Of two shoppers
+# racing for the last unit, the one that checks last sees both holds and backs off, so stock is never
+# oversold. Under heavy contention both may back off (the shopper just tries again); that is the price
+# of not serializing on the product row. Holds are released per token, never per user, because a user
+# may have more than one open checkout session.
+
+import uuid
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from catalog.models import Product
+from .models import StockReservation
+
+# Matches the checkout session expiry, so holds end when the checkout session does
+RESERVATION_TTL = timedelta(minutes=30)
+
+class InsufficientStock(Exception):
+    def __init__(self, products):
+        super().__init__(', '.join(product.name for product in products))
+        self.products = products  # Products that could not be reserved, annotated with `available`
+
+def _active(prefix=''):
+    return Q(**{f'{prefix}expires_at__gt': timezone.now()})
+
+def reserved_quantity():
+    # Units of each product held by unexpired reservations (for annotating Product querysets)
+    return Coalesce(Sum('reservations__quantity', filter=_active('reservations__')), 0)
+
+def available_stock(product_ids):
+    # {product id: stock minus active reservations}
+    return dict(
+        Product.objects.filter(id__in=product_ids)
+        .annotate(available=F('stock') - reserved_quantity())
+        .values_list('id', 'available')
+    )
+
+def reserve(user, quantities):
+    # Hold {product id: quantity} for one checkout attempt and return its reservation token.
+    # Raises InsufficientStock (holding nothing) if other holds leave too little stock.
+    # Must run outside a transaction: the check only protects against holds that are committed.
+    _check(available_stock(quantities), quantities)  # Turn obvious shortages away without writing
+
+    token = uuid.uuid4().hex
+    expires_at = timezone.now() + RESERVATION_TTL
+    with transaction.atomic():
+        StockReservation.objects.bulk_create([
+            StockReservation(product_id=product_id, user=user, quantity=quantity, token=token, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        ])
+
+    # Now committed, the holds are visible to every later check; back off if they oversell anything
+    available = available_stock(quantities)
+    without_ours = {product_id: available.get(product_id, 0) + quantity for product_id, quantity in quantities.items()}
+    try:
+        _check(without_ours, quantities)
+    except InsufficientStock:
+        release(token)
+        raise
+    return token
+
+def _check(available, quantities):
+    # Raise InsufficientStock for the products with less than `quantities` available
+    short = [product_id for product_id, quantity in quantities.items() if available.get(product_id, 0) < quantity]
+    if short:
+        products = list(Product.objects.filter(id__in=short))
+        for product in products:
+            product.available = max(available[product.id], 0)  # What this shopper could have had
+        raise InsufficientStock(products)
+
+def held_by_others(product_ids, token=None):
+    # {product id: units held by active reservations other than `token`} (for checks under the product locks)
+    return dict(
+        StockReservation.objects.filter(_active(), product_id__in=product_ids).exclude(token=token)
+        .values('product_id').annotate(held=Sum('quantity')).values_list('product_id', 'held')
+    )
+
+def release(token):
+    # Drop the holds of one checkout attempt (order committed, payment abandoned or failed)
+    if token:
+        StockReservation.objects.filter(token=token).delete()
+
+def delete_expired(chunk_size=1000):
+    # Remove expired holds in small batches; returns the number deleted.
+    # Expired rows are already ignored by every availability check, so this is only housekeeping.
+    deleted = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        deleted += StockReservation.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,210 @@
+# This file maintains the daily sales rollups (DailySales, DailyProductSales, DailySubcategorySales).
+#
+# Committing an order adds it, and canceling or deleting it takes it out again, in the same
+# transaction as the order change. Each change aggregates only the affected orders and applies the result as
+# increments with one multi-row upsert per table. rebuild() recomputes everything from the order
+# history: it pulls the items in primary key chunks with values_list and aggregates them with NumPy.
+# dashboard() builds the admin sales dashboard from the rollups alone.
+
+from datetime import date as Date, timedelta
+from decimal import Decimal
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from catalog.models import Product, SubCategory
+from .models import DailyProductSales, DailySales, DailySubcategorySales, Order, OrderItem
+
+# Adds units and revenue to existing rows (creating missing ones) instead of overwriting them
+UPSERT_SQL = """
+    INSERT INTO {table} ({date}, {key}, units, revenue) VALUES {values}
+    ON CONFLICT ({date}, {key}) DO UPDATE SET
+        units = {table}.units + EXCLUDED.units, revenue = {table}.revenue + EXCLUDED.revenue
+"""
+DAILY_UPSERT_SQL = """
+    INSERT INTO {table} ({date}, orders, units, revenue) VALUES {values}
+    ON CONFLICT ({date}) DO UPDATE SET
+        orders = {table}.orders + EXCLUDED.orders, units = {table}.units + EXCLUDED.units,
+        revenue = {table}.revenue + EXCLUDED.revenue
+"""
+
+def _line_total():
+    return ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+def _upsert(template, model, rows, key=None):
+    # rows: [(date, [key,] units, revenue), ...] or [(date, orders, units, revenue), ...] for DailySales
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    placeholders = '(' + ', '.join(['%s'] * len(rows[0])) + ')'
+    sql = template.format(
+        table=quote(model._meta.db_table), date=quote('date'), key=quote(key) if key else '',
+        values=', '.join([placeholders] * len(rows)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+def _apply(order_ids, sign):
+    if not order_ids:
+        return
+    items = OrderItem.objects.filter(order_id__in=order_ids)
+    day = TruncDate('order__created_at')  # In the current time zone, like rebuild()
+    totals = {'units': Sum('quantity'), 'revenue': Sum(_line_total())}
+
+    orders_per_day = dict(
+        Order.objects.filter(id__in=order_ids).annotate(day=TruncDate('created_at'))
+        .values('day').annotate(count=Count('id')).values_list('day', 'count')
+    )
+    daily = {row['day']: row for row in items.values(day=day).annotate(**totals)}
+    with transaction.atomic():
+        _upsert(DAILY_UPSERT_SQL, DailySales, [
+            (date, sign * count, sign * (daily.get(date, {}).get('units') or 0),
+             sign * (daily.get(date, {}).get('revenue') or Decimal('0')))
+            for date, count in orders_per_day.items()
+        ])
+        # Lines whose product has since been deleted only count towards the daily totals
+        for model, key, field in [
+            (DailyProductSales, 'product_id', 'product_id'),
+            (DailySubcategorySales, 'subcategory_id', 'product__subcategory_id'),
+        ]:
+            rows = items.filter(product__isnull=False).values(day=day, key=F(field)).annotate(**totals)
+            _upsert(UPSERT_SQL, model, [
+                (row['day'], row['key'], sign * row['units'], sign * row['revenue']) for row in rows
+            ], key=key)
+        if sign < 0:
+            # Drop the rows that no longer count anything, so removed orders leave no empty rows behind
+            DailySales.objects.filter(date__in=orders_per_day, orders=0).delete()
+            for model in [DailyProductSales, DailySubcategorySales]:
+                model.objects.filter(date__in=orders_per_day, units=0).delete()
+
+def add_orders(order_ids):
+    # Count newly committed (or un-canceled) orders
+    _apply(order_ids, 1)
+
+def remove_orders(order_ids):
+    # Stop counting canceled or deleted orders
+    _apply(order_ids, -1)
+
+def _group_sum(keys, *columns):
+    # Sum each column per distinct key: (unique keys, sums...), all exact int64 arrays
+    if not len(keys):
+        return (keys, *columns)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    return (keys[starts], *(np.add.reduceat(column[order], starts) for column in columns))
+
+def _pk_chunks(queryset, chunk_size):
+    # Primary key ranges covering the queryset, so every pull is an index range scan
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        yield queryset.filter(pk__gte=start, pk__lt=start + chunk_size)
+
+# Keys combine the day (proleptic ordinal) with a product or subcategory id in one int64
+_KEY_SHIFT = 2 ** 32
+
+def rebuild(chunk_size=50000):
+    # Recompute all rollups from the order history; returns the number of (daily, product, subcategory)
+    # rows written. Orders committed or canceled while this runs may be missed or counted twice, so run
+    # it when the shop is quiet (or run it again).
+    items = OrderItem.objects.exclude(order__status='canceled')
+    day = TruncDate('order__created_at')
+    parts = {'daily': [], 'product': [], 'subcategory': []}
+    for chunk in _pk_chunks(items, chunk_size):
+        rows = list(chunk.values_list(day, 'product_id', 'product__subcategory_id', 'quantity', 'price'))
+        if not rows:
+            continue
+        days, products, subcategories, quantities, prices = zip(*rows)
+        days = np.fromiter((d.toordinal() for d in days), dtype=np.int64, count=len(rows))
+        quantities = np.array(quantities, dtype=np.int64)
+        pence = quantities * np.fromiter((int(price * 100) for price in prices), dtype=np.int64, count=len(rows))
+        parts['daily'].append(_group_sum(days, quantities, pence))
+        # Deleted products (NULL) only count towards the daily totals
+        known = np.array([product is not None for product in products])
+        for name, ids in [('product', products), ('subcategory', subcategories)]:
+            ids = np.array([value or 0 for value in ids], dtype=np.int64)
+            parts[name].append(_group_sum((days * _KEY_SHIFT + ids)[known], quantities[known], pence[known]))
+
+    # Each chunk is already grouped; group the concatenated chunk results once more
+    merged = {
+        name: _group_sum(*(np.concatenate(column) for column in zip(*chunks))) if chunks else None
+        for name, chunks in parts.items()
+    }
+    order_days = []
+    for chunk in _pk_chunks(Order.objects.exclude(status='canceled'), chunk_size):
+        order_days.extend(d.toordinal() for d in chunk.values_list(TruncDate('created_at'), flat=True))
+    order_days, order_counts = _group_sum(np.array(order_days, dtype=np.int64), np.ones(len(order_days), dtype=np.int64))
+    orders_per_day = dict(zip(order_days.tolist(), order_counts.tolist()))
+
+    to_date = lambda ordinal: Date.fromordinal(int(ordinal))
+    money = lambda pence: Decimal(int(pence)) / 100
+    daily_rows = []
+    if merged['daily'] is not None:
+        for ordinal, units, pence in zip(*merged['daily']):
+            daily_rows.append(DailySales(
+                date=to_date(ordinal), orders=orders_per_day.get(int(ordinal), 0), units=int(units), revenue=money(pence),
+            ))
+    product_rows, subcategory_rows = [], []
+    for name, model, field, rows in [
+        ('product', DailyProductSales, 'product_id', product_rows),
+        ('subcategory', DailySubcategorySales, 'subcategory_id', subcategory_rows),
+    ]:
+        if merged[name] is None:
+            continue
+        for key, units, pence in zip(*merged[name]):
+            rows.append(model(**{
+                'date': to_date(key // _KEY_SHIFT), field: int(key % _KEY_SHIFT), 'units': int(units), 'revenue': money(pence),
+            }))
+
+    with transaction.atomic():
+        for model, rows in [(DailySales, daily_rows), (DailyProductSales, product_rows), (DailySubcategorySales, subcategory_rows)]:
+            model.objects.all().delete()
+            model.objects.bulk_create(rows, batch_size=1000)
+    return len(daily_rows), len(product_rows), len(subcategory_rows)
+
+def _top(model, key, named_model, window, totals):
+    # The ten best-selling keys with their current name. The name is looked up with a subquery rather
+    # than a join, so keys whose product or subcategory has since been deleted are kept (name None).
+    name = named_model.objects.filter(pk=OuterRef(key)).values('name')[:1]
+    return list(
+        model.objects.filter(**window).values(key).annotate(**totals, name=Subquery(name))
+        .order_by('-revenue_total')[:10]
+    )
+
+def dashboard(days):
+    # Everything the admin sales dashboard shows for the last `days` days, read from the rollups only
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    window = {'date__gte': start, 'date__lte': end}
+    totals = {'units_total': Sum('units'), 'revenue_total': Sum('revenue')}
+
+    by_date = {row.date: row for row in DailySales.objects.filter(**window)}
+    daily = []
+    for offset in range(days):
+        date = start + timedelta(days=offset)
+        row = by_date.get(date)
+        daily.append({
+            'date': date,
+            'orders': row.orders if row else 0,
+            'units': row.units if row else 0,
+            'revenue': row.revenue if row else Decimal('0.00'),
+        })
+    summary = DailySales.objects.filter(**window).aggregate(orders_total=Sum('orders'), **totals)
+    peak = max((day['revenue'] for day in daily), default=0) or 1
+    for day in daily:
+        day['share'] = int(day['revenue'] * 100 / peak)  # Bar width on the chart, in percent
+
+    return {
+        'days': days,
+        'start': start,
+        'end': end,
+        'daily': daily,
+        'orders_total': summary['orders_total'] or 0,
+        'units_total': summary['units_total'] or 0,
+        'revenue_total': summary['revenue_total'] or Decimal('0.00'),
+        'top_products': _top(DailyProductSales, 'product_id', Product, window, totals),
+        'top_subcategories': _top(DailySubcategorySales, 'subcategory_id', SubCategory, window, totals),
+    }
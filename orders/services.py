@@ -0,0 +1,238 @@
+# This file commits paid orders with a fixed number of statements regardless of the number of lines:
+# one locking read of the products, one read of other shoppers' stock holds, one order insert, one
+# bulk insert of the items and one conditional stock update (plus the sales rollup upserts, see
+# rollups.py). Stripe Checkout Sessions are opened here (and reused while the cart
+# is unchanged), and paid ones are turned into orders once per session however many times the
+# webhook is delivered.
+
+import hashlib
+import json
+from datetime import timedelta
+from decimal import Decimal
+import stripe
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
+from django.utils import timezone
+from catalog.models import Product
+from cart.models import Cart
+from cart.services import clear_cart
+from .models import CheckoutSession, Order, OrderItem, StockReservation
+from .notifications import queue_order_status_email, queue_order_status_emails
+from .rollups import add_orders, remove_orders
+from .reservations import RESERVATION_TTL, held_by_others, release, reserve
+
+# A cached session is only reused if the customer still has this long to pay
+REUSE_MARGIN = timedelta(minutes=5)
+
+# Orders changed (and emails queued) per transaction by transition_orders
+TRANSITION_CHUNK_SIZE = 500
+
+class OrderCommitError(Exception):
+    pass
+
+def commit_order(user, shipping_address, items, total_amount, payment_intent='', cart=None, reservation_token=None,
+                 stripe_session_id=None):
+    # Create the order for `items` ([{'product_id', 'quantity', 'price'}, ...]) and take its stock.
+    # Raises OrderCommitError (and changes nothing) if a product is gone or short of stock.
+    quantities = {}
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+
+    with transaction.atomic():
+        # Lock every product up front, always in id order, so concurrent checkouts cannot deadlock
+        products = list(
+            Product.objects.select_for_update().filter(id__in=quantities).order_by('id').only('id', 'name', 'stock')
+        )
+        if len(products) != len(quantities):
+            raise OrderCommitError('Some products in your order are no longer available')
+        # Units other checkouts are holding are not for sale (this order's own holds are)
+        held = held_by_others(quantities, reservation_token)
+        for product in products:
+            if quantities[product.id] > product.stock - held.get(product.id, 0):
+                raise OrderCommitError(f'Insufficient stock for {product.name}')
+
+        order = Order.objects.create(
+            user=user,
+            shipping_address=shipping_address,
+            total_amount=Decimal(total_amount),
+            stripe_payment_intent=payment_intent,
+            stripe_session_id=stripe_session_id,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=item['product_id'], quantity=item['quantity'], price=Decimal(item['price']))
+            for item in items
+        ])
+
+        # Decrement every product in one UPDATE; each row only matches while its stock still covers
+        # the order, so the affected row count proves no product went negative
+        enough_stock = Q()
+        for product_id, quantity in quantities.items():
+            enough_stock |= Q(id=product_id, stock__gte=quantity)
+        updated = Product.objects.filter(enough_stock).update(
+            stock=F('stock') - Case(*[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()]),
+            updated_at=timezone.now(),
+        )
+        if updated != len(quantities):
+            raise OrderCommitError('Stock changed while your order was being placed')
+
+        if cart is not None:
+            clear_cart(cart)
+        release(reservation_token)  # The stock is now taken by the order itself
+        add_orders([order.id])  # Counted in the sales rollups only if the order commits
+    return order
+
+def checkout_fingerprint(lines, shipping_address_id, cart_version):
+    # Changes whenever the amount charged or the shipping address would change. cart_version (the
+    # cart's updated_at, bumped by every cart mutation) makes any cart change start a new session.
+    data = {
+        'lines': sorted((line.product.id, line.quantity, str(line.product.price)) for line in lines),
+        'address': shipping_address_id,
+        'cart': str(cart_version),
+    }
+    return hashlib.sha256(json.dumps(data).encode()).hexdigest()
+
+def open_checkout_session(user, shipping_address, lines, total_amount, cart_version, success_url, cancel_url):
+    # Return (CheckoutSession, reused). Going back and forth between the address page and Stripe with
+    # the same cart reuses the open session and its stock holds instead of another Stripe round trip.
+    # Raises InsufficientStock if the stock cannot be held, or stripe.error.StripeError.
+    fingerprint = checkout_fingerprint(lines, shipping_address.id, cart_version)
+    now = timezone.now()
+    checkout = (
+        CheckoutSession.objects.filter(
+            user=user, fingerprint=fingerprint, status='open', expires_at__gt=now + REUSE_MARGIN
+        )
+        # The holds must still be there (another checkout attempt or an order would have released them)
+        .filter(Exists(StockReservation.objects.filter(token=OuterRef('reservation_token'), expires_at__gt=now)))
+        .order_by('-created_at')
+        .first()
+    )
+    if checkout is not None:
+        return checkout, True
+
+    # The cart or address changed: close the customer's older sessions (and their holds) so an
+    # outdated one cannot be paid, then hold the stock for this one while the customer pays
+    for stale_session_id in CheckoutSession.objects.filter(user=user, status='open').values_list('stripe_session_id', flat=True):
+        abandon_checkout(stale_session_id)
+    reservation_token = reserve(user, {line.product.id: line.quantity for line in lines})
+    try:
+        expires_at = now + RESERVATION_TTL
+        stripe_session = stripe.checkout.Session.create(
+            payment_method_types=['card'],
+            line_items=[{
+                'price_data': {
+                    'currency': 'gbp',
+                    'unit_amount': int(line.product.price * 100),  # Convert price to pence
+                    'product_data': {
+                        'name': line.product.name,
+                        'description': f'Quantity: {line.quantity}',
+                    },
+                },
+                'quantity': line.quantity,
+            } for line in lines],
+            mode='payment',
+            customer_email=user.email,  # Pre-fill customer email to session
+            success_url=success_url,
+            cancel_url=cancel_url,
+            expires_at=int(expires_at.timestamp()),  # Payment closes when the hold ends
+        )
+        # Store what is being paid for, so the webhook can create the order without the browser
+        checkout = CheckoutSession.objects.create(
+            stripe_session_id=stripe_session.id,
+            user=user,
+            shipping_address=shipping_address,
+            items=[{
+                'product_id': line.product.id,
+                'quantity': line.quantity,
+                'price': str(line.product.price)
+            } for line in lines],
+            total_amount=total_amount,
+            reservation_token=reservation_token,
+            fingerprint=fingerprint,
+            url=stripe_session.url,
+            expires_at=expires_at,
+        )
+    except Exception:
+        release(reservation_token)
+        raise
+    return checkout, False
+
+def finalize_checkout(stripe_session_id, payment_intent=''):
+    # Create the order for a paid Checkout Session and return it. Safe to call any number of times,
+    # concurrently too: the checkout row is locked and Order.stripe_session_id is unique, so the
+    # second delivery just gets the existing order. Returns None if the order could not be placed
+    # (the reason is stored on the checkout session).
+    with transaction.atomic():
+        checkout = CheckoutSession.objects.select_for_update().get(stripe_session_id=stripe_session_id)
+        order = Order.objects.filter(stripe_session_id=stripe_session_id).first()
+        if order is not None or checkout.status == 'failed':
+            return order
+        try:
+            order = commit_order(
+                user=checkout.user,
+                shipping_address=checkout.shipping_address,
+                items=checkout.items,
+                total_amount=checkout.total_amount,
+                payment_intent=payment_intent or '',
+                cart=Cart.objects.filter(user_id=checkout.user_id).first(),
+                reservation_token=checkout.reservation_token,
+                stripe_session_id=stripe_session_id,
+            )
+        except IntegrityError:
+            # Another delivery committed the order first (only possible where row locks are not supported)
+            return Order.objects.get(stripe_session_id=stripe_session_id)
+        except OrderCommitError as e:
+            checkout.status = 'failed'
+            checkout.failure_reason = str(e)[:255]
+            checkout.save(update_fields=['status', 'failure_reason', 'updated_at'])
+            release(checkout.reservation_token)
+            return None
+        checkout.status = 'completed'
+        checkout.save(update_fields=['status', 'updated_at'])
+        # The confirmation email goes out with the order, even if the customer never sees the success page
+        queue_order_status_email(order, 'pending')
+        Order.objects.filter(pk=order.pk).update(confirmation_email_sent=True)
+    return order
+
+def abandon_checkout(stripe_session_id):
+    # Close an unpaid session at Stripe and give its held stock back
+    try:
+        stripe.checkout.Session.expire(stripe_session_id)
+    except stripe.error.StripeError:
+        pass  # Already completed or expired; the webhook has the final say
+    expire_checkout(stripe_session_id)
+
+def expire_checkout(stripe_session_id):
+    # The customer never paid; give the held stock back
+    with transaction.atomic():
+        checkout = CheckoutSession.objects.select_for_update().filter(stripe_session_id=stripe_session_id, status='open').first()
+        if checkout is not None:
+            checkout.status = 'expired'
+            checkout.save(update_fields=['status', 'updated_at'])
+            release(checkout.reservation_token)
+
+def transition_orders(queryset, status, chunk_size=TRANSITION_CHUNK_SIZE, progress=None):
+    # Move the orders in queryset to `status` and queue their status emails, one chunk per short
+    # transaction (one UPDATE and one bulk INSERT each). Orders already in that status are left alone,
+    # so customers are not told twice. progress(done, total) is called after every chunk.
+    # Returns the number of orders changed.
+    ids = list(queryset.exclude(status=status).order_by('pk').values_list('pk', flat=True))
+    changed = 0
+    for start in range(0, len(ids), chunk_size):
+        with transaction.atomic():
+            # Re-check under lock, in case someone else moved an order in the meantime
+            previous = dict(
+                Order.objects.select_for_update().filter(pk__in=ids[start:start + chunk_size])
+                .exclude(status=status).values_list('pk', 'status')
+            )
+            chunk = list(previous)
+            Order.objects.filter(pk__in=chunk).update(status=status, updated_at=timezone.now())
+            queue_order_status_emails(chunk, status)
+            # Canceled orders are left out of the sales rollups
+            if status == 'canceled':
+                remove_orders(chunk)
+            else:
+                add_orders([pk for pk, old_status in previous.items() if old_status == 'canceled'])
+        changed += len(chunk)
+        if progress:
+            progress(min(start + chunk_size, len(ids)), len(ids))
+    return changed
@@ -0,0 +1,13 @@
+# This file keeps the daily sales rollups in step when orders are deleted (admin, cascades from a
+# deleted customer, cleanup scripts). Canceled orders were already taken out when they were canceled.
+
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from .models import Order
+from .rollups import remove_orders
+
+@receiver(pre_delete, sender=Order)
+def remove_deleted_order_from_rollups(sender, instance, **kwargs):
+    # pre_delete runs before the cascade removes the order's items, which the rollup change is computed from
+    if instance.status != 'canceled':
+        remove_orders([instance.pk])
@@ -1,11 +1,12 @@
 # This file provides custom template filters for order-related calculations,
 # allowing mathematical operations to be performed within Django templates.
 
+from decimal import Decimal
 from django import template
 
 register = template.Library()
 
 @register.filter
 def multiply(value, arg):
-    # Converts value to float to ensure decimal precision in order calculations
-    return float(value) * arg 
\ No newline at end of file
+    # Multiplies in Decimal so money amounts stay exact (19.99 x 3 is 59.97, not 59.970000000000006)
+    return Decimal(str(value)) * Decimal(str(arg))
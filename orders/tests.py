@@ -1,3 +1,338 @@
-from django.test import TestCase
+# This file contains tests for stock reservations, checkout and order pages.
 
-# Create your tests here.
+from decimal import Decimal
+from smtplib import SMTPRecipientsRefused
+from unittest import mock
+import stripe
+from django.contrib.auth.signals import user_logged_in
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import Address, User
+from accounts.signals import log_successful_login
+from cart import services as cart_services
+from cart.models import CartItem
+from catalog.models import MainCategory, Product, SubCategory
+from .fake_stripe import FakeStripeServer, signed_event
+from .models import CheckoutSession, DailyProductSales, DailySales, EmailTask, Order, OrderItem, StockReservation
+from .notifications import CLAIM_LEASE, MAX_ATTEMPTS, RETRY_DELAY, claim_email_tasks, process_email_tasks, queue_order_status_email
+from .reservations import InsufficientStock, release, reserve
+from .rollups import dashboard
+from .services import OrderCommitError, commit_order, transition_orders
+
+WEBHOOK_SECRET = 'whsec_test'
+
+class OrderTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = MainCategory.objects.create(name='Furniture', slug='furniture', image='categories/furniture.jpg')
+        subcategory = SubCategory.objects.create(main_category=category, name='Chairs', slug='chairs')
+        cls.product = Product.objects.create(
+            name='Oak chair', slug='oak-chair', subcategory=subcategory, description='A solid oak chair.',
+            price=Decimal('25.00'), stock=1, image='products/oak-chair.jpg',
+        )
+        cls.user = cls.create_customer('shopper')
+
+    @classmethod
+    def create_customer(cls, username):
+        user = User.objects.create_user(username, f'{username}@example.com', 'password')
+        user.address = Address.objects.create(
+            user=user, full_name=username.title(), street_address1='1 High St', city='London',
+            postal_code='E1 1AA', country='United Kingdom',
+        )
+        return user
+
+    def login(self, user):
+        # force_login sends a bare request with no client IP for the login audit log to record
+        user_logged_in.disconnect(log_successful_login)
+        try:
+            self.client.force_login(user)
+        finally:
+            user_logged_in.connect(log_successful_login)
+
+    def items(self, quantity=1):
+        return [{'product_id': self.product.id, 'quantity': quantity, 'price': str(self.product.price)}]
+
+class ReservationTests(OrderTestCase):
+    def test_last_unit_is_held_for_one_shopper(self):
+        other = self.create_customer('other')
+        token = reserve(self.user, {self.product.id: 1})
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve(other, {self.product.id: 1})
+        self.assertEqual(raised.exception.products[0].available, 0)
+        self.assertEqual(StockReservation.objects.get().token, token)
+
+    def test_racing_shopper_backs_off_without_a_product_lock(self):
+        # Another shopper's hold on the last unit commits after our first check but before our second
+        other = self.create_customer('other')
+        bulk_create = StockReservation.objects.bulk_create
+
+        def insert_with_rival(holds):
+            bulk_create([StockReservation(
+                product=self.product, user=other, quantity=1, token='rival', expires_at=holds[0].expires_at,
+            )])
+            return bulk_create(holds)
+
+        with mock.patch.object(StockReservation.objects, 'bulk_create', side_effect=insert_with_rival):
+            with self.assertRaises(InsufficientStock) as raised:
+                reserve(self.user, {self.product.id: 1})
+        self.assertEqual(raised.exception.products[0].available, 0)
+        self.assertEqual(list(StockReservation.objects.values_list('token', flat=True)), ['rival'])
+
+    def test_orders_cannot_bypass_other_shoppers_holds(self):
+        other = self.create_customer('other')
+        token = reserve(self.user, {self.product.id: 1})
+        with self.assertRaises(OrderCommitError):
+            commit_order(other, other.address, self.items(), '25.00')
+
+        # The holder's own order goes through and takes its holds with it
+        commit_order(self.user, self.user.address, self.items(), '25.00', reservation_token=token)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_release_only_drops_its_own_checkout(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=2)
+        first = reserve(self.user, {self.product.id: 1})
+        second = reserve(self.user, {self.product.id: 1})
+        release(first)
+        self.assertEqual(list(StockReservation.objects.values_list('token', flat=True)), [second])
+
+class CommitOrderTests(OrderTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.table = Product.objects.create(
+            name='Oak table', slug='oak-table', subcategory=cls.product.subcategory, description='A solid oak table.',
+            price=Decimal('120.00'), stock=3, image='products/oak-table.jpg',
+        )
+
+    def order_items(self, chairs, tables):
+        # Chairs over two lines, as an order built from a cart and a reorder could be
+        return self.items(chairs - 1) + self.items(1) + [
+            {'product_id': self.table.id, 'quantity': tables, 'price': str(self.table.price)},
+        ]
+
+    def test_every_product_is_decremented_in_one_update(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=5)
+        with CaptureQueriesContext(connection) as queries:
+            order = commit_order(self.user, self.user.address, self.order_items(3, 2), '315.00')
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "catalog_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(dict(Product.objects.values_list('id', 'stock')), {self.product.id: 2, self.table.id: 1})
+        self.assertEqual(order.items.count(), 3)
+
+    def test_one_short_line_changes_nothing(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=5)
+        with self.assertRaisesMessage(OrderCommitError, 'Oak table'):
+            commit_order(self.user, self.user.address, self.order_items(3, 4), '555.00')
+        self.assertEqual(dict(Product.objects.values_list('id', 'stock')), {self.product.id: 5, self.table.id: 3})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeCheckoutTests(OrderTestCase):
+    # The whole payment flow against the offline fake Stripe server
+    def setUp(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=5)
+        self.server = FakeStripeServer(('127.0.0.1', 0), webhook_secret=WEBHOOK_SECRET)
+        for name, value in [('api_base', self.server.start()), ('api_key', 'sk_test_fake')]:
+            patcher = mock.patch.object(stripe, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.login(self.user)
+        cart_services.add_item(cart_services.get_cart(self.user), self.product.id, 2)
+
+    def post_event(self, event_type, session, secret=WEBHOOK_SECRET):
+        payload, signature = signed_event(event_type, session, secret)
+        return self.client.post(
+            reverse('orders:stripe_webhook'), payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def test_paid_session_becomes_exactly_one_order(self):
+        response = self.client.post(reverse('orders:checkout'), {'address_id': self.user.address.id})
+        checkout = CheckoutSession.objects.get()
+        self.assertRedirects(response, checkout.url, fetch_redirect_response=False)
+        self.assertEqual(StockReservation.objects.get().quantity, 2)
+
+        session = self.server.pay(checkout.stripe_session_id)
+        for _ in range(2):  # Stripe may deliver the same event more than once
+            self.assertEqual(self.post_event('checkout.session.completed', session).status_code, 200)
+
+        order = Order.objects.get()
+        self.assertEqual((order.user, order.stripe_session_id), (self.user, checkout.stripe_session_id))
+        self.assertEqual(list(order.items.values_list('product_id', 'quantity')), [(self.product.id, 2)])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(EmailTask.objects.filter(order=order, status='pending').count(), 1)
+
+        # The success page finds the order the webhook created
+        response = self.client.get(reverse('orders:create_order'), {'session_id': checkout.stripe_session_id})
+        self.assertRedirects(response, reverse('orders:confirmation', args=[order.id]))
+
+    def test_returning_to_checkout_reuses_the_open_session(self):
+        first = self.client.post(reverse('orders:checkout'), {'address_id': self.user.address.id})
+        second = self.client.post(reverse('orders:checkout'), {'address_id': self.user.address.id})
+        checkout = CheckoutSession.objects.get()
+        self.assertRedirects(second, checkout.url, fetch_redirect_response=False)
+        self.assertEqual(first['Location'], second['Location'])
+        self.assertEqual(len(self.server.sessions), 1)
+        self.assertEqual(StockReservation.objects.get().token, checkout.reservation_token)
+
+        # A changed cart gets a new session; the old one is closed at Stripe and its holds released
+        cart_services.add_item(cart_services.get_cart(self.user), self.product.id, 1)
+        self.client.post(reverse('orders:checkout'), {'address_id': self.user.address.id})
+        checkout.refresh_from_db()
+        self.assertEqual(checkout.status, 'expired')
+        self.assertEqual(self.server.sessions[checkout.stripe_session_id]['status'], 'expired')
+        current = CheckoutSession.objects.get(status='open')
+        self.assertEqual(list(StockReservation.objects.values_list('token', 'quantity')), [(current.reservation_token, 3)])
+
+    def test_unsigned_events_are_rejected(self):
+        self.client.post(reverse('orders:checkout'), {'address_id': self.user.address.id})
+        session = self.server.pay(CheckoutSession.objects.get().stripe_session_id)
+        self.assertEqual(self.post_event('checkout.session.completed', session, secret='whsec_wrong').status_code, 400)
+        with override_settings(STRIPE_WEBHOOK_SECRET=None), self.assertLogs('orders.views', 'ERROR'):
+            self.assertEqual(self.post_event('checkout.session.completed', session).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+class EmailOutboxTests(OrderTestCase):
+    def setUp(self):
+        order = commit_order(self.user, self.user.address, self.items(), '25.00')
+        queue_order_status_email(order, 'pending')
+        self.task = EmailTask.objects.get()
+
+    def test_claimed_tasks_are_leased_to_one_worker(self):
+        before = timezone.now()
+        [task] = claim_email_tasks(10)
+        self.assertEqual((task.id, task.attempts), (self.task.id, 1))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.attempts, 1)
+        self.assertGreaterEqual(self.task.run_at, before + CLAIM_LEASE)
+        self.assertEqual(claim_email_tasks(10), [])
+
+    def test_sent_tasks_are_done(self):
+        self.assertEqual(process_email_tasks(), (1, 1, 0))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.state, 'sent')
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+
+    def test_failed_sends_back_off_then_give_up(self):
+        refused = SMTPRecipientsRefused({self.user.email: (550, b'No such user')})
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=refused):
+            before = timezone.now()
+            self.assertEqual(process_email_tasks(), (1, 0, 0))
+            self.task.refresh_from_db()
+            self.assertEqual((self.task.state, self.task.attempts), ('queued', 1))
+            self.assertIn('No such user', self.task.last_error)
+            self.assertGreaterEqual(self.task.run_at, before + RETRY_DELAY)
+            self.assertLess(self.task.run_at, before + 2 * RETRY_DELAY)
+            self.assertEqual(process_email_tasks(), (0, 0, 0))  # Not due yet
+
+            # The second retry waits twice as long
+            EmailTask.objects.update(run_at=timezone.now())
+            before = timezone.now()
+            process_email_tasks()
+            self.task.refresh_from_db()
+            self.assertGreaterEqual(self.task.run_at, before + 2 * RETRY_DELAY)
+
+            # The last attempt fails the task for good
+            EmailTask.objects.update(run_at=timezone.now(), attempts=MAX_ATTEMPTS - 1)
+            self.assertEqual(process_email_tasks(), (1, 0, 1))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.state, 'failed')
+        self.assertEqual(mail.outbox, [])
+
+class OrderHistoryQueryTests(OrderTestCase):
+    # The order pages run a fixed number of queries however many orders and items the customer has
+    # (session, user and cart badge included)
+    LIST_QUERIES = 8
+    DETAIL_QUERIES = 9
+    DASHBOARD_QUERIES = 8
+
+    def create_orders(self, count, items):
+        orders = Order.objects.bulk_create([
+            Order(user=self.user, shipping_address=self.user.address, total_amount=Decimal('25.00')) for _ in range(count)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.product, quantity=1, price=self.product.price)
+            for order in orders for _ in range(items)
+        ])
+        return orders
+
+    def test_order_list(self):
+        self.login(self.user)
+        for count in [2, 25]:
+            self.create_orders(count, items=3)
+            with self.assertNumQueries(self.LIST_QUERIES):
+                response = self.client.get(reverse('orders:order_list'))
+            self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            self.client.get(reverse('orders:order_list'), {'page': 2})
+
+    def test_order_detail(self):
+        self.login(self.user)
+        for items in [1, 10]:
+            order = self.create_orders(1, items)[0]
+            with self.assertNumQueries(self.DETAIL_QUERIES):
+                response = self.client.get(reverse('orders:detail', args=[order.id]))
+            self.assertContains(response, 'Oak chair')
+
+    def test_account_dashboard(self):
+        # Shows the latest orders with their item counts
+        self.login(self.user)
+        for count in [2, 25]:
+            self.create_orders(count, items=3)
+            with self.assertNumQueries(self.DASHBOARD_QUERIES):
+                response = self.client.get(reverse('accounts:dashboard'))
+            self.assertEqual(response.status_code, 200)
+
+class CancelOrderTests(OrderTestCase):
+    def test_racing_cancels_restore_the_stock_once(self):
+        order = commit_order(self.user, self.user.address, self.items(), '25.00')
+        self.login(self.user)
+        url = reverse('orders:cancel_order', args=[order.id])
+        self.client.post(url)
+
+        # A second request that loaded the order while it was still pending, as a double submit would
+        with mock.patch('orders.views.get_object_or_404', return_value=order):
+            response = self.client.post(url)
+        self.assertRedirects(response, reverse('orders:detail', args=[order.id]), fetch_redirect_response=False)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.assertEqual(Order.objects.get().status, 'canceled')
+        self.assertEqual(EmailTask.objects.filter(order=order, status='canceled').count(), 1)
+        self.assertFalse(DailySales.objects.exists())  # Counted once and taken out once
+
+class SalesRollupTests(OrderTestCase):
+    def test_deleted_orders_leave_the_rollups(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=4)
+        kept = commit_order(self.user, self.user.address, self.items(), '25.00')
+        deleted = commit_order(self.user, self.user.address, self.items(2), '50.00')
+        canceled = commit_order(self.user, self.user.address, self.items(), '25.00')
+        transition_orders(Order.objects.filter(pk=canceled.pk), 'canceled')
+
+        Order.objects.filter(pk__in=[deleted.pk, canceled.pk]).delete()
+        self.assertEqual(list(DailySales.objects.values_list('orders', 'units', 'revenue')), [(1, 1, Decimal('25.00'))])
+        self.assertEqual(list(DailyProductSales.objects.values_list('product_id', 'units')), [(self.product.id, 1)])
+
+        # The last order leaves no empty rows behind
+        kept.delete()
+        self.assertFalse(DailySales.objects.exists())
+        self.assertFalse(DailyProductSales.objects.exists())
+
+    def test_dashboard_keeps_the_sales_of_deleted_products(self):
+        commit_order(self.user, self.user.address, self.items(), '25.00')
+        self.assertEqual([row['name'] for row in dashboard(7)['top_products']], ['Oak chair'])
+        DailyProductSales.objects.update(product_id=self.product.id + 1000)  # As if the product had been deleted
+        top = dashboard(7)['top_products']
+        self.assertEqual([(row['name'], row['units_total']) for row in top], [(None, 1)])
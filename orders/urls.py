@@ -5,7 +5,9 @@ app_name = 'orders'
 
 urlpatterns = [
     path('checkout/', views.checkout, name='checkout'),
+    path('cancel-checkout/', views.cancel_checkout, name='cancel_checkout'),
     path('create-order/', views.create_order, name='create_order'),
+    path('stripe-webhook/', views.stripe_webhook, name='stripe_webhook'),
     path('confirmation/<int:order_id>/', views.order_confirmation, name='confirmation'),
     path('list/', views.order_list, name='order_list'),
     path('detail/<int:order_id>/', views.order_detail, name='detail'),
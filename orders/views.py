@@ -1,34 +1,49 @@
 # This file contains the views for processing orders, including checkout, order creation, and order management.
 
+import logging
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.conf import settings
-from django.http import JsonResponse
+from django.core.paginator import Paginator
+from django.http import HttpResponse, JsonResponse
 from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.db import transaction
-from .models import Order, OrderItem
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from .models import CheckoutSession, Order
 from cart.models import Cart
 from catalog.models import Product
+from cart.summary import get_cart_summary
 from accounts.models import Address, User
 import stripe
-from .notifications import send_order_status_email
-import decimal
+from .notifications import queue_order_status_email
+from .reservations import RESERVATION_TTL, InsufficientStock
+from .rollups import remove_orders
+from .services import abandon_checkout, expire_checkout, finalize_checkout, open_checkout_session
+
+ORDERS_PER_PAGE = 10
+
+logger = logging.getLogger(__name__)
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
+if settings.STRIPE_API_BASE:
+    stripe.api_base = settings.STRIPE_API_BASE  # e.g. the local fake Stripe server (run_fake_stripe)
 
 @login_required
 def checkout(request):
-    cart = get_object_or_404(Cart, user=request.user)
-    cart_items = cart.items.select_related('product').all()
-    
-    if not cart_items.exists():
+    # Lines and totals come from one annotated query, shared with the cart badge
+    cart_summary = get_cart_summary(request)
+    cart_items = cart_summary.lines
+
+    if not cart_items:
         messages.error(request, 'Your cart is empty.')
         return redirect('cart:cart_detail')
 
-    # Set session expiry to 30 minutes (1800 seconds)
-    request.session.set_expiry(1800)
+    # Set session expiry to 30 minutes (1800 seconds), the same as the stock reservation
+    request.session.set_expiry(int(RESERVATION_TTL.total_seconds()))
     
     # Mark the session as modified
     request.session.modified = True
@@ -43,7 +58,7 @@ def checkout(request):
     if request.method != 'POST':
         return render(request, 'orders/select_address.html', {
             'addresses': addresses,
-            'cart': cart,
+            'cart_summary': cart_summary,
             'cart_items': cart_items
         })
 
@@ -53,7 +68,7 @@ def checkout(request):
         messages.error(request, 'Please select a shipping address.')
         return render(request, 'orders/select_address.html', {
             'addresses': addresses,
-            'cart': cart,
+            'cart_summary': cart_summary,
             'cart_items': cart_items
         })
 
@@ -63,140 +78,126 @@ def checkout(request):
         messages.error(request, 'Invalid address selected.')
         return render(request, 'orders/select_address.html', {
             'addresses': addresses,
-            'cart': cart,
+            'cart_summary': cart_summary,
             'cart_items': cart_items
         })
 
-    # Validate stock levels before proceeding to payment
-    for item in cart_items:
-        if item.quantity > item.product.stock:
-            messages.error(request, f'Sorry, only {item.product.stock} units of {item.product.name} are available.')
-            return redirect('cart:cart_detail')
-
+    # Reuses the open Stripe session when nothing changed since the last attempt (see services.open_checkout_session)
+    cart_version = Cart.objects.filter(user=request.user).values_list('updated_at', flat=True).first()
     try:
-        # Prepare line items for Stripe Checkout Session
-        line_items = []
-        for item in cart_items:
-            line_items.append({
-                'price_data': {
-                    'currency': 'gbp',
-                    'unit_amount': int(item.product.price * 100),  # Convert price to pence
-                    'product_data': {
-                        'name': item.product.name,
-                        'description': f'Quantity: {item.quantity}',
-                    },
-                },
-                'quantity': item.quantity,
-            })
-
-        # Create Stripe Checkout Session
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=line_items,
-            mode='payment',
-            customer_email=request.user.email,  # Pre-fill customer email to session
-            success_url=request.build_absolute_uri(
-                reverse('orders:create_order') + '?session_id={CHECKOUT_SESSION_ID}'
-            ),
-            cancel_url=request.build_absolute_uri(reverse('cart:cart_detail')),
+        checkout_session, reused = open_checkout_session(
+            request.user,
+            selected_address,
+            cart_items,
+            cart_summary.total_price,
+            cart_version,
+            # The placeholder is appended after build_absolute_uri, which would percent-encode its braces
+            success_url=request.build_absolute_uri(reverse('orders:create_order')) + '?session_id={CHECKOUT_SESSION_ID}',
+            cancel_url=request.build_absolute_uri(reverse('orders:cancel_checkout')),
         )
-
-        # Store cart and address data in session AFTER creating checkout session
-        request.session['pending_order'] = {
-            'items': [{
-                'product_id': item.product.id,
-                'quantity': item.quantity,
-                'price': str(item.product.price)
-            } for item in cart_items],
-            'total_amount': str(cart.get_total_price()),
-            'shipping_address_id': selected_address.id,
-            'stripe_session_id': checkout_session.id
-        }
-        
-        return redirect(checkout_session.url)
-
+    except InsufficientStock as e:
+        for product in e.products:
+            messages.error(request, f'Sorry, only {product.available} units of {product.name} are available.')
+        return redirect('cart:cart_detail')
     except Exception as e:
         messages.error(request, f'Error creating checkout session: {str(e)}')
         return redirect('cart:cart_detail')
 
+    request.session['pending_order'] = {
+        'stripe_session_id': checkout_session.stripe_session_id,
+        'reservation_token': checkout_session.reservation_token,
+    }
+    return redirect(checkout_session.url)
+
+@login_required
+def cancel_checkout(request):
+    # Stripe sends the customer here when they abandon payment; close the session and give the held stock back
+    pending_order = request.session.pop('pending_order', None)
+    if pending_order:
+        abandon_checkout(pending_order['stripe_session_id'])
+    return redirect('cart:cart_detail')
+
 @login_required
 def create_order(request):
-    """Create order after successful payment"""
-    pending_order = request.session.get('pending_order')
-    if not pending_order:
+    """Show the order created by the payment webhook, or a holding page until it exists"""
+    pending_order = request.session.get('pending_order') or {}
+    session_id = request.GET.get('session_id') or pending_order.get('stripe_session_id')
+    checkout = CheckoutSession.objects.filter(stripe_session_id=session_id, user=request.user).first() if session_id else None
+    if checkout is None:
         messages.error(request, 'No pending order found.')
         return redirect('cart:cart_detail')
 
-    # Retrieve the Stripe session and payment intent for verification
-    try:
-        stripe_session = stripe.checkout.Session.retrieve(pending_order['stripe_session_id'])
-        payment_intent = stripe_session.payment_intent
-    except stripe.error.StripeError as e:
-        messages.error(request, f'Payment verification failed: {str(e)}')
+    # Reloading this page only reads; the order is created once, by stripe_webhook
+    order = Order.objects.filter(stripe_session_id=session_id, user=request.user).only('id').first()
+    if order is not None:
+        request.session.pop('pending_order', None)
+        return redirect('orders:confirmation', order_id=order.id)
+
+    if checkout.status in ('failed', 'expired'):
+        request.session.pop('pending_order', None)
+        messages.error(request, f'Error creating order: {checkout.failure_reason or "the payment session expired"}')
         return redirect('cart:cart_detail')
 
-    cart = get_object_or_404(Cart, user=request.user)
-    shipping_address = get_object_or_404(Address, id=pending_order['shipping_address_id'], user=request.user)
+    # Payment is done but Stripe has not told us yet; the page refreshes itself
+    return render(request, 'orders/processing.html', {'checkout': checkout})
 
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    # Stripe calls this for every Checkout Session event; only signed events are trusted.
+    # Deliveries can repeat, so every handler is idempotent.
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        logger.error('Rejected a Stripe webhook: STRIPE_WEBHOOK_SECRET is not set')
+        return HttpResponse(status=400)
     try:
-        with transaction.atomic():
-            # Create order with shipping address and payment intent
-            order = Order.objects.create(
-                user=request.user,
-                shipping_address=shipping_address,
-                total_amount=decimal.Decimal(pending_order['total_amount']),
-                stripe_payment_intent=payment_intent
-            )
-            
-            # Create order items and update stock accordingly
-            for item_data in pending_order['items']:
-                product = get_object_or_404(Product, id=item_data['product_id'])
-                quantity = item_data['quantity']
-                
-                if quantity > product.stock:
-                    raise ValueError(f'Insufficient stock for {product.name}')
-                
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                    price=decimal.Decimal(item_data['price'])
-                )
-                
-                product.stock -= quantity  # Deduct quantity from stock
-                product.save()
-
-            cart.items.all().delete()  # Clear the cart after order creation
-            del request.session['pending_order']  # Remove pending order from session
-
-            return redirect('orders:confirmation', order_id=order.id)
-
-    except Exception as e:
-        messages.error(request, f'Error creating order: {str(e)}')
-        return redirect('cart:cart_detail')
+        event = stripe.Webhook.construct_event(
+            request.body, request.headers.get('Stripe-Signature'), settings.STRIPE_WEBHOOK_SECRET
+        )
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return HttpResponse(status=400)
+
+    stripe_session = event['data']['object']
+    if event['type'] in ('checkout.session.completed', 'checkout.session.async_payment_succeeded'):
+        if stripe_session['payment_status'] == 'paid':
+            try:
+                finalize_checkout(stripe_session['id'], stripe_session['payment_intent'])
+            except CheckoutSession.DoesNotExist:
+                pass  # Not a session created by this shop
+    elif event['type'] == 'checkout.session.expired':
+        expire_checkout(stripe_session['id'])
+    return HttpResponse(status=200)
 
 @login_required
 def order_confirmation(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
     
-    # Send confirmation email only if it hasn't been sent yet
+    # Queue the confirmation email once; orders placed by the payment webhook already have it queued.
+    # The conditional update makes concurrent reloads queue it only once.
     if not order.confirmation_email_sent:
-        order.status = 'pending'
-        send_order_status_email(order, 'pending')
+        if Order.objects.filter(pk=order.pk, confirmation_email_sent=False).update(confirmation_email_sent=True):
+            queue_order_status_email(order, 'pending')
         order.confirmation_email_sent = True
-        order.save()
     
     return render(request, 'orders/confirmation.html', {'order': order})
 
 @login_required
 def order_list(request):
-    # Retrieve and display the user's orders
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'orders/list.html', {'orders': orders})
+    # One page of the user's orders (a count query plus one annotated page query)
+    paginator = Paginator(Order.objects.history(request.user), ORDERS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    return render(request, 'orders/list.html', {
+        'orders': page_obj,
+        'page_obj': page_obj,
+        'page_range': paginator.get_elided_page_range(page_obj.number, on_each_side=2, on_ends=1),
+    })
 
 @login_required
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    # Address, items and their products are loaded up front (three queries however many items)
+    order = get_object_or_404(
+        Order.objects.select_related('shipping_address').prefetch_related('items__product'),
+        id=order_id, user=request.user,
+    )
     # Get the referrer from query parameter or default to order list
     came_from = request.GET.get('from', 'orders')
     return render(request, 'orders/detail.html', {
@@ -208,21 +209,28 @@ def order_detail(request, order_id):
 @require_POST
 def cancel_order(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
-    if order.can_cancel():
-        with transaction.atomic():
-            # Restore stock levels for canceled order items
-            for item in order.items.all():
-                if item.product:  # Check if product still exists
-                    item.product.stock += item.quantity
-                    item.product.save()
-            
-            order.status = 'canceled'  # Update order status
-            order.save()
-            
-            # Send cancellation email
-            send_order_status_email(order, 'canceled')
-            
-            messages.success(request, 'Order has been canceled successfully.')
+    with transaction.atomic():
+        # Only the request whose conditional UPDATE moves the order out of pending cancels it, so a
+        # double submit or a concurrent status change cannot restore the stock twice
+        canceled = Order.objects.filter(id=order.id, user=request.user, status='pending').update(
+            status='canceled', updated_at=timezone.now(),
+        )
+        if canceled:
+            # Restore stock levels for canceled order items (products that still exist) in one UPDATE
+            quantities = {}
+            for product_id, quantity in order.items.filter(product__isnull=False).values_list('product_id', 'quantity'):
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            if quantities:
+                Product.objects.filter(id__in=quantities).update(
+                    stock=F('stock') + Case(*[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()]),
+                    updated_at=timezone.now(),
+                )
+            remove_orders([order.id])  # No longer counted in the sales rollups
+
+            # Queue the cancellation email (sent by the process_email_queue worker)
+            queue_order_status_email(order, 'canceled')
+    if canceled:
+        messages.success(request, 'Order has been canceled successfully.')
     else:
         messages.error(request, 'This order cannot be canceled.')
     return redirect('orders:detail', order_id=order.id)
@@ -2,13 +2,16 @@
 # It can be used to handle the home page, about page, contact page, etc.
 
 from django.shortcuts import render
-from catalog.models import Product, MainCategory
+from catalog.models import Product, LIST_DEFERRED_FIELDS
+from catalog.taxonomy import get_category_tree
+from catalog.cards import render_product_cards
 
 def home(request):
-    featured_products = Product.objects.filter(featured=True)[:6]  # Show up to 6 featured products
-    categories = MainCategory.objects.all()
+    featured_products = Product.objects.filter(featured=True).defer(*LIST_DEFERRED_FIELDS)[:6]  # Show up to 6 featured products
+    categories = get_category_tree()
     # Render the homepage with featured products and categories
     return render(request, 'pages/home.html', {
         'featured_products': featured_products,
+        'featured_product_cards': render_product_cards(featured_products, image_class='featured-product-image'),
         'categories': categories,
     })
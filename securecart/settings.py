@@ -129,6 +129,32 @@ else:
     }
 
 
+# Cache
+# Shared cache for catalog data (category tree, etc.). Uses Redis when REDIS_URL is set,
+# otherwise a per-process local memory cache (fine for development)
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+    # Sessions are read from Redis. Anonymous sessions (and their session carts) are stored only there;
+    # logged-in sessions also keep a database copy so a Redis eviction or restart logs no one out.
+    SESSION_ENGINE = 'accounts.sessions'
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Bearer token that lets a metrics scraper read the cache counters without a staff session
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -180,6 +206,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Stripe settings
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')  # Signing secret of the checkout webhook endpoint
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE')  # Set to the run_fake_stripe URL to work offline
 
 # Media files configuration
 MEDIA_URL = '/media/'
@@ -191,11 +219,12 @@ LOGIN_URL = 'accounts:login'
 LOGOUT_REDIRECT_URL = 'home'
 
 # Add these settings for email configuration
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend' 
-# if wanted for development, can change smtp to console which will print emails to console instead
-EMAIL_HOST = 'smtp.gmail.com' 
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+# Emails are sent by the process_email_queue worker. For development set EMAIL_BACKEND to
+# django.core.mail.backends.console.EmailBackend, or point EMAIL_HOST/EMAIL_PORT at a local SMTP stand-in
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = 'SecureCart Team <noreply@securecart.com>'
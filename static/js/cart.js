@@ -1,37 +1,70 @@
-
 // gets CSRF token from the meta tag
 function getCSRFToken() {
     return document.querySelector('meta[name="csrf-token"]')?.content;
 }
 
 document.addEventListener('DOMContentLoaded', function() {
-    // Update the quantity of items in the cart
-    document.querySelectorAll('.update-quantity-form input').forEach(input => {
-        input.addEventListener('change', function() {
-            const form = this.closest('form');
-            const itemId = form.dataset.itemId;
-            const quantity = this.value;
-            
-            fetch(`/cart/update/${itemId}/`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                    'X-CSRFToken': getCSRFToken()
-                },
-                body: `quantity=${quantity}`
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.status === 'success') {
-                    location.reload();
-                } else if (data.status === 'error') {
-                    alert(data.message);
-                    // Reset the input to the available stock amount
-                    if (data.available_stock) {
-                        this.value = data.available_stock;
-                    }
+    const table = document.getElementById('cart-table');
+    if (!table) {
+        return;
+    }
+
+    // Quantity changes are collected and sent together once the user stops editing
+    const pending = new Map();
+    let timer = null;
+
+    function sendChanges() {
+        const changes = Array.from(pending, ([itemId, quantity]) => ({item_id: itemId, quantity: quantity}));
+        pending.clear();
+
+        fetch(table.dataset.updateUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCSRFToken()
+            },
+            body: JSON.stringify({changes: changes})
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.lines) {
+                alert(data.message);
+                return;
+            }
+            if (data.lines.length === 0) {
+                location.reload();  // Show the empty cart page
+                return;
+            }
+            // Refresh every line from the server's view of the cart; lines that are gone were removed
+            const lines = new Map(data.lines.map(line => [String(line.item_id), line]));
+            table.querySelectorAll('tbody tr').forEach(row => {
+                const line = lines.get(row.dataset.itemId);
+                if (!line) {
+                    row.remove();
+                    return;
                 }
+                const input = row.querySelector('.quantity-input');
+                input.value = line.quantity;
+                input.max = line.available_stock;
+                row.querySelector('.line-total').textContent = `£${line.line_total}`;
             });
+            document.getElementById('cart-total').textContent = `£${data.summary.total_price}`;
+            if (data.rejected.length) {
+                alert(data.rejected.map(item => item.message).join('\n'));
+            }
+        });
+    }
+
+    // Update the quantity of items in the cart
+    table.querySelectorAll('.update-quantity-form').forEach(form => {
+        form.addEventListener('submit', event => event.preventDefault());
+        form.querySelector('input').addEventListener('input', function() {
+            if (this.value === '') {
+                return;
+            }
+            pending.set(Number(form.dataset.itemId), Number(this.value));
+            clearTimeout(timer);
+            timer = setTimeout(sendChanges, 500);
         });
     });
-}); 
\ No newline at end of file
+});
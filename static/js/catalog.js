@@ -5,4 +5,30 @@ document.addEventListener('DOMContentLoaded', function () {
             this.form.submit();
         });
     });
+
+    // Search-as-you-type: fill the datalist from the suggest endpoint shortly after typing stops
+    document.querySelectorAll('input[data-suggest-url]').forEach(input => {
+        const list = document.getElementById(input.getAttribute('list'));
+        let timer = null;
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            const query = this.value.trim();
+            if (!query) {
+                list.replaceChildren();
+                return;
+            }
+            timer = setTimeout(() => {
+                fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`)
+                    .then(response => response.json())
+                    .then(data => {
+                        list.replaceChildren(...data.categories.concat(data.products).map(item => {
+                            const option = document.createElement('option');
+                            option.value = item.label;
+                            return option;
+                        }));
+                    })
+                    .catch(() => list.replaceChildren());
+            }, 150);
+        });
+    });
 }); 
\ No newline at end of file